@@ -0,0 +1,559 @@
+"""Benchmark suite for the API and storage layer.
+
+Seeds a SQLite database with synthetic users, games and moves, then drives
+the real Flask app with concurrent clients, in-process through the test
+client and over HTTP, and reports throughput, p50/p95/p99 latency and SQL
+statements per request for each workload:
+
+    save_move      single-move POST bursts into a fresh game per client
+    list_games     GET /api/games
+    game_details   GET /api/games/<id> of a game with --detail-moves moves
+    stats          GET /api/stats
+    analytics      GET /api/analytics, materialized move timing analytics
+    clock_press    POST /api/games/<id>/clock/press on a running server clock
+    auth           alternating registration and login
+
+The seeded database is kept next to a .seed.json description and reused by
+later runs with the same seed options, so results of different revisions of
+the code can be compared:
+
+    python benchmarks/api.py --moves-per-game 250 --json before.json
+    python benchmarks/api.py --moves-per-game 250 --json after.json --compare before.json
+
+--workers 1 2 4 repeats the HTTP runs with that many server processes on
+consecutive ports sharing a state server (STATE_BACKEND=socket), clients
+spread across them as a load balancer would, and prints the throughput of
+each count relative to one worker.
+
+The committed src/database/app.db is never touched; pass --database to pick
+the file (default: a path in the system temp directory).
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from serving import SERVERS, percentile, wait_for_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'benchmark'
+WORKLOADS = ('save_move', 'list_games', 'game_details', 'stats', 'analytics', 'clock_press', 'auth')
+SEED_OPTIONS = ('users', 'games_per_user', 'moves_per_game', 'detail_games', 'detail_moves', 'seed')
+SEED_VERSION = 2  # Bumped when seeded files change shape, so older ones are rebuilt
+
+
+def seed_database(app, options):
+    # Deterministic for a given set of SEED_OPTIONS
+    from werkzeug.security import generate_password_hash
+    from src.models.user import db, User, Game
+    from src.models.move_history import MoveHistory
+    from src.services.analytics import rebuild_user_analytics
+
+    rng = random.Random(options['seed'])
+    password_hash = generate_password_hash(PASSWORD)
+    started = time.perf_counter()
+    epoch = datetime(2020, 1, 1)
+    total_moves = 0
+    moves = []
+
+    def flush_moves():
+        if moves:
+            db.session.execute(MoveHistory.__table__.insert(), moves)
+            moves.clear()
+
+    with app.app_context():
+        db.session.execute(User.__table__.insert(), [
+            {'username': f'bench{i}', 'email': f'bench{i}@example.com',
+             'password_hash': password_hash, 'created_at': epoch}
+            for i in range(options['users'])
+        ])
+        users = dict(db.session.query(User.username, User.id).filter(User.username.like('bench%')).all())
+
+        for index in range(options['users']):
+            user_id = users[f'bench{index}']
+            games = []
+            game_count = options['games_per_user'] + options['detail_games']
+            for number in range(game_count):
+                is_detail = number >= options['games_per_user']
+                created_at = epoch + timedelta(minutes=index * game_count + number)
+                winner = rng.choice(('black', 'white', None))
+                games.append({
+                    'id': str(uuid.UUID(int=rng.getrandbits(128), version=4)),
+                    'user_id': user_id,
+                    'title': f'Detail game {number}' if is_detail else f'Game {number}',
+                    'comment': None,
+                    'main_time': 600,
+                    'byoyomi_time': 30,
+                    'byoyomi_periods': 3,
+                    'status': 'completed' if winner else rng.choice(('active', 'saved')),
+                    'winner': winner,
+                    'created_at': created_at,
+                    'completed_at': created_at + timedelta(minutes=30) if winner else None,
+                    'saved_at': None,
+                    'archived_move_count': 0,
+                    'archived_move_time': 0,
+                })
+
+                clocks = {'black': 600, 'white': 600}
+                for move_number in range(1, (options['detail_moves'] if is_detail else options['moves_per_game']) + 1):
+                    color = 'black' if move_number % 2 else 'white'
+                    taken = rng.randint(1, 20)
+                    clocks[color] = max(clocks[color] - taken, 0)
+                    moves.append({
+                        'user_id': user_id,
+                        'game_id': games[-1]['id'],
+                        'move_number': move_number,
+                        'player_color': color,
+                        'time_taken': taken,
+                        'main_time_remaining': clocks[color],
+                        'byoyomi_time_remaining': 30,
+                        'byoyomi_periods_remaining': 3,
+                        'in_byoyomi': clocks[color] == 0,
+                        'created_at': created_at + timedelta(seconds=move_number * 10),
+                    })
+                if len(moves) >= 50000:
+                    total_moves += len(moves)
+                    flush_moves()
+
+            db.session.execute(Game.__table__.insert(), games)
+            total_moves += len(moves)
+            flush_moves()
+            db.session.commit()
+            if (index + 1) % 10 == 0 or index + 1 == options['users']:
+                print(f'  seeded {index + 1}/{options["users"]} users, {total_moves} moves '
+                      f'({time.perf_counter() - started:.1f}s)', file=sys.stderr)
+
+        # Finished games' analytics, as completing them through the API would store
+        for user_id in users.values():
+            rebuild_user_analytics(user_id)
+
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+
+    return {'moves': total_moves, 'seconds': round(time.perf_counter() - started, 1)}
+
+
+def prepare_database(path, options, reseed):
+    # Reuses an existing seeded file when it was built with the same options
+    description_path = path + '.seed.json'
+    wanted = dict({name: options[name] for name in SEED_OPTIONS}, version=SEED_VERSION)
+    if not reseed and os.path.exists(path) and os.path.exists(description_path):
+        with open(description_path) as f:
+            description = json.load(f)
+        if description['options'] == wanted:
+            return description
+
+    for suffix in ('', '-wal', '-shm', '.seed.json'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+    print(f'Seeding {path}', file=sys.stderr)
+    from src.main import app
+    seeded = seed_database(app, wanted)
+    description = {'options': wanted, **seeded}
+    with open(description_path, 'w') as f:
+        json.dump(description, f, indent=2)
+    return description
+
+
+def detail_game_ids(path, users):
+    # One long game per benchmark user, read straight from the seeded file
+    conn = sqlite3.connect(path)
+    try:
+        rows = conn.execute(
+            "SELECT u.username, g.id FROM games g JOIN users u ON u.id = g.user_id "
+            "WHERE g.title LIKE 'Detail game %' ORDER BY g.created_at"
+        ).fetchall()
+    finally:
+        conn.close()
+    games = {}
+    for username, game_id in rows:
+        games.setdefault(username, game_id)
+    return [games[f'bench{i}'] for i in range(users) if f'bench{i}' in games]
+
+
+class Workload:
+    # Builds the request for iteration `counter` of client `index`
+
+    def __init__(self, name, run_id, detail_games):
+        self.name = name
+        self.run_id = run_id
+        self.detail_games = detail_games
+
+    def setup(self, transport, index):
+        if self.name == 'save_move':
+            _, body = transport.request('POST', '/api/games/new', {})
+            return {'game_id': json.loads(body)['game_id']}
+        if self.name == 'game_details':
+            return {'game_id': self.detail_games[index % len(self.detail_games)]}
+        if self.name == 'clock_press':
+            _, body = transport.request('POST', '/api/games/new', {})
+            game_id = json.loads(body)['game_id']
+            transport.request('POST', f'/api/games/{game_id}/clock', {})
+            return {'game_id': game_id}
+        return {}
+
+    def next(self, state, index, counter):
+        if self.name == 'save_move':
+            return 'POST', f"/api/games/{state['game_id']}/moves", {
+                'move_number': counter,
+                'player_color': 'black' if counter % 2 else 'white',
+                'time_taken': counter % 30,
+                'main_time_remaining': 600,
+                'byoyomi_time_remaining': 30,
+                'byoyomi_periods_remaining': 3,
+            }
+        if self.name == 'list_games':
+            return 'GET', '/api/games', None
+        if self.name == 'game_details':
+            return 'GET', f"/api/games/{state['game_id']}", None
+        if self.name == 'stats':
+            return 'GET', '/api/stats', None
+        if self.name == 'analytics':
+            return 'GET', '/api/analytics', None
+        if self.name == 'clock_press':
+            return 'POST', f"/api/games/{state['game_id']}/clock/press", {}
+        # auth: register a new user, then log in as it
+        username = f'auth-{self.run_id}-{index}-{(counter + 1) // 2}'
+        user = {'username': username, 'email': f'{username}@example.com', 'password': PASSWORD}
+        return 'POST', '/api/auth/register' if counter % 2 else '/api/auth/login', user
+
+
+class TestClientTransport:
+    # In-process: the Flask test client, SQL counted per thread
+
+    def __init__(self, app, counter, username):
+        from src.models.user import User
+        self.client = app.test_client()
+        self.counter = counter
+        with app.app_context():
+            user_id = User.query.filter_by(username=username).one().id
+        with self.client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['username'] = username
+            sess['is_guest'] = False
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        return response.status_code, response.get_data()
+
+    def statements(self):
+        return self.counter.for_thread()
+
+
+class HttpTransport:
+    # Over HTTP with a keep-alive connection and the session cookie of a login
+
+    def __init__(self, port, username):
+        self.port = port
+        self.conn = http.client.HTTPConnection('127.0.0.1', port)
+        self.cookie = None
+        status, _ = self.request('POST', '/api/auth/login', {'username': username, 'password': PASSWORD})
+        if status != 200:
+            raise RuntimeError(f'Login as {username} failed with {status}')
+
+    def request(self, method, path, body=None):
+        headers = {'Content-Type': 'application/json'}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        try:
+            self.conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+            response = self.conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = http.client.HTTPConnection('127.0.0.1', self.port)
+            return 599, b''
+        cookie = response.getheader('Set-Cookie')
+        if cookie and path != '/api/auth/register':
+            self.cookie = cookie.split(';', 1)[0]
+        return response.status, data
+
+    def statements(self):
+        return None
+
+    def close(self):
+        self.conn.close()
+
+
+class StatementCounter:
+    # Counts SQL statements per thread, so concurrent clients don't mix
+
+    def __init__(self, app):
+        from sqlalchemy import event
+        from src.models.user import db
+        self.counts = {}
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self.before_cursor_execute)
+
+    def before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        ident = threading.get_ident()
+        self.counts[ident] = self.counts.get(ident, 0) + 1
+
+    def for_thread(self):
+        return self.counts.get(threading.get_ident(), 0)
+
+
+def server_sql_totals(port):
+    # Statements and requests recorded by /api/metrics (server runs with METRICS_ENABLED=1)
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    conn.request('GET', '/api/metrics')
+    text = conn.getresponse().read().decode()
+    conn.close()
+    totals = {'sum': 0.0, 'count': 0.0}
+    pattern = re.compile(r'^gotimer_sql_statements_per_request_(sum|count)\{endpoint="([^"]*)"\} (\S+)$')
+    for line in text.splitlines():
+        match = pattern.match(line)
+        if match and match.group(2) != '/api/metrics':
+            totals[match.group(1)] += float(match.group(3))
+    return totals
+
+
+def run_workload(make_transport, workload, clients, duration, usernames):
+    latencies = []
+    statements = []
+    errors = []
+    lock = threading.Lock()
+    window = {}
+
+    def open_window():
+        window['started'] = time.perf_counter()
+        window['stop'] = window['started'] + duration
+
+    ready = threading.Barrier(clients + 1, action=open_window)
+
+    def worker(index):
+        transport = make_transport(usernames[index % len(usernames)], index)
+        state = workload.setup(transport, index)
+        local, local_statements, failed, counter = [], [], 0, 0
+        ready.wait()
+        while time.perf_counter() < window['stop']:
+            counter += 1
+            method, path, body = workload.next(state, index, counter)
+            before = transport.statements()
+            start = time.perf_counter()
+            status, _ = transport.request(method, path, body)
+            local.append(time.perf_counter() - start)
+            if before is not None:
+                local_statements.append(transport.statements() - before)
+            if status >= 400:
+                failed += 1
+        if hasattr(transport, 'close'):
+            transport.close()
+        with lock:
+            latencies.extend(local)
+            statements.extend(local_statements)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - window['started']
+
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'sql_per_request': round(sum(statements) / len(statements), 2) if statements else None,
+    }
+
+
+def run_in_process(args, workloads, usernames, detail_games):
+    from src.main import app
+    counter = StatementCounter(app)
+    results = {}
+    for name in workloads:
+        workload = Workload(name, uuid.uuid4().hex[:8], detail_games)
+        results[name] = run_workload(
+            lambda username, index: TestClientTransport(app, counter, username),
+            workload, args.clients, args.duration, usernames
+        )
+        print_row('inprocess', name, results[name])
+    return results
+
+
+def start_state_server(env):
+    path = env['STATE_SOCKET']
+    process = subprocess.Popen(['flask', '--app', 'src.main', 'state-server'], cwd=ROOT, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 15
+    while not os.path.exists(path):
+        if time.time() > deadline or process.poll() is not None:
+            process.terminate()
+            raise RuntimeError('State server did not start')
+        time.sleep(0.1)
+    return process
+
+
+def run_http(args, server, workloads, usernames, detail_games, workers=1):
+    env = dict(os.environ, DATABASE_URL=f'sqlite:///{args.database}', METRICS_ENABLED='1')
+    mode = f'http-{server}' if workers == 1 else f'http-{server}-{workers}w'
+    ports = [args.port + offset for offset in range(workers)]
+    processes = []
+    results = {}
+    try:
+        if workers > 1:
+            env.update(
+                STATE_BACKEND='socket',
+                STATE_SOCKET=os.path.join(tempfile.gettempdir(), f'go-timer-bench-{os.getpid()}.sock'),
+                SECRET_KEY=env.get('SECRET_KEY', 'benchmark'),
+                # Each client only talks to one worker
+                STICKY_SESSIONS='1'
+            )
+            processes.append(start_state_server(env))
+        for port in ports:
+            command = [part.format(port=port) for part in SERVERS[server]]
+            processes.append(subprocess.Popen(command, cwd=ROOT, env=env,
+                                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+        for port in ports:
+            wait_for_server(port)
+
+        for name in workloads:
+            workload = Workload(name, uuid.uuid4().hex[:8], detail_games)
+            before = [server_sql_totals(port) for port in ports]
+            results[name] = run_workload(
+                # Client i talks to worker i % workers, like a round-robin load balancer
+                lambda username, index: HttpTransport(ports[index % workers], username),
+                workload, args.clients, args.duration, usernames
+            )
+            after = [server_sql_totals(port) for port in ports]
+            # Includes the clients' logins; the async handlers of the ASGI
+            # server bypass Flask and are not counted at all
+            requests = sum(totals['count'] for totals in after) - sum(totals['count'] for totals in before)
+            if requests:
+                statements = sum(totals['sum'] for totals in after) - sum(totals['sum'] for totals in before)
+                results[name]['sql_per_request'] = round(statements / requests, 2)
+            print_row(mode, name, results[name])
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait(timeout=10)
+    return mode, results
+
+
+def print_row(mode, workload, stats):
+    sql = '-' if stats['sql_per_request'] is None else stats['sql_per_request']
+    print(f"{mode:<14} {workload:<13} {stats['rps']:>9} {stats['p50_ms']:>8} {stats['p95_ms']:>8} "
+          f"{stats['p99_ms']:>8} {sql:>6} {stats['errors']:>7}")
+
+
+def print_scaling(server, worker_counts, results):
+    # Throughput of each worker count relative to a single worker
+    baseline = results.get(f'http-{server}')
+    if not baseline or len(worker_counts) < 2:
+        return
+    print(f"\n{'workload':<13} " + ' '.join(f'{count:>3} workers' for count in worker_counts))
+    for name, stats in baseline.items():
+        cells = []
+        for count in worker_counts:
+            mode = f'http-{server}' if count == 1 else f'http-{server}-{count}w'
+            rps = results.get(mode, {}).get(name, {}).get('rps')
+            cells.append(f'{rps / stats["rps"]:>10.2f}x' if rps and stats['rps'] else f'{"-":>11}')
+        print(f'{name:<13} ' + ' '.join(cells))
+
+
+def print_comparison(previous, results):
+    print(f"\n{'mode':<14} {'workload':<13} {'req/s':>16} {'p99 ms':>16}")
+    for mode, workloads in results.items():
+        for name, stats in workloads.items():
+            old = previous.get('results', {}).get(mode, {}).get(name)
+            if not old:
+                continue
+            rps_change = (stats['rps'] - old['rps']) / old['rps'] * 100 if old['rps'] else 0
+            p99_change = (stats['p99_ms'] - old['p99_ms']) / old['p99_ms'] * 100 if old['p99_ms'] else 0
+            print(f"{mode:<14} {name:<13} {old['rps']:>7} {rps_change:>+7.1f}% {old['p99_ms']:>7} {p99_change:>+7.1f}%")
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', default=os.path.join(tempfile.gettempdir(), 'go-timer-bench.db'))
+    parser.add_argument('--reseed', action='store_true', help='Rebuild the database even if it matches')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--games-per-user', type=int, default=100)
+    parser.add_argument('--moves-per-game', type=int, default=200)
+    parser.add_argument('--detail-games', type=int, default=2, help='Long games per user for game_details')
+    parser.add_argument('--detail-moves', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workloads', nargs='+', default=list(WORKLOADS), choices=WORKLOADS)
+    parser.add_argument('--modes', nargs='+', default=['inprocess', 'http'], choices=['inprocess', 'http'])
+    parser.add_argument('--server', default='wsgi', choices=list(SERVERS), help='Server for the http mode')
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds per workload')
+    parser.add_argument('--port', type=int, default=5088)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1],
+                        help='Server processes for the http mode; several counts compare scaling')
+    parser.add_argument('--json', help='Write the results to this file')
+    parser.add_argument('--compare', help='Results file of an earlier run to compare against')
+    args = parser.parse_args()
+
+    args.database = os.path.abspath(args.database)
+    os.environ['DATABASE_URL'] = f'sqlite:///{args.database}'
+    # Seeded active games are long past their deadlines; keep them as seeded
+    os.environ['FLAG_FALL_SCHEDULER'] = '0'
+    # Every client logs in from one address
+    os.environ['AUTH_RATE_LIMIT'] = '0'
+    sys.path.insert(0, ROOT)
+
+    options = {name: getattr(args, name) for name in SEED_OPTIONS}
+    seeded = prepare_database(args.database, options, args.reseed)
+    usernames = [f'bench{i}' for i in range(args.users)]
+    detail_games = detail_game_ids(args.database, args.users)
+    print(f"Database {args.database}: {args.users} users, "
+          f"{args.users * (args.games_per_user + args.detail_games)} games, {seeded['moves']} moves", file=sys.stderr)
+
+    print(f"{'mode':<14} {'workload':<13} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'sql':>6} {'errors':>7}")
+    results = {}
+    if 'inprocess' in args.modes:
+        results['inprocess'] = run_in_process(args, args.workloads, usernames, detail_games)
+    if 'http' in args.modes:
+        for workers in args.workers:
+            mode, results[mode] = run_http(args, args.server, args.workloads, usernames, detail_games, workers)
+        print_scaling(args.server, args.workers, results)
+
+    report = {
+        'revision': git_revision(),
+        'timestamp': datetime.utcnow().isoformat(),
+        'python': sys.version.split()[0],
+        'sqlite': sqlite3.sqlite_version,
+        'clients': args.clients,
+        'duration': args.duration,
+        'seed': seeded,
+        'results': results,
+    }
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), results)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
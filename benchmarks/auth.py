@@ -0,0 +1,165 @@
+"""Login rush benchmark: concurrent logins mixed with move traffic.
+
+Starts a server against a throwaway SQLite database, then saves moves from
+--move-clients clients, first alone and then while --login-clients clients
+log in as fast as they can, and reports how much the logins slow the moves
+down, with the login status codes (429 from the rate limits, 503 from a full
+hash queue). Runs once per --hash-workers value.
+
+    python benchmarks/auth.py --login-clients 32 --move-clients 8 --hash-workers 1 2
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from serving import SERVERS, percentile, request, wait_for_server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'benchmark'
+
+
+def setup(port, login_users):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    for index in range(login_users):
+        user = {'username': f'rush{index}', 'email': f'rush{index}@example.com', 'password': PASSWORD}
+        request(conn, 'POST', '/api/auth/register', user)
+    user = {'username': 'mover', 'email': 'mover@example.com', 'password': PASSWORD}
+    response, _ = request(conn, 'POST', '/api/auth/register', user)
+    cookie = response.getheader('Set-Cookie').split(';', 1)[0]
+    _, data = request(conn, 'POST', '/api/games/new', {}, cookie)
+    conn.close()
+    return cookie, json.loads(data)['game_id']
+
+
+def client_loop(port, stop, make_request, cookie, latencies, statuses):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    counter = 0
+    while not stop.is_set():
+        counter += 1
+        method, path, body = make_request(counter)
+        start = time.perf_counter()
+        try:
+            response, _ = request(conn, method, path, body, cookie)
+        except (OSError, http.client.HTTPException):
+            statuses['error'] += 1
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port)
+            continue
+        latencies.append(time.perf_counter() - start)
+        statuses[response.status] += 1
+    conn.close()
+
+
+def summarize(latencies, statuses, elapsed):
+    return {
+        'requests': len(latencies),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+    }
+
+
+def run_phase(port, cookie, game_id, move_clients, login_clients, login_users, duration, offset):
+    stop = threading.Event()
+    moves = ([], Counter())
+    logins = ([], Counter())
+    threads = []
+
+    for index in range(move_clients):
+        def save_move(counter, index=index):
+            return 'POST', f'/api/games/{game_id}/moves', {
+                'move_number': offset + index * 1000000 + counter,
+                'player_color': 'black' if counter % 2 else 'white',
+                'time_taken': counter % 30,
+            }
+        threads.append(threading.Thread(target=client_loop, args=(port, stop, save_move, cookie, *moves)))
+
+    for index in range(login_clients):
+        def login(counter, index=index):
+            username = f'rush{(index + counter) % login_users}'
+            return 'POST', '/api/auth/login', {'username': username, 'password': PASSWORD}
+        threads.append(threading.Thread(target=client_loop, args=(port, stop, login, None, *logins)))
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = {'moves': summarize(*moves, elapsed)}
+    if login_clients:
+        result['logins'] = summarize(*logins, elapsed)
+    return result
+
+
+def bench(args, hash_workers):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(
+            os.environ,
+            DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}",
+            PASSWORD_HASH_WORKERS=str(hash_workers),
+            PASSWORD_HASH_QUEUE_DEPTH=str(args.queue_depth),
+            AUTH_RATE_LIMIT='1' if args.rate_limit else '0',
+            FLAG_FALL_SCHEDULER='0'
+        )
+        command = [part.format(port=args.port) for part in SERVERS[args.server]]
+        server = subprocess.Popen(command, cwd=ROOT, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_server(args.port)
+            cookie, game_id = setup(args.port, args.login_users)
+            return {
+                'moves only': run_phase(args.port, cookie, game_id, args.move_clients, 0,
+                                        args.login_users, args.duration, 0),
+                'with logins': run_phase(args.port, cookie, game_id, args.move_clients, args.login_clients,
+                                         args.login_users, args.duration, 500000),
+            }
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server', default='wsgi', choices=list(SERVERS))
+    parser.add_argument('--move-clients', type=int, default=8)
+    parser.add_argument('--login-clients', type=int, default=32)
+    parser.add_argument('--login-users', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--hash-workers', type=int, nargs='+', default=[0],
+                        help='PASSWORD_HASH_WORKERS values to compare (0 = one per CPU)')
+    parser.add_argument('--queue-depth', type=int, default=32)
+    parser.add_argument('--rate-limit', action='store_true',
+                        help='Keep the auth rate limits on (every client shares one IP)')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--json', help='Write the results to this file')
+    args = parser.parse_args()
+
+    results = {workers: bench(args, workers) for workers in args.hash_workers}
+
+    print(f"{'workers':>7} {'phase':<12} {'traffic':<7} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9}  statuses")
+    for workers, phases in results.items():
+        for phase, traffic in phases.items():
+            for kind, stats in traffic.items():
+                statuses = ' '.join(f'{status}:{count}' for status, count in stats['statuses'].items())
+                print(f"{workers:>7} {phase:<12} {kind:<7} {stats['rps']:>8} {stats['p50_ms']:>9} "
+                      f"{stats['p99_ms']:>9}  {statuses}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,171 @@
+"""Compare the WSGI dev server with the ASGI entry point.
+
+Starts each server against a throwaway SQLite database, then drives the
+move-save and game-list endpoints with concurrent keep-alive clients and
+reports requests/sec and latency percentiles.
+
+    python benchmarks/serving.py --clients 32 --duration 10
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    'wsgi': ['flask', '--app', 'src.main', 'run', '--port', '{port}', '--with-threads', '--no-reload'],
+    'asgi': ['uvicorn', 'src.asgi:app', '--port', '{port}', '--log-level', 'warning'],
+}
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def request(conn, method, path, body=None, cookie=None):
+    headers = {'Content-Type': 'application/json'}
+    if cookie:
+        headers['Cookie'] = cookie
+    conn.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+    response = conn.getresponse()
+    data = response.read()
+    return response, data
+
+
+def wait_for_server(port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            request(conn, 'GET', '/api/auth/me')
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Server on port {port} did not start')
+
+
+def login(port):
+    conn = http.client.HTTPConnection('127.0.0.1', port)
+    user = {'username': 'bench', 'email': 'bench@example.com', 'password': 'benchmark'}
+    response, _ = request(conn, 'POST', '/api/auth/register', user)
+    if response.status != 201:
+        response, _ = request(conn, 'POST', '/api/auth/login', user)
+    cookie = response.getheader('Set-Cookie').split(';', 1)[0]
+    _, data = request(conn, 'POST', '/api/games/new', {}, cookie)
+    conn.close()
+    return cookie, json.loads(data)['game_id']
+
+
+def run_workload(port, cookie, clients, duration, make_request):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def worker(index):
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        local = []
+        failed = 0
+        counter = 0
+        while time.perf_counter() < stop_at:
+            counter += 1
+            method, path, body = make_request(index, counter)
+            start = time.perf_counter()
+            try:
+                response, _ = request(conn, method, path, body, cookie)
+                if response.status >= 400:
+                    failed += 1
+            except (OSError, http.client.HTTPException):
+                failed += 1
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port)
+                continue
+            local.append(time.perf_counter() - start)
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            errors.append(failed)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'requests': len(latencies),
+        'errors': sum(errors),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def bench_server(name, port, clients, duration):
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        command = [part.format(port=port) for part in SERVERS[name]]
+        server = subprocess.Popen(command, cwd=ROOT, env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            wait_for_server(port)
+            cookie, game_id = login(port)
+
+            def save_move(index, counter):
+                return 'POST', f'/api/games/{game_id}/moves', {
+                    'move_number': index * 1000000 + counter,
+                    'player_color': 'black' if counter % 2 else 'white',
+                    'time_taken': counter % 30,
+                }
+
+            def list_games(index, counter):
+                return 'GET', '/api/games', None
+
+            return {
+                'save_move': run_workload(port, cookie, clients, duration, save_move),
+                'list_games': run_workload(port, cookie, clients, duration, list_games),
+            }
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--port', type=int, default=5077)
+    parser.add_argument('--servers', nargs='+', default=list(SERVERS), choices=list(SERVERS))
+    parser.add_argument('--json', help='Write the results to this file')
+    args = parser.parse_args()
+
+    results = {}
+    for offset, name in enumerate(args.servers):
+        results[name] = bench_server(name, args.port + offset, args.clients, args.duration)
+
+    print(f"{'server':<6} {'workload':<11} {'req/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, workloads in results.items():
+        for workload, stats in workloads.items():
+            print(f"{name:<6} {workload:<11} {stats['rps']:>9} {stats['p50_ms']:>9} "
+                  f"{stats['p99_ms']:>9} {stats['errors']:>7}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'clients': args.clients, 'duration': args.duration, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""Concurrency benchmark for the SQLite storage profiles.
+
+Runs mixed save_move / get_game_moves traffic from several threads through
+the Flask app, once per SQLITE_PROFILE, each against a fresh database, and
+reports the throughput of every profile.
+
+    python benchmarks/storage.py --threads 8 --duration 5
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_profile(threads, duration, read_ratio):
+    # Runs inside a subprocess whose environment selects the profile
+    sys.path.insert(0, ROOT)
+    from src.main import app
+
+    clients = []
+    for index in range(threads):
+        client = app.test_client()
+        user = {'username': f'bench{index}', 'email': f'bench{index}@example.com', 'password': 'benchmark'}
+        client.post('/api/auth/register', json=user)
+        game_id = client.post('/api/games/new', json={}).get_json()['game_id']
+        clients.append((client, game_id))
+
+    counts = {'save_move': [], 'get_game_moves': []}
+    errors = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def worker(client, game_id):
+        local = {'save_move': [], 'get_game_moves': []}
+        failed = 0
+        move_number = 0
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            if move_number and (move_number * 7919) % 100 < read_ratio * 100:
+                kind = 'get_game_moves'
+                response = client.get(f'/api/games/{game_id}/moves')
+            else:
+                kind = 'save_move'
+                response = client.post(f'/api/games/{game_id}/moves', json={
+                    'move_number': move_number,
+                    'player_color': 'black' if move_number % 2 else 'white',
+                    'time_taken': move_number % 30,
+                })
+            move_number += 1
+            if response.status_code >= 400:
+                failed += 1
+            local[kind].append(time.perf_counter() - start)
+        with lock:
+            for kind, values in local.items():
+                counts[kind].extend(values)
+            errors.append(failed)
+
+    workers = [threading.Thread(target=worker, args=pair) for pair in clients]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    result = {'errors': sum(errors), 'total_ops_per_sec': round(sum(map(len, counts.values())) / elapsed, 1)}
+    for kind, values in counts.items():
+        values.sort()
+        result[kind] = {
+            'ops': len(values),
+            'ops_per_sec': round(len(values) / elapsed, 1),
+            'p99_ms': round(values[int(0.99 * (len(values) - 1))] * 1000, 2) if values else 0,
+        }
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--read-ratio', type=float, default=0.5)
+    parser.add_argument('--profiles', nargs='+', default=['default', 'wal'])
+    parser.add_argument('--json', help='Write the results to this file')
+    parser.add_argument('--run-profile', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_profile:
+        return run_profile(args.threads, args.duration, args.read_ratio)
+
+    results = {}
+    for profile in args.profiles:
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, SQLITE_PROFILE=profile,
+                       DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+            output = subprocess.run(
+                [sys.executable, __file__, '--run-profile', '--threads', str(args.threads),
+                 '--duration', str(args.duration), '--read-ratio', str(args.read_ratio)],
+                cwd=ROOT, env=env, capture_output=True, text=True, check=True
+            ).stdout
+            results[profile] = json.loads(output.strip().splitlines()[-1])
+
+    print(f"{'profile':<8} {'ops/s':>9} {'save/s':>9} {'save p99':>9} {'read/s':>9} {'read p99':>9} {'errors':>7}")
+    for profile, stats in results.items():
+        save, read = stats['save_move'], stats['get_game_moves']
+        print(f"{profile:<8} {stats['total_ops_per_sec']:>9} {save['ops_per_sec']:>9} {save['p99_ms']:>9} "
+              f"{read['ops_per_sec']:>9} {read['p99_ms']:>9} {stats['errors']:>7}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'threads': args.threads, 'duration': args.duration, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,450 @@
+import asyncio
+import io
+import itertools
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from werkzeug.http import parse_etags
+from src.main import app as flask_app
+from src.models.user import Game
+from src.models.move_history import MoveHistory
+from src.services.clock import clock_table
+from src.services.game_history import parse_game_query, user_games_query, page_games, GameQueryError
+from src.services.guest_store import guest_store, GuestStoreError
+from src.services.events import game_events, format_sse, move_delta
+from src.services.move_buffer import move_buffer, move_row, record_inserted_moves, MoveDataError
+from src.services.stats_cache import stats_cache
+from src.services.revisions import REVALIDATE, games_etag, revision_statements, user_revision_query
+from src.services.storage import install_pragmas, storage_pragmas
+
+# Production entry point: uvicorn src.asgi:app
+#
+# The hot move_bp endpoints (move saves, game listing and the live event
+# stream) run as native async handlers on an aiosqlite engine. Every other
+# route is served by the Flask app through a thread pool. Calls that may
+# block on the state server (event publishing, the clock table, stats cache
+# updates) run in threads so they never stall the event loop.
+
+
+def async_database_url(url):
+    return url.replace('sqlite://', 'sqlite+aiosqlite://', 1)
+
+
+class WsgiBridge:
+    # Runs the WSGI app for routes without an async handler. Requests go to a
+    # plain thread pool so slow Flask routes don't queue behind each other.
+    # Streamed responses (no Content-Length, e.g. /api/export) are passed on
+    # chunk by chunk through a small queue, so a large body is never held in
+    # memory and a slow client pauses the generator.
+
+    def __init__(self, app, max_workers=32, stream_queue_size=8):
+        self.app = app
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='wsgi')
+        self.stream_queue_size = stream_queue_size
+
+    async def __call__(self, scope, receive, send):
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=self.stream_queue_size)
+        closed = threading.Event()
+        worker = loop.run_in_executor(
+            self.executor, self.run, self.environ(scope, body), loop, queue, closed
+        )
+        try:
+            start = await queue.get()
+            if start is None:
+                raise RuntimeError('WSGI app returned without starting a response')
+            status, headers = start
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    break
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            # Unblock the worker if the client went away mid-stream
+            closed.set()
+            while not queue.empty():
+                queue.get_nowait()
+            await worker
+
+    def environ(self, scope, body):
+        server = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+            'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+            'QUERY_STRING': scope['query_string'].decode('latin1'),
+            'SERVER_NAME': server[0],
+            'SERVER_PORT': str(server[1]),
+            'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+            'REMOTE_ADDR': client[0],
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope['headers']:
+            name = name.decode('latin1')
+            value = value.decode('latin1')
+            if name == 'content-type':
+                environ['CONTENT_TYPE'] = value
+                continue
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+        return environ
+
+    def run(self, environ, loop, queue, closed):
+        # The whole response is produced on this one worker thread, since
+        # streamed Flask generators keep their app context in thread state
+        response = {}
+
+        def put(item):
+            if not closed.is_set():
+                asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(k.lower().encode('latin1'), v.encode('latin1')) for k, v in headers]
+
+        try:
+            result = self.app(environ, start_response)
+            try:
+                # start_response may be deferred until the first chunk
+                iterator = iter(result)
+                first = next(iterator, b'')
+                put((response['status'], response['headers']))
+                if any(name == b'content-length' for name, _ in response['headers']):
+                    put(first + b''.join(iterator))
+                else:
+                    for chunk in itertools.chain([first], iterator):
+                        if closed.is_set():
+                            break
+                        if chunk:
+                            put(chunk)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        finally:
+            put(None)
+
+
+class AsyncApi:
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi = WsgiBridge(app)
+        self.engine = create_async_engine(async_database_url(app.config['SQLALCHEMY_DATABASE_URI']))
+        install_pragmas(self.engine.sync_engine, storage_pragmas(app))
+        self.serializer = app.session_interface.get_signing_serializer(app)
+        self.routes = [
+            ('POST', re.compile(r'^/api/games/(?P<game_id>[^/]+)/moves$'), self.save_move),
+            ('POST', re.compile(r'^/api/games/(?P<game_id>[^/]+)/moves:batch$'), self.save_moves_batch),
+            ('GET', re.compile(r'^/api/games$'), self.get_user_games),
+            ('GET', re.compile(r'^/api/games/(?P<game_id>[^/]+)/events$'), self.stream_game_events),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['type'] == 'http':
+            for method, pattern, handler in self.routes:
+                match = pattern.match(scope['path'])
+                if match and scope['method'] == method:
+                    return await handler(scope, receive, self.with_cors(scope, send), **match.groupdict())
+
+        await self.wsgi(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.to_thread(move_buffer.flush)
+                await self.engine.dispose()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def with_cors(self, scope, send):
+        # Adds the headers CORS(app, supports_credentials=True) sets on Flask
+        # responses; preflight OPTIONS requests still go through the bridge
+        origin = next((value for name, value in scope['headers'] if name == b'origin'), None)
+        if origin is None:
+            return send
+        cors = [
+            (b'access-control-allow-origin', origin),
+            (b'access-control-allow-credentials', b'true'),
+            (b'vary', b'Origin'),
+        ]
+
+        async def send_with_cors(message):
+            if message['type'] == 'http.response.start':
+                message = dict(message, headers=[*message.get('headers', ()), *cors])
+            await send(message)
+        return send_with_cors
+
+    def load_session(self, scope):
+        # Same signed cookie the Flask routes read and write
+        cookie = SimpleCookie()
+        for name, value in scope['headers']:
+            if name == b'cookie':
+                cookie.load(value.decode('latin-1'))
+        morsel = cookie.get(self.app.config['SESSION_COOKIE_NAME'])
+        if morsel is None or self.serializer is None:
+            return {}
+        try:
+            max_age = int(self.app.permanent_session_lifetime.total_seconds())
+            return self.serializer.loads(morsel.value, max_age=max_age)
+        except Exception:
+            return {}
+
+    async def read_json(self, receive):
+        body = b''
+        while True:
+            message = await receive()
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+        try:
+            return self.app.json.loads(body) if body else None
+        except ValueError:
+            return None
+
+    async def respond(self, send, data, status=200, headers=()):
+        body = self.app.json.dumps(data).encode()
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                *headers
+            ]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def not_modified(self, scope, send, etag):
+        # Answers If-None-Match like src/services/revisions.py; True if it did
+        headers = [(b'cache-control', REVALIDATE.encode()), (b'etag', f'"{etag}"'.encode())]
+        for name, value in scope['headers']:
+            if name == b'if-none-match' and parse_etags(value.decode('latin-1')).contains_weak(etag):
+                await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+                await send({'type': 'http.response.body', 'body': b''})
+                return True
+        return False
+
+    async def game_status(self, user_id, game_id):
+        # Moves are only stored into the user's own active games
+        async with AsyncSession(self.engine) as db_session:
+            return await db_session.scalar(Game.status_query(user_id, game_id))
+
+    async def owns_game(self, session, game_id):
+        # Same check as _owns_game() in src/routes/move_history.py
+        state = await asyncio.to_thread(clock_table.get, game_id, False)
+        if state is not None and state.user_id == session['user_id']:
+            return True
+        if session.get('is_guest', False):
+            return guest_store.game(session['user_id'], game_id) is not None
+        return await self.game_status(session['user_id'], game_id) is not None
+
+    async def insert_moves(self, rows):
+        with stats_cache.writing_moves(row['user_id'] for row in rows):
+            async with self.engine.begin() as conn:
+                await conn.execute(MoveHistory.__table__.insert(), rows)
+                for statement in revision_statements(rows):
+                    await conn.execute(statement)
+            await asyncio.to_thread(record_inserted_moves, rows)
+
+    async def save_move(self, scope, receive, send, game_id):
+        try:
+            session = self.load_session(scope)
+            if 'user_id' not in session:
+                return await self.respond(send, {'error': 'Not authenticated'}, 401)
+
+            data = await self.read_json(receive)
+
+            if not isinstance(data, dict) or not all(k in data for k in ('move_number', 'player_color', 'time_taken')):
+                return await self.respond(send, {'error': 'Missing required move data'}, 400)
+
+            row = move_row(data, session['user_id'], game_id)
+
+            # Guest moves go to the in-memory guest store
+            if session.get('is_guest', False):
+                guest_store.add_moves(session['user_id'], game_id, [row])
+                await asyncio.to_thread(game_events.publish, game_id, 'move', move_delta(row))
+                return await self.respond(send, {'message': 'Move saved (guest mode)'}, 201)
+
+            status = await self.game_status(session['user_id'], game_id)
+            if status is None:
+                return await self.respond(send, {'error': 'Game not found'}, 404)
+            if status != 'active':
+                return await self.respond(send, {'error': 'Game is already finished'}, 409)
+
+            if move_buffer.enabled:
+                move_buffer.add(row)
+                await asyncio.to_thread(game_events.publish, game_id, 'move', move_delta(row))
+                return await self.respond(send, {'message': 'Move queued'}, 202)
+
+            await self.insert_moves([row])
+            await asyncio.to_thread(game_events.publish, game_id, 'move', move_delta(row))
+
+            return await self.respond(send, {'message': 'Move saved successfully'}, 201)
+
+        except (MoveDataError, GuestStoreError) as e:
+            return await self.respond(send, {'error': str(e)}, 400)
+        except Exception:
+            return await self.respond(send, {'error': 'Failed to save move'}, 500)
+
+    async def save_moves_batch(self, scope, receive, send, game_id):
+        try:
+            session = self.load_session(scope)
+            if 'user_id' not in session:
+                return await self.respond(send, {'error': 'Not authenticated'}, 401)
+
+            data = await self.read_json(receive)
+            moves = data.get('moves') if isinstance(data, dict) else data
+
+            if not isinstance(moves, list) or not moves:
+                return await self.respond(send, {'error': 'Expected a non-empty list of moves'}, 400)
+
+            if not all(isinstance(m, dict) and all(k in m for k in ('move_number', 'player_color', 'time_taken')) for m in moves):
+                return await self.respond(send, {'error': 'Missing required move data'}, 400)
+
+            rows = [move_row(m, session['user_id'], game_id) for m in moves]
+
+            if session.get('is_guest', False):
+                guest_store.add_moves(session['user_id'], game_id, rows)
+                await asyncio.to_thread(game_events.publish, game_id, 'moves', [move_delta(row) for row in rows])
+                return await self.respond(send, {'message': 'Moves saved (guest mode)', 'count': len(rows)}, 201)
+
+            status = await self.game_status(session['user_id'], game_id)
+            if status is None:
+                return await self.respond(send, {'error': 'Game not found'}, 404)
+            if status != 'active':
+                return await self.respond(send, {'error': 'Game is already finished'}, 409)
+
+            # Buffered single moves must land before this batch to keep move order
+            if move_buffer.enabled:
+                await asyncio.to_thread(move_buffer.flush)
+
+            await self.insert_moves(rows)
+            await asyncio.to_thread(game_events.publish, game_id, 'moves', [move_delta(row) for row in rows])
+
+            return await self.respond(send, {'message': 'Moves saved successfully', 'count': len(rows)}, 201)
+
+        except (MoveDataError, GuestStoreError) as e:
+            return await self.respond(send, {'error': str(e)}, 400)
+        except Exception:
+            return await self.respond(send, {'error': 'Failed to save moves'}, 500)
+
+    async def get_user_games(self, scope, receive, send):
+        try:
+            session = self.load_session(scope)
+            if 'user_id' not in session:
+                return await self.respond(send, {'error': 'Not authenticated'}, 401)
+
+            params = parse_game_query(dict(parse_qsl(scope['query_string'].decode('latin1'))))
+
+            if session.get('is_guest', False):
+                data, next_cursor = guest_store.games(session['user_id'], params)
+                headers = [(b'x-next-cursor', next_cursor.encode())] if next_cursor else []
+                return await self.respond(send, data, headers=headers)
+
+            if move_buffer.enabled:
+                await asyncio.to_thread(move_buffer.flush)
+
+            user_id = session['user_id']
+            async with AsyncSession(self.engine) as db_session:
+                # The user's revision identifies the page before any game is loaded
+                etag = None
+                revision = await db_session.scalar(user_revision_query(user_id))
+                if revision is not None:
+                    etag = games_etag(user_id, revision, scope['query_string'])
+                    if await self.not_modified(scope, send, etag):
+                        return
+
+                games = (await db_session.scalars(user_games_query(user_id, params))).all()
+                games, next_cursor = page_games(games, params['limit'])
+                data = [game.to_dict(move_count=game.move_row_count) for game in games]
+
+            headers = [(b'x-next-cursor', next_cursor.encode())] if next_cursor else []
+            if etag:
+                headers += [(b'cache-control', REVALIDATE.encode()), (b'etag', f'"{etag}"'.encode())]
+            return await self.respond(send, data, headers=headers)
+
+        except GameQueryError as e:
+            return await self.respond(send, {'error': str(e)}, 400)
+        except Exception:
+            return await self.respond(send, {'error': 'Failed to get games'}, 500)
+
+    async def stream_game_events(self, scope, receive, send, game_id):
+        session = self.load_session(scope)
+        if 'user_id' not in session:
+            return await self.respond(send, {'error': 'Not authenticated'}, 401)
+
+        if not await self.owns_game(session, game_id):
+            return await self.respond(send, {'error': 'Game not found'}, 404)
+
+        keepalive = self.app.config.get('EVENT_KEEPALIVE_INTERVAL', 15)
+        subscriber = await asyncio.to_thread(game_events.subscribe, game_id, asyncio.get_running_loop())
+        disconnected = asyncio.ensure_future(self.wait_for_disconnect(receive))
+
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': 200,
+                'headers': [
+                    (b'content-type', b'text/event-stream; charset=utf-8'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no')
+                ]
+            })
+
+            state = await asyncio.to_thread(clock_table.get, game_id, False)
+            if state:
+                await self.send_event(send, format_sse('clock', state.to_dict(clock_table.clock())))
+
+            # An idle viewer is just a parked coroutine, not a thread
+            while not disconnected.done():
+                getter = asyncio.ensure_future(subscriber.queue.get())
+                done, _ = await asyncio.wait({getter, disconnected}, timeout=keepalive,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if getter in done:
+                    await self.send_event(send, getter.result())
+                else:
+                    getter.cancel()
+                    if not disconnected.done():
+                        await self.send_event(send, ': keepalive\n\n')
+        finally:
+            disconnected.cancel()
+            await asyncio.to_thread(game_events.unsubscribe, game_id, subscriber)
+
+    async def send_event(self, send, message):
+        await send({'type': 'http.response.body', 'body': message.encode(), 'more_body': True})
+
+    async def wait_for_disconnect(self, receive):
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+
+app = AsyncApi(flask_app)
@@ -1,36 +1,280 @@
 import os
 import sys
+import click
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from flask import Flask, send_from_directory
 from flask_cors import CORS
-from src.models.user import db
+from werkzeug.middleware.proxy_fix import ProxyFix
+from src.models.user import db, User, Game
 from src.models.move_history import MoveHistory  # Import to register the model
+from src.models.analytics import GameAnalytics, UserAnalytics, UserMoveTime  # Import to register the models
+from src.models.replay import ReplayPoint  # Import to register the model
 from src.routes.user import user_bp
 from src.routes.auth import auth_bp
 from src.routes.move_history import move_bp
+from src.services.move_buffer import move_buffer
+from src.services.events import game_events
+from src.services.clock import clock_table
+from src.services.stats_cache import stats_cache
+from src.services.user_cache import user_cache
+from src.services.guest_store import guest_store
+from src.services.flag_fall import flag_scheduler
+from src.services.passwords import password_hasher
+from src.services.rate_limit import auth_limiter
+from src.services.account_deletion import account_deletions, purge_user
+from src.services.metrics import metrics
+from src.services.assets import assets
+from src.services.game_import import import_documents, import_paths
+from src.services.analytics import rebuild_user_analytics
+from src.services.replay import rebuild_user_replay_points
+from src.services.storage import configure_storage, apply_storage_profile
+from src.services.state import DEFAULT_SOCKET, create_state_backend, serve_state
+from src.services.schema import (
+    ensure_columns, ensure_indexes, ensure_search_index, rebuild_search_index,
+    find_table_scans
+)
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
-app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
+
+# Where live clocks, game events and cache invalidations live: 'local' for a
+# single worker process, 'socket' to share them between worker processes
+# through the state server (flask --app src.main state-server) on STATE_SOCKET
+app.config['STATE_BACKEND'] = os.environ.get('STATE_BACKEND', 'local')
+app.config['STATE_SOCKET'] = os.environ.get('STATE_SOCKET', DEFAULT_SOCKET)
+
+# Signs the session cookie, so every worker process must use the same key. The
+# built-in key is only good for a single development server.
+app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'asdf#FGSgvasgf$5$WGT')
+if app.config['STATE_BACKEND'] != 'local' and 'SECRET_KEY' not in os.environ:
+    raise RuntimeError('Set SECRET_KEY when running several worker processes')
+
+# Guest games live in the memory of the worker process that stored them (see
+# src/services/guest_store.py), so several workers only work if the load
+# balancer keeps sending each session to the same one. STICKY_SESSIONS=1 says
+# it does; without it the app refuses to start with a shared state backend.
+app.config['STICKY_SESSIONS'] = os.environ.get('STICKY_SESSIONS', '0') == '1'
+if app.config['STATE_BACKEND'] != 'local' and not app.config['STICKY_SESSIONS']:
+    raise RuntimeError('Guest games are kept per worker process; set STICKY_SESSIONS=1 once sessions stick to one worker')
 
 # Enable CORS for all routes
 CORS(app, supports_credentials=True)
 
+# Number of reverse proxies or load balancers in front of the app. Each one
+# appends to X-Forwarded-For, so the client IP used by the auth rate limits is
+# taken that many entries from the end; 0 trusts no forwarded headers.
+app.config['TRUSTED_PROXIES'] = int(os.environ.get('TRUSTED_PROXIES', 0))
+if app.config['TRUSTED_PROXIES']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['TRUSTED_PROXIES'], x_proto=app.config['TRUSTED_PROXIES'])
+
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(move_bp, url_prefix='/api')
 
 # Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get(
+    'DATABASE_URL',
+    f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
+)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+
+# SQLite tuning: PRAGMA profile, one writer connection and a reader pool
+app.config['SQLITE_PROFILE'] = os.environ.get('SQLITE_PROFILE', 'wal')
+app.config['SQLITE_READER_POOL_SIZE'] = int(os.environ.get('SQLITE_READER_POOL_SIZE', 8))
+configure_storage(app)
 db.init_app(app)
 
+# Optional write-behind buffer for single-move POSTs
+app.config['MOVE_WRITE_BUFFER'] = os.environ.get('MOVE_WRITE_BUFFER', '0') == '1'
+app.config['MOVE_WRITE_BUFFER_SIZE'] = int(os.environ.get('MOVE_WRITE_BUFFER_SIZE', 200))
+app.config['MOVE_WRITE_BUFFER_INTERVAL'] = float(os.environ.get('MOVE_WRITE_BUFFER_INTERVAL', 0.5))
+
+# Live game event streams: events queued per viewer and idle keepalive period
+app.config['EVENT_QUEUE_SIZE'] = int(os.environ.get('EVENT_QUEUE_SIZE', 64))
+app.config['EVENT_KEEPALIVE_INTERVAL'] = float(os.environ.get('EVENT_KEEPALIVE_INTERVAL', 15))
+
+# Pack a game's moves into one blob on the Game row when it is completed or saved
+app.config['MOVE_ARCHIVE'] = os.environ.get('MOVE_ARCHIVE', '0') == '1'
+
+# Games read per chunk by the streaming /api/export
+app.config['EXPORT_CHUNK_SIZE'] = int(os.environ.get('EXPORT_CHUNK_SIZE', 100))
+
+# Bulk SGF/JSON import: parser processes for `flask import-games` (0 = one per
+# CPU; POST /api/import parses on the request thread) and games per transaction
+app.config['IMPORT_WORKERS'] = int(os.environ.get('IMPORT_WORKERS', 0))
+app.config['IMPORT_BATCH_SIZE'] = int(os.environ.get('IMPORT_BATCH_SIZE', 500))
+
+# In-process cache of user profiles for /api/auth/me and /api/profile
+app.config['USER_CACHE_SIZE'] = int(os.environ.get('USER_CACHE_SIZE', 1024))
+app.config['USER_CACHE_TTL'] = float(os.environ.get('USER_CACHE_TTL', 300))
+
+# Password hashing in a process pool: werkzeug method for new hashes (older
+# hashes are upgraded on login), processes (0 = one per CPU) and hashes queued
+# or running before further logins get a 503
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('PASSWORD_HASH_METHOD', 'scrypt')
+app.config['PASSWORD_HASH_WORKERS'] = int(os.environ.get('PASSWORD_HASH_WORKERS', 0))
+app.config['PASSWORD_HASH_QUEUE_DEPTH'] = int(os.environ.get('PASSWORD_HASH_QUEUE_DEPTH', 32))
+
+# Token buckets in front of login, register and change-password, per client IP
+# and per username: tokens refilled per second and bucket size
+app.config['AUTH_RATE_LIMIT'] = os.environ.get('AUTH_RATE_LIMIT', '1') == '1'
+app.config['AUTH_IP_RATE'] = float(os.environ.get('AUTH_IP_RATE', 1.0))
+app.config['AUTH_IP_BURST'] = int(os.environ.get('AUTH_IP_BURST', 60))
+app.config['AUTH_USERNAME_RATE'] = float(os.environ.get('AUTH_USERNAME_RATE', 0.1))
+app.config['AUTH_USERNAME_BURST'] = int(os.environ.get('AUTH_USERNAME_BURST', 10))
+
+# Account deletion: rows per DELETE transaction, and accounts with more moves
+# than this are deleted by a background job that reports its progress
+app.config['ACCOUNT_DELETE_CHUNK_SIZE'] = int(os.environ.get('ACCOUNT_DELETE_CHUNK_SIZE', 2000))
+app.config['ACCOUNT_DELETE_SYNC_MOVES'] = int(os.environ.get('ACCOUNT_DELETE_SYNC_MOVES', 5000))
+
+# In-memory store for guest games: size caps and seconds a game lives after its last write
+app.config['GUEST_STORE_MAX_GAMES'] = int(os.environ.get('GUEST_STORE_MAX_GAMES', 10000))
+app.config['GUEST_STORE_MAX_MOVES'] = int(os.environ.get('GUEST_STORE_MAX_MOVES', 200000))
+app.config['GUEST_STORE_MAX_MOVES_PER_GAME'] = int(os.environ.get('GUEST_STORE_MAX_MOVES_PER_GAME', 1000))
+app.config['GUEST_STORE_TTL'] = float(os.environ.get('GUEST_STORE_TTL', 86400))
+
+# Complete active games whose player to move has run out of time. Games timed
+# in the browser get FLAG_FALL_GRACE extra seconds, since the server only sees
+# their moves once they are synced and never sees a pause.
+app.config['FLAG_FALL_SCHEDULER'] = os.environ.get('FLAG_FALL_SCHEDULER', '1') == '1'
+app.config['FLAG_FALL_GRACE'] = float(os.environ.get('FLAG_FALL_GRACE', 120))
+app.config['FLAG_FALL_TICK'] = float(os.environ.get('FLAG_FALL_TICK', 1.0))
+
+# Opt-in instrumentation served at /api/metrics, plus a sampling profiler
+app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '0') == '1'
+app.config['PROFILER_ENABLED'] = os.environ.get('PROFILER_ENABLED', '0') == '1'
+app.config['PROFILER_INTERVAL'] = float(os.environ.get('PROFILER_INTERVAL', 0.005))
+
+# Serve src/static/ from memory, fingerprinted and precompressed. Set to 0 while
+# editing the static files so changes show up without a restart.
+app.config['STATIC_ASSET_CACHE'] = os.environ.get('STATIC_ASSET_CACHE', '1') == '1'
+
 # Create database tables
 with app.app_context():
     # Ensure database directory exists
     os.makedirs(os.path.join(os.path.dirname(__file__), 'database'), exist_ok=True)
+    apply_storage_profile(app, db)
     db.create_all()
+    # Add columns and indexes introduced after an existing app.db was created
+    ensure_columns()
+    ensure_indexes()
+    ensure_search_index()
+
+password_hasher.init_app(app)
+state_backend = create_state_backend(app)
+move_buffer.init_app(app)
+game_events.init_app(app, state_backend)
+clock_table.init_app(app, state_backend)
+stats_cache.init_app(app, state_backend)
+user_cache.init_app(app, state_backend)
+guest_store.init_app(app)
+flag_scheduler.init_app(app, state_backend)
+auth_limiter.init_app(app)
+account_deletions.init_app(app, state_backend)
+metrics.init_app(app, db)
+metrics.add_collector(user_cache.metrics)
+metrics.add_collector(move_buffer.metrics)
+metrics.add_collector(guest_store.metrics)
+metrics.add_collector(flag_scheduler.metrics)
+metrics.add_collector(password_hasher.metrics)
+metrics.add_collector(auth_limiter.metrics)
+assets.init_app(app)
+
+@app.cli.command('state-server')
+@click.option('--socket', 'path', default=None, help='Unix socket path (default: STATE_SOCKET)')
+def state_server_command(path):
+    # Shared state for worker processes started with STATE_BACKEND=socket
+    path = path or app.config['STATE_SOCKET']
+    print(f'State server listening on {path}')
+    serve_state(path)
+
+@app.cli.command('check-query-plans')
+def check_query_plans():
+    # Fails when any move_bp lookup falls back to a full table scan
+    failures = find_table_scans()
+    for name, plan in failures.items():
+        print(f'{name}: ' + ' | '.join(plan))
+    if failures:
+        raise SystemExit(1)
+    print('All route queries use indexes')
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    # Re-reads every game title and comment into the FTS index, e.g. after VACUUM
+    rebuild_search_index()
+    print('Game search index rebuilt')
+
+@app.cli.command('rebuild-analytics')
+@click.option('--user', 'username', default=None, help='Only this user (default: everyone)')
+def rebuild_analytics_command(username):
+    # Recomputes move timing analytics from the finished games, e.g. for games
+    # finished before the analytics tables existed
+    users = User.query.filter_by(username=username).all() if username else User.query.all()
+    if username and not users:
+        raise click.ClickException(f'No user named {username!r}')
+    games = sum(rebuild_user_analytics(user.id) for user in users)
+    print(f'Analytics rebuilt for {len(users)} users, {games} finished games')
+
+@app.cli.command('rebuild-replay-index')
+@click.option('--user', 'username', default=None, help='Only this user (default: everyone)')
+def rebuild_replay_index_command(username):
+    # Stores replay points for finished games, e.g. for games finished before
+    # the replay index existed; those are replayed from their moves until then
+    users = User.query.filter_by(username=username).all() if username else User.query.all()
+    if username and not users:
+        raise click.ClickException(f'No user named {username!r}')
+    games = sum(rebuild_user_replay_points(user.id) for user in users)
+    print(f'Replay index rebuilt for {len(users)} users, {games} finished games')
+
+@app.cli.command('purge-deleted-accounts')
+def purge_deleted_accounts_command():
+    # Finishes account deletions interrupted by a restart
+    user_ids = db.session.scalars(db.select(User.id).where(User.deleted_at.isnot(None))).all()
+    for user_id in user_ids:
+        deleted = {}
+        def progress(table, rows):
+            deleted[table] = deleted.get(table, 0) + rows
+        purge_user(user_id, app.config['ACCOUNT_DELETE_CHUNK_SIZE'], progress)
+        print(f'Account {user_id}: ' + (', '.join(f'{rows} {table} rows' for table, rows in deleted.items()) or 'no rows'))
+    print(f'{len(user_ids)} deleted accounts purged')
+
+@app.cli.command('import-games')
+@click.argument('paths', nargs=-1, required=True, type=click.Path(exists=True))
+@click.option('--user', 'username', required=True, help='Username that will own the games')
+@click.option('--workers', type=int, default=None, help='Parser processes (default: IMPORT_WORKERS)')
+@click.option('--batch-size', type=int, default=None, help='Games per transaction (default: IMPORT_BATCH_SIZE)')
+def import_games_command(paths, username, workers, batch_size):
+    # Loads SGF files and /api/export JSON; files or directories of them
+    user = User.query.filter_by(username=username).first()
+    if not user:
+        raise click.ClickException(f'No user named {username!r}')
+
+    files = import_paths(paths)
+    report = import_documents(
+        user.id,
+        [(path, None) for path in files],
+        workers=workers or app.config['IMPORT_WORKERS'],
+        batch_size=batch_size or app.config['IMPORT_BATCH_SIZE']
+    )
+    for error in report['errors']:
+        print(f"{error['document']}: {error['error']}")
+    print(f"{report['documents']} files, {report['games_parsed']} games parsed, "
+          f"{report['games_imported']} imported, {report['games_skipped']} already present, "
+          f"{report['games_conflicting']} owned by other users, {report['games_invalid']} invalid, "
+          f"{report['moves_imported']} moves in {report['seconds']}s "
+          f"({report['games_per_second']} games/s, {report['moves_per_second']} moves/s)")
+
+@app.cli.command('list-assets')
+def list_assets():
+    # Static files as served by the in-memory asset pipeline
+    if not assets.enabled:
+        print('STATIC_ASSET_CACHE is off; static files are served from disk')
+        return
+    for path, fingerprinted_path, sizes in assets.stats():
+        variants = ', '.join(f'{encoding} {size}' for encoding, size in sizes.items())
+        print(f'{path} -> /{fingerprinted_path} ({variants})')
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -39,6 +283,14 @@ def serve(path):
     if static_folder_path is None:
         return "Static folder not configured", 404
 
+    # In-memory copies with ETags and cache headers, including the root and
+    # login page aliases below
+    if assets.enabled:
+        response = assets.response('settings.html' if path in ("", "login.html") else path)
+        if response is None:
+            return "File not found", 404
+        return response
+
     # Redirect root and login to settings
     if path == "":
         return send_from_directory(static_folder_path, 'settings.html')
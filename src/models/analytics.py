@@ -0,0 +1,44 @@
+from datetime import datetime
+from .user import db
+
+class AnalyticsTotals:
+    # Additive move timing figures; one row per finished game and one per user
+    # holding the sum over their finished games
+    games = db.Column(db.Integer, nullable=False, default=0)
+    moves = db.Column(db.Integer, nullable=False, default=0)
+    total_time = db.Column(db.Float, nullable=False, default=0)
+    opening_moves = db.Column(db.Integer, nullable=False, default=0)
+    opening_time = db.Column(db.Float, nullable=False, default=0)
+    middlegame_moves = db.Column(db.Integer, nullable=False, default=0)
+    middlegame_time = db.Column(db.Float, nullable=False, default=0)
+    endgame_moves = db.Column(db.Integer, nullable=False, default=0)
+    endgame_time = db.Column(db.Float, nullable=False, default=0)
+    byoyomi_entries = db.Column(db.Integer, nullable=False, default=0)  # players who reached byo-yomi
+    byoyomi_entry_moves = db.Column(db.Integer, nullable=False, default=0)  # sum of the move numbers they reached it on
+    periods_used = db.Column(db.Integer, nullable=False, default=0)
+    trouble_moves = db.Column(db.Integer, nullable=False, default=0)
+    trouble_games = db.Column(db.Integer, nullable=False, default=0)
+
+class GameAnalytics(AnalyticsTotals, db.Model):
+    __tablename__ = 'game_analytics'
+
+    game_id = db.Column(db.String(36), db.ForeignKey('games.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    time_counts = db.Column(db.LargeBinary, nullable=False)  # packed (seconds, moves) pairs
+    players = db.Column(db.JSON, nullable=False)  # per color figures
+    computed_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UserAnalytics(AnalyticsTotals, db.Model):
+    __tablename__ = 'user_analytics'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class UserMoveTime(db.Model):
+    # How many of a user's moves in finished games took each whole number of
+    # seconds; summing counts makes the per-user percentiles exact
+    __tablename__ = 'user_move_times'
+
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    seconds = db.Column(db.Integer, primary_key=True)
+    moves = db.Column(db.Integer, nullable=False, default=0)
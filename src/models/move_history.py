@@ -4,6 +4,10 @@ from .user import db
 
 class MoveHistory(db.Model):
     __tablename__ = 'move_history'
+    __table_args__ = (
+        # Serves per-game move listings and per-user aggregates without a table scan
+        db.Index('ix_move_history_user_game_move', 'user_id', 'game_id', 'move_number'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
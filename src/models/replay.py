@@ -0,0 +1,27 @@
+from .user import db
+
+class ReplayPoint(db.Model):
+    # Both players' clocks after each move of a finished game, with the time
+    # played so far; point 0 is the start of the game (see src/services/replay.py)
+    __tablename__ = 'game_replay_points'
+    __table_args__ = (
+        db.Index('ix_game_replay_points_game_move', 'game_id', 'move_number', unique=True),
+        # Seeking by time: the last point at or before a number of seconds
+        db.Index('ix_game_replay_points_game_elapsed', 'game_id', 'elapsed', 'move_number'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    game_id = db.Column(db.String(36), db.ForeignKey('games.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    move_number = db.Column(db.Integer, nullable=False)
+    elapsed = db.Column(db.Integer, nullable=False)  # seconds played up to and including this move
+    player_color = db.Column(db.String(10), nullable=True)  # who made this move; null at point 0
+    to_move = db.Column(db.String(10), nullable=True)  # who moves next; null after the last move
+    black_main_time_remaining = db.Column(db.Integer, nullable=False)
+    black_byoyomi_time_remaining = db.Column(db.Integer, nullable=False)
+    black_byoyomi_periods_remaining = db.Column(db.Integer, nullable=False)
+    black_in_byoyomi = db.Column(db.Boolean, nullable=False)
+    white_main_time_remaining = db.Column(db.Integer, nullable=False)
+    white_byoyomi_time_remaining = db.Column(db.Integer, nullable=False)
+    white_byoyomi_periods_remaining = db.Column(db.Integer, nullable=False)
+    white_in_byoyomi = db.Column(db.Boolean, nullable=False)
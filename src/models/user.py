@@ -1,7 +1,8 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from src.services.storage import RoutingSession
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -11,6 +12,8 @@ class User(db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False)
     password_hash = db.Column(db.String(255), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    deleted_at = db.Column(db.DateTime, nullable=True)  # set while the account's rows are being deleted
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # see src/services/revisions.py
     
     # Relationships
     games = db.relationship('Game', backref='user', lazy=True, cascade='all, delete-orphan')
@@ -26,6 +29,12 @@ class User(db.Model):
 
 class Game(db.Model):
     __tablename__ = 'games'
+    __table_args__ = (
+        # Keyset pagination of the game history walks (created_at, id) per user
+        db.Index('ix_games_user_created_id', 'user_id', 'created_at', 'id'),
+        db.Index('ix_games_user_status', 'user_id', 'status'),
+        db.Index('ix_games_user_winner', 'user_id', 'winner'),
+    )
     
     id = db.Column(db.String(36), primary_key=True)  # UUID
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -39,11 +48,65 @@ class Game(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     completed_at = db.Column(db.DateTime, nullable=True)
     saved_at = db.Column(db.DateTime, nullable=True)
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # see src/services/revisions.py
+    
+    # Flag-fall detection (see src/services/flag_fall.py). Games stored before
+    # the scheduler existed, imported games and games first uploaded by /sync
+    # get flag_fall = False and are never completed by it. paused_at is set while the browser clock is paused.
+    flag_fall = db.Column(db.Boolean, nullable=False, default=True, server_default='0')
+    paused_at = db.Column(db.DateTime, nullable=True)
+    resumed_at = db.Column(db.DateTime, nullable=True)
+    
+    # Packed moves of an archived game (see src/services/move_archive.py). The
+    # blob is only loaded when a route asks for the move timeline.
+    moves_archive = db.deferred(db.Column(db.LargeBinary, nullable=True))
+    archived_move_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    archived_move_time = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    
+    # Number of move_history rows, loaded with the game by user_games_query()
+    move_row_count = db.query_expression()
     
     # Relationships
     moves = db.relationship('MoveHistory', backref='game', lazy=True, cascade='all, delete-orphan')
     
-    def to_dict(self):
+    @staticmethod
+    def owned_query(user_id, game_id):
+        # A user's game by id, as the routes and schema.route_queries() look it up
+        return Game.query.filter_by(id=game_id, user_id=user_id)
+    
+    @staticmethod
+    def status_query(user_id, game_id):
+        # Status of a user's game, checked before its moves are stored; None
+        # once the account is marked deleted
+        return db.select(Game.status).join(User, User.id == Game.user_id).where(
+            Game.id == game_id, Game.user_id == user_id, User.deleted_at.is_(None)
+        )
+    
+    @staticmethod
+    def move_counts(user_id, game_ids):
+        # One GROUP BY query instead of loading every move of every game
+        if not game_ids:
+            return {}
+        rows = Game.move_counts_query(user_id, game_ids).all()
+        return dict(rows)
+    
+    @staticmethod
+    def move_counts_query(user_id, game_ids):
+        from .move_history import MoveHistory
+        return db.session.query(
+            MoveHistory.game_id, db.func.count(MoveHistory.id)
+        ).filter(
+            MoveHistory.user_id == user_id,
+            MoveHistory.game_id.in_(game_ids)
+        ).group_by(MoveHistory.game_id)
+    
+    def to_dict(self, move_count=None):
+        if move_count is None:
+            move_count = Game.move_counts(self.user_id, [self.id]).get(self.id, 0)
+        
+        # move_count covers the move_history rows; archived moves are counted here
+        move_count += self.archived_move_count or 0
+        
         return {
             'id': self.id,
             'user_id': self.user_id,
@@ -57,6 +120,6 @@ class Game(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'completed_at': self.completed_at.isoformat() if self.completed_at else None,
             'saved_at': self.saved_at.isoformat() if self.saved_at else None,
-            'move_count': len(self.moves) if self.moves else 0
+            'move_count': move_count
         }
 
@@ -1,6 +1,9 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, current_app, request, jsonify, session
 from src.models.user import User, db
-from werkzeug.security import check_password_hash, generate_password_hash
+from src.services.user_cache import user_cache
+from src.services.guest_store import promote_guest_games
+from src.services.passwords import password_hasher, PasswordHasherBusy
+from src.services.rate_limit import auth_limiter
 import uuid
 
 auth_bp = Blueprint('auth', __name__)
@@ -10,6 +13,11 @@ def register():
     try:
         data = request.get_json()
         
+        # Token buckets per client IP and per username (see src/services/rate_limit.py)
+        limited = auth_limiter.refuse(data.get('username') if isinstance(data, dict) else None)
+        if limited:
+            return limited
+        
         if not data or not all(k in data for k in ('username', 'email', 'password')):
             return jsonify({'error': 'Missing required fields'}), 400
         
@@ -31,11 +39,13 @@ def register():
         user = User(
             username=data['username'],
             email=data['email'],
-            password_hash=generate_password_hash(data['password'])
+            password_hash=password_hasher.hash(data['password'])
         )
         
         db.session.add(user)
         db.session.commit()
+        user_cache.put(user.id, user.to_dict())
+        promoted_games = _promote_guest_games(user.id)
         
         # Log in the user
         session['user_id'] = user.id
@@ -44,9 +54,12 @@ def register():
         
         return jsonify({
             'message': 'User registered successfully',
-            'user': user.to_dict()
+            'user': user.to_dict(),
+            'promoted_games': promoted_games
         }), 201
         
+    except PasswordHasherBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Registration failed'}), 500
@@ -56,26 +69,52 @@ def login():
     try:
         data = request.get_json()
         
+        limited = auth_limiter.refuse(data.get('username') if isinstance(data, dict) else None)
+        if limited:
+            return limited
+        
         if not data or not all(k in data for k in ('username', 'password')):
             return jsonify({'error': 'Missing username or password'}), 400
         
-        user = User.query.filter_by(username=data['username']).first()
+        user = User.query.filter_by(username=data['username'], deleted_at=None).first()
+        matches, new_hash = password_hasher.verify(user.password_hash, data['password']) if user else (False, None)
         
-        if user and check_password_hash(user.password_hash, data['password']):
+        if matches:
+            # Upgrade a hash made with an older PASSWORD_HASH_METHOD
+            if new_hash:
+                user.password_hash = new_hash
+                db.session.commit()
+            promoted_games = _promote_guest_games(user.id)
             session['user_id'] = user.id
             session['username'] = user.username
             session['is_guest'] = False
+            user_cache.put(user.id, user.to_dict())
             
             return jsonify({
                 'message': 'Login successful',
-                'user': user.to_dict()
+                'user': user.to_dict(),
+                'promoted_games': promoted_games
             }), 200
         
         return jsonify({'error': 'Invalid username or password'}), 401
         
+    except PasswordHasherBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
+        db.session.rollback()
         return jsonify({'error': 'Login failed'}), 500
 
+def _promote_guest_games(user_id):
+    # Games played in this guest session become the account's games
+    if not session.get('is_guest', False):
+        return 0
+    try:
+        return promote_guest_games(session['user_id'], user_id)
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('Failed to promote guest games')
+        return 0
+
 @auth_bp.route('/guest', methods=['POST'])
 def guest_login():
     try:
@@ -119,14 +158,29 @@ def get_current_user():
             'is_guest': session.get('is_guest', False)
         }
         
-        # If not a guest, get additional user info
+        # If not a guest, get additional user info (cached per user)
         if not session.get('is_guest', False):
-            user = User.query.get(session['user_id'])
-            if user:
-                user_data.update(user.to_dict())
+            profile = user_cache.get(session['user_id'])
+            if not profile:
+                # Deleted from another device
+                session.clear()
+                return jsonify({'error': 'Not authenticated'}), 401
+            user_data.update(profile)
         
         return jsonify(user_data), 200
         
     except Exception as e:
         return jsonify({'error': 'Failed to get user info'}), 500
 
+@auth_bp.route('/cache-stats', methods=['GET'])
+def get_cache_stats():
+    try:
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not authenticated'}), 401
+        
+        # Hit/miss counters of this worker process's user profile cache
+        return jsonify(user_cache.stats()), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to get cache stats'}), 500
+
@@ -1,11 +1,41 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, Response, current_app, request, jsonify, session, stream_with_context
 from src.models.user import db, Game
-from src.models.move_history import MoveHistory
+from src.services.move_buffer import move_buffer, move_row, insert_moves, MoveDataError
+from src.services.stats_cache import stats_cache, format_user_stats
+from src.services.clock import (
+    clock_table, persist_finished_game, finish_game, mark_game_completed, ClockError, COLORS
+)
+from src.services.events import game_events, format_sse, move_delta
+from src.services.move_archive import game_moves, game_moves_query, moves_to_columns
+from src.services.game_history import parse_game_query, user_games_query, page_games, GameQueryError
+from src.services.export import EXPORT_FORMATS, iter_game_chunks, iter_ndjson, iter_csv, gzip_stream
+from src.services.game_import import import_documents
+from src.services.move_sync import (
+    parse_sync_request, sync_game, sync_pause, sync_moves, SyncError, GameFinishedError
+)
+from src.services.guest_store import guest_store, GuestStoreError
+from src.services.user_cache import account_deleted
+from src.services.flag_fall import flag_scheduler
+from src.services.replay import parse_replay_query, game_replay, moves_game_replay, ReplayQueryError
+from src.services.revisions import (
+    bump_game, bump_user, game_revision, user_revision, make_etag, games_etag, not_modified, with_etag
+)
+from src.services.analytics import (
+    game_analytics, user_analytics, moves_game_analytics, moves_user_analytics
+)
 import uuid
 from datetime import datetime
 
 move_bp = Blueprint('move', __name__)
 
+@move_bp.before_request
+def refuse_deleted_accounts():
+    # Moves and games of an account being deleted would outlive its purge
+    if request.method != 'GET' and 'user_id' in session and not session.get('is_guest', False):
+        if account_deleted(session['user_id']):
+            session.clear()
+            return jsonify({'error': 'Not authenticated'}), 401
+
 @move_bp.route('/games/new', methods=['POST'])
 def create_new_game():
     try:
@@ -27,7 +57,14 @@ def create_new_game():
             )
             
             db.session.add(game)
+            bump_user(session['user_id'])
             db.session.commit()
+            stats_cache.invalidate(session['user_id'])
+            # Times the game out if the browser never reports its end
+            flag_scheduler.watch_game(game)
+        else:
+            # Guest games live in the in-memory guest store
+            guest_store.create_game(session['user_id'], game_id, data)
         
         return jsonify({'game_id': game_id}), 201
         
@@ -41,52 +78,172 @@ def save_move(game_id):
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
         
-        # Don't save moves for guest users
-        if session.get('is_guest', False):
-            return jsonify({'message': 'Move not saved (guest mode)'}), 200
-        
         data = request.get_json()
         
         if not data or not all(k in data for k in ('move_number', 'player_color', 'time_taken')):
             return jsonify({'error': 'Missing required move data'}), 400
         
-        move = MoveHistory(
-            user_id=session['user_id'],
-            game_id=game_id,
-            move_number=data['move_number'],
-            player_color=data['player_color'],
-            time_taken=data['time_taken'],
-            main_time_remaining=data.get('main_time_remaining', 0),
-            byoyomi_time_remaining=data.get('byoyomi_time_remaining', 0),
-            byoyomi_periods_remaining=data.get('byoyomi_periods_remaining', 0),
-            in_byoyomi=data.get('in_byoyomi', False)
-        )
+        row = move_row(data, session['user_id'], game_id)
         
-        db.session.add(move)
-        db.session.commit()
+        # Guest moves go to the in-memory guest store
+        if session.get('is_guest', False):
+            guest_store.add_moves(session['user_id'], game_id, [row])
+            game_events.publish(game_id, 'move', move_delta(row))
+            return jsonify({'message': 'Move saved (guest mode)'}), 201
+        
+        # Only into the user's own active games
+        status = db.session.scalar(Game.status_query(session['user_id'], game_id))
+        if status is None:
+            return jsonify({'error': 'Game not found'}), 404
+        if status != 'active':
+            return jsonify({'error': 'Game is already finished'}), 409
+        
+        # Let the write-behind buffer group this insert with other games' moves
+        if move_buffer.enabled:
+            move_buffer.add(row)
+            game_events.publish(game_id, 'move', move_delta(row))
+            return jsonify({'message': 'Move queued'}), 202
+        
+        insert_moves([row])
+        game_events.publish(game_id, 'move', move_delta(row))
         
         return jsonify({'message': 'Move saved successfully'}), 201
         
+    except (MoveDataError, GuestStoreError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to save move'}), 500
 
-@move_bp.route('/games/<game_id>/moves', methods=['GET'])
-def get_game_moves(game_id):
+@move_bp.route('/games/<game_id>/moves:batch', methods=['POST'])
+def save_moves_batch(game_id):
+    try:
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not authenticated'}), 401
+        
+        data = request.get_json()
+        moves = data.get('moves') if isinstance(data, dict) else data
+        
+        if not isinstance(moves, list) or not moves:
+            return jsonify({'error': 'Expected a non-empty list of moves'}), 400
+        
+        if not all(isinstance(m, dict) and all(k in m for k in ('move_number', 'player_color', 'time_taken')) for m in moves):
+            return jsonify({'error': 'Missing required move data'}), 400
+        
+        rows = [move_row(m, session['user_id'], game_id) for m in moves]
+        
+        if session.get('is_guest', False):
+            guest_store.add_moves(session['user_id'], game_id, rows)
+            game_events.publish(game_id, 'moves', [move_delta(row) for row in rows])
+            return jsonify({'message': 'Moves saved (guest mode)', 'count': len(rows)}), 201
+        
+        status = db.session.scalar(Game.status_query(session['user_id'], game_id))
+        if status is None:
+            return jsonify({'error': 'Game not found'}), 404
+        if status != 'active':
+            return jsonify({'error': 'Game is already finished'}), 409
+        
+        # Buffered single moves must land before this batch to keep move order
+        if move_buffer.enabled:
+            move_buffer.flush()
+        
+        insert_moves(rows)
+        game_events.publish(game_id, 'moves', [move_delta(row) for row in rows])
+        
+        return jsonify({'message': 'Moves saved successfully', 'count': len(rows)}), 201
+        
+    except (MoveDataError, GuestStoreError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to save moves'}), 500
+
+@move_bp.route('/games/<game_id>/sync', methods=['POST'])
+def sync_game_moves(game_id):
     try:
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
         
-        # Return empty array for guest users
+        since, moves, settings, paused = parse_sync_request(request.get_json(silent=True))
+        
+        # Guest games sync against the in-memory guest store
         if session.get('is_guest', False):
-            return jsonify([])
+            rows = [move_row(m, session['user_id'], game_id) for m in moves]
+            return jsonify(guest_store.sync(session['user_id'], game_id, since, rows, settings)), 200
+        
+        # Buffered single moves count as stored for conflict resolution
+        if move_buffer.enabled:
+            move_buffer.flush()
+        
+        # Created from the client's settings if the game was started offline
+        game = sync_game(session['user_id'], game_id, settings)
+        if not game:
+            return jsonify({'error': 'Game not found'}), 404
+        
+        result, inserted = sync_moves(game, since, moves)
+        if inserted:
+            game_events.publish(game_id, 'moves', [move_delta(row) for row in inserted])
+        
+        # After the moves, which already restart a paused clock
+        sync_pause(game, paused)
+        
+        return jsonify(result), 200
+        
+    except GameFinishedError as e:
+        return jsonify({'error': str(e)}), 409
+    except (SyncError, MoveDataError, GuestStoreError) as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to sync moves'}), 500
+
+@move_bp.route('/games/<game_id>/moves', methods=['GET'])
+def get_game_moves(game_id):
+    try:
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not authenticated'}), 401
         
-        moves = MoveHistory.query.filter_by(
-            user_id=session['user_id'],
-            game_id=game_id
-        ).order_by(MoveHistory.move_number).all()
+        # ?since_move=N returns only the moves numbered after N
+        since = request.args.get('since_move')
+        if since is not None:
+            if not since.isdigit():
+                return jsonify({'error': 'since_move must be a non-negative integer'}), 400
+            since = int(since)
         
-        return jsonify([move.to_dict() for move in moves])
+        if session.get('is_guest', False):
+            guest_game = guest_store.game(session['user_id'], game_id, with_moves=True)
+            moves = guest_game['moves'] if guest_game else []
+            if since is not None:
+                moves = [move for move in moves if move['move_number'] > since]
+            moves += _clock_moves(game_id, since)
+            if request.args.get('format') == 'columns':
+                return jsonify(moves_to_columns(moves))
+            return jsonify(moves)
+        
+        # Make sure moves still sitting in the write-behind buffer are visible
+        move_buffer.flush()
+        
+        # The game's revision identifies the response before any move is loaded
+        revision = game_revision(session['user_id'], game_id)
+        etag = None
+        if revision is not None:
+            etag = make_etag('moves', game_id, revision, _clock_version(game_id), since, request.args.get('format'))
+            cached = not_modified(etag)
+            if cached:
+                return cached
+        
+            game = Game.owned_query(session['user_id'], game_id).options(db.undefer(Game.moves_archive)).first()
+            moves = game_moves(game, since)
+        else:
+            moves = [move.to_dict() for move in game_moves_query(session['user_id'], game_id, since).all()]
+        
+        moves += _clock_moves(game_id, since)
+        if request.args.get('format') == 'columns':
+            response = jsonify(moves_to_columns(moves))
+        else:
+            response = jsonify(moves)
+        
+        return with_etag(response, etag) if etag else response
         
     except Exception as e:
         return jsonify({'error': 'Failed to get moves'}), 500
@@ -97,25 +254,33 @@ def complete_game(game_id):
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
         
-        # Don't update games for guest users
-        if session.get('is_guest', False):
-            return jsonify({'message': 'Game not updated (guest mode)'}), 200
+        # Stop the server clock if one is running and keep the moves it recorded
+        if _owned_clock(game_id):
+            state = clock_table.finish(game_id)
+            if state and state.persist and state.moves:
+                insert_moves(state.moves)
         
         data = request.get_json()
         
-        game = Game.query.filter_by(
-            id=game_id,
-            user_id=session['user_id']
-        ).first()
+        if session.get('is_guest', False):
+            guest_game = guest_store.update_game(
+                session['user_id'], game_id,
+                status='completed',
+                winner=data.get('winner'),
+                completed_at=datetime.utcnow()
+            )
+            if not guest_game:
+                return jsonify({'error': 'Game not found'}), 404
+            game_events.publish(game_id, 'complete', {'winner': guest_game['winner']})
+            return jsonify({'message': 'Game completed successfully'}), 200
+        
+        game = Game.owned_query(session['user_id'], game_id).first()
         
         if not game:
             return jsonify({'error': 'Game not found'}), 404
         
-        game.status = 'completed'
-        game.winner = data.get('winner')  # 'white', 'black', or None for draw
-        game.completed_at = datetime.utcnow()
-        
-        db.session.commit()
+        mark_game_completed(game, data.get('winner'))
+        game_events.publish(game_id, 'complete', {'winner': game.winner})
         
         return jsonify({'message': 'Game completed successfully'}), 200
         
@@ -123,23 +288,202 @@ def complete_game(game_id):
         db.session.rollback()
         return jsonify({'error': 'Failed to complete game'}), 500
 
-@move_bp.route('/games', methods=['GET'])
-def get_user_games():
+def _owned_clock(game_id, with_moves=False):
+    state = clock_table.get(game_id, with_moves)
+    if state is None or state.user_id != session['user_id']:
+        return None
+    return state
+
+def _owns_game(game_id):
+    # The session's own running clock, guest game or stored game
+    if _owned_clock(game_id):
+        return True
+    if session.get('is_guest', False):
+        return guest_store.game(session['user_id'], game_id) is not None
+    return db.session.scalar(Game.status_query(session['user_id'], game_id)) is not None
+
+def _clock_moves(game_id, since=None):
+    # Moves of a running server clock are only written once the game finishes
+    state = _owned_clock(game_id, with_moves=True)
+    if not state:
+        return []
+    return [
+        dict(move, id=None, created_at=move['created_at'].isoformat())
+        for move in state.moves
+        if since is None or move['move_number'] > since
+    ]
+
+def _clock_version(game_id):
+    # Part of the ETags of responses that include _clock_moves()
+    state = _owned_clock(game_id)
+    return state.move_number if state else None
+
+@move_bp.route('/games/<game_id>/clock', methods=['POST'])
+def start_clock(game_id):
     try:
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
         
-        # Return empty array for guest users
-        if session.get('is_guest', False):
-            return jsonify([])
+        data = request.get_json(silent=True) or {}
+        is_guest = session.get('is_guest', False)
+        
+        game = None
+        if not is_guest:
+            game = Game.owned_query(session['user_id'], game_id).first()
+        
+        # Registered games keep the time control they were created with
+        if game:
+            settings = (game.main_time, game.byoyomi_time, game.byoyomi_periods)
+        else:
+            settings = (
+                data.get('main_time', 600),
+                data.get('byoyomi_time', 30),
+                data.get('byoyomi_periods', 3)
+            )
+        
+        state = clock_table.start(game_id, session['user_id'], *settings, persist=not is_guest)
+        clock_data = state.to_dict(clock_table.clock())
+        game_events.publish(game_id, 'clock', clock_data)
+        
+        return jsonify(clock_data), 201
+        
+    except ClockError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': 'Failed to start clock'}), 500
+
+@move_bp.route('/games/<game_id>/clock', methods=['GET'])
+def get_clock(game_id):
+    try:
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not authenticated'}), 401
+        
+        state = _owned_clock(game_id)
+        if not state:
+            return jsonify({'error': 'No running clock for this game'}), 404
+        
+        return jsonify(state.to_dict(clock_table.clock()))
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to get clock'}), 500
+
+@move_bp.route('/games/<game_id>/clock/press', methods=['POST'])
+def press_clock(game_id):
+    try:
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not authenticated'}), 401
+        
+        if not _owned_clock(game_id):
+            return jsonify({'error': 'No running clock for this game'}), 404
+        
+        data = request.get_json(silent=True) or {}
+        state, move = clock_table.press(game_id, data.get('player_color'))
+        clock_data = state.to_dict(clock_table.clock())
+        
+        # The press came after the flag fell: the other player wins on time
+        if move is None:
+            state = clock_table.finish(game_id) or state
+            winner = COLORS[1 - state.current]
+            persist_finished_game(state, winner)
+            clock_data['winner'] = winner
+            game_events.publish(game_id, 'complete', {'winner': winner, 'flagged': clock_data['flagged']})
+            return jsonify(clock_data), 200
+        
+        clock_data['move'] = {k: v for k, v in move.items() if k != 'created_at'}
+        game_events.publish(game_id, 'move', move_delta(move))
+        return jsonify(clock_data), 200
+        
+    except ClockError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to press clock'}), 500
+
+@move_bp.route('/games/<game_id>/clock/pause', methods=['POST'])
+def pause_clock(game_id):
+    try:
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not authenticated'}), 401
+        
+        if not _owned_clock(game_id):
+            return jsonify({'error': 'No running clock for this game'}), 404
+        
+        state = clock_table.pause(game_id)
+        clock_data = state.to_dict(clock_table.clock())
+        game_events.publish(game_id, 'clock', clock_data)
         
-        # Get games for the user, ordered by creation date (newest first)
-        games = Game.query.filter_by(
-            user_id=session['user_id']
-        ).order_by(Game.created_at.desc()).limit(20).all()
+        return jsonify(clock_data)
+        
+    except ClockError as e:
+        return jsonify({'error': str(e)}), 409
+    except Exception as e:
+        return jsonify({'error': 'Failed to pause clock'}), 500
+
+@move_bp.route('/games/<game_id>/events', methods=['GET'])
+def stream_game_events(game_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    if not _owns_game(game_id):
+        return jsonify({'error': 'Game not found'}), 404
+    
+    keepalive = current_app.config.get('EVENT_KEEPALIVE_INTERVAL', 15)
+    state = clock_table.get(game_id, with_moves=False)
+    snapshot = state.to_dict(clock_table.clock()) if state else None
+    subscriber = game_events.subscribe(game_id)
+    
+    def stream():
+        try:
+            # Start viewers from the current clock so deltas have a base
+            if snapshot:
+                yield format_sse('clock', snapshot)
+            while True:
+                message = subscriber.next(keepalive)
+                # Comment lines keep idle connections open through proxies
+                yield message if message is not None else ': keepalive\n\n'
+        finally:
+            game_events.unsubscribe(game_id, subscriber)
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@move_bp.route('/games', methods=['GET'])
+def get_user_games():
+    try:
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not authenticated'}), 401
         
-        return jsonify([game.to_dict() for game in games])
+        params = parse_game_query(request.args)
         
+        etag = None
+        if session.get('is_guest', False):
+            game_data, next_cursor = guest_store.games(session['user_id'], params)
+        else:
+            move_buffer.flush()
+        
+            # The user's revision identifies the page before any game is loaded
+            revision = user_revision(session['user_id'])
+            if revision is not None:
+                etag = games_etag(session['user_id'], revision, request.query_string)
+                cached = not_modified(etag)
+                if cached:
+                    return cached
+        
+            # Get one page of the user's games, newest first
+            games = db.session.scalars(user_games_query(session['user_id'], params)).all()
+            games, next_cursor = page_games(games, params['limit'])
+            game_data = [game.to_dict(move_count=game.move_row_count) for game in games]
+        
+        response = jsonify(game_data)
+        # Pass this back as ?cursor= to fetch the next page
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return with_etag(response, etag) if etag else response
+        
+    except GameQueryError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': 'Failed to get games'}), 500
 
@@ -149,88 +493,215 @@ def get_game_details(game_id):
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
         
-        # Return empty object for guest users
+        etag = None
         if session.get('is_guest', False):
-            return jsonify({})
+            game_data = guest_store.game(session['user_id'], game_id, with_moves=True)
+            if not game_data:
+                return jsonify({'error': 'Game not found'}), 404
+            move_data = game_data.pop('moves') + _clock_moves(game_id)
+        else:
+            move_buffer.flush()
         
-        game = Game.query.filter_by(
-            id=game_id,
-            user_id=session['user_id']
-        ).first()
+            # The game's revision identifies the response before the game is loaded
+            revision = game_revision(session['user_id'], game_id)
+            if revision is None:
+                return jsonify({'error': 'Game not found'}), 404
         
-        if not game:
-            return jsonify({'error': 'Game not found'}), 404
+            etag = make_etag('game', game_id, revision, _clock_version(game_id), request.args.get('format'))
+            cached = not_modified(etag)
+            if cached:
+                return cached
+        
+            game = Game.owned_query(session['user_id'], game_id).options(db.undefer(Game.moves_archive)).first()
         
-        game_data = game.to_dict()
+            if not game:
+                return jsonify({'error': 'Game not found'}), 404
         
-        # Include move history
-        moves = MoveHistory.query.filter_by(
-            game_id=game_id,
-            user_id=session['user_id']
-        ).order_by(MoveHistory.move_number).all()
+            # Include move history, unpacking archived moves
+            move_data = game_moves(game) + _clock_moves(game_id)
+            game_data = game.to_dict(move_count=0)
         
-        game_data['moves'] = [move.to_dict() for move in moves]
+        game_data['move_count'] = len(move_data)
+        if request.args.get('format') == 'columns':
+            game_data['moves'] = moves_to_columns(move_data)
+        else:
+            game_data['moves'] = move_data
         
-        return jsonify(game_data)
+        response = jsonify(game_data)
+        return with_etag(response, etag) if etag else response
         
     except Exception as e:
         return jsonify({'error': 'Failed to get game details'}), 500
 
+@move_bp.route('/export', methods=['GET'])
+def export_history():
+    try:
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not authenticated'}), 401
+        
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+        
+        # Guest users have no stored history, so they get an empty export
+        if session.get('is_guest', False):
+            chunks = iter(())
+        else:
+            move_buffer.flush()
+            chunks = iter_game_chunks(session['user_id'], current_app.config.get('EXPORT_CHUNK_SIZE', 100))
+        
+        body = iter_ndjson(chunks) if export_format == 'ndjson' else iter_csv(chunks)
+        headers = {
+            'Content-Disposition': f'attachment; filename="go-timer-history.{export_format}"',
+            'Vary': 'Accept-Encoding'
+        }
+        if request.accept_encodings['gzip']:
+            body = gzip_stream(body)
+            headers['Content-Encoding'] = 'gzip'
+        
+        # Generated chunk by chunk while the response is being sent
+        return Response(stream_with_context(body), mimetype=EXPORT_FORMATS[export_format], headers=headers)
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to export history'}), 500
+
+@move_bp.route('/import', methods=['POST'])
+def import_games():
+    try:
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not authenticated'}), 401
+        
+        # Don't import games for guest users
+        if session.get('is_guest', False):
+            return jsonify({'message': 'Games not imported (guest mode)'}), 200
+        
+        # Multipart uploads under "files", or a single SGF/JSON document as the body
+        documents = [(f.filename, f.read()) for f in request.files.getlist('files')]
+        if not documents and request.content_length:
+            documents = [(request.args.get('filename', ''), request.get_data())]
+        
+        if not documents:
+            return jsonify({'error': 'No SGF or JSON documents uploaded'}), 400
+        
+        # Parsed on this thread: forking a parser pool per request would let
+        # concurrent uploads start any number of processes
+        report = import_documents(
+            session['user_id'],
+            documents,
+            workers=1,
+            batch_size=current_app.config.get('IMPORT_BATCH_SIZE', 500)
+        )
+        
+        return jsonify(report), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to import games'}), 500
+
 @move_bp.route('/stats', methods=['GET'])
 def get_user_stats():
     try:
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
         
-        # Return empty stats for guest users
+        # Guest stats come from the in-memory guest store
         if session.get('is_guest', False):
-            return jsonify({
-                'total_games': 0,
-                'completed_games': 0,
-                'total_moves': 0,
-                'average_move_time': 0,
-                'wins_as_white': 0,
-                'wins_as_black': 0
-            })
+            return jsonify(format_user_stats(guest_store.user_stats(session['user_id'])))
+        
+        move_buffer.flush()
+        
+        # Served from the per-user cache after the first hit. The cache is
+        # updated just after a move's commit, not with it, so the ETag comes
+        # from the numbers themselves rather than from the user's revision.
+        stats = format_user_stats(stats_cache.get(session['user_id']))
+        etag = make_etag('stats', session['user_id'], sorted(stats.items()))
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        return with_etag(jsonify(stats), etag)
         
-        # Calculate user statistics
-        total_games = Game.query.filter_by(user_id=session['user_id']).count()
-        completed_games = Game.query.filter_by(
-            user_id=session['user_id'],
-            status='completed'
-        ).count()
+    except Exception as e:
+        return jsonify({'error': 'Failed to get stats'}), 500
+
+@move_bp.route('/analytics', methods=['GET'])
+def get_user_analytics():
+    try:
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not authenticated'}), 401
         
-        total_moves = MoveHistory.query.filter_by(user_id=session['user_id']).count()
+        if session.get('is_guest', False):
+            return jsonify(moves_user_analytics(guest_store.games_with_moves(session['user_id'])))
+        
+        # Totals over finished games, kept up to date as games finish
+        return jsonify(user_analytics(session['user_id']))
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to get analytics'}), 500
+
+@move_bp.route('/games/<game_id>/analytics', methods=['GET'])
+def get_game_analytics(game_id):
+    try:
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not authenticated'}), 401
         
-        # Calculate average move time
-        avg_time_result = db.session.query(
-            db.func.avg(MoveHistory.time_taken)
-        ).filter_by(user_id=session['user_id']).scalar()
+        if session.get('is_guest', False):
+            game_data = guest_store.game(session['user_id'], game_id, with_moves=True)
+            if not game_data:
+                return jsonify({'error': 'Game not found'}), 404
+            return jsonify(moves_game_analytics(game_data))
         
-        average_move_time = round(avg_time_result, 2) if avg_time_result else 0
+        game = Game.owned_query(session['user_id'], game_id).first()
         
-        # Count wins
-        wins_as_white = Game.query.filter_by(
-            user_id=session['user_id'],
-            winner='white'
-        ).count()
+        if not game:
+            return jsonify({'error': 'Game not found'}), 404
         
-        wins_as_black = Game.query.filter_by(
-            user_id=session['user_id'],
-            winner='black'
-        ).count()
+        move_buffer.flush()
         
-        return jsonify({
-            'total_games': total_games,
-            'completed_games': completed_games,
-            'total_moves': total_moves,
-            'average_move_time': average_move_time,
-            'wins_as_white': wins_as_white,
-            'wins_as_black': wins_as_black
-        })
+        return jsonify(game_analytics(game))
         
     except Exception as e:
-        return jsonify({'error': 'Failed to get stats'}), 500
+        return jsonify({'error': 'Failed to get game analytics'}), 500
+
+@move_bp.route('/games/<game_id>/replay', methods=['GET'])
+def get_game_replay(game_id):
+    try:
+        if 'user_id' not in session:
+            return jsonify({'error': 'Not authenticated'}), 401
+        
+        # ?move=N or ?elapsed=seconds
+        move_number, elapsed = parse_replay_query(request.args)
+        
+        if session.get('is_guest', False):
+            game_data = guest_store.game(session['user_id'], game_id, with_moves=True)
+            if not game_data:
+                return jsonify({'error': 'Game not found'}), 404
+            return jsonify(moves_game_replay(game_data, move_number, elapsed))
+        
+        move_buffer.flush()
+        
+        # The game's revision identifies the response before the game is loaded
+        revision = game_revision(session['user_id'], game_id)
+        if revision is None:
+            return jsonify({'error': 'Game not found'}), 404
+        
+        etag = make_etag('replay', game_id, revision, move_number, elapsed)
+        cached = not_modified(etag)
+        if cached:
+            return cached
+        
+        game = Game.owned_query(session['user_id'], game_id).first()
+        
+        if not game:
+            return jsonify({'error': 'Game not found'}), 404
+        
+        # One indexed lookup for finished games
+        return with_etag(jsonify(game_replay(game, move_number, elapsed)), etag)
+        
+    except ReplayQueryError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': 'Failed to get game replay'}), 500
 
 
 @move_bp.route('/games/save', methods=['POST'])
@@ -239,10 +710,6 @@ def save_game():
         if 'user_id' not in session:
             return jsonify({'error': 'Not authenticated'}), 401
         
-        # Don't save games for guest users to backend
-        if session.get('is_guest', False):
-            return jsonify({'message': 'Game not saved (guest mode)'}), 200
-        
         data = request.get_json()
         
         if not data or not data.get('title'):
@@ -251,10 +718,26 @@ def save_game():
         # Create or update game record
         game_id = data.get('gameId') or str(uuid.uuid4())
         
-        game = Game.query.filter_by(
-            id=game_id,
-            user_id=session['user_id']
-        ).first()
+        if session.get('is_guest', False):
+            settings = data.get('settings', {})
+            guest_store.create_game(session['user_id'], game_id, {
+                'main_time': settings.get('mainTime', 600),
+                'byoyomi_time': settings.get('byoyomiTime', 30),
+                'byoyomi_periods': settings.get('byoyomiPeriods', 3)
+            })
+            guest_store.update_game(
+                session['user_id'], game_id,
+                title=data['title'],
+                comment=data.get('comment', ''),
+                status='saved',
+                saved_at=datetime.utcnow()
+            )
+            return jsonify({
+                'message': 'Game saved successfully',
+                'game_id': game_id
+            }), 200
+        
+        game = Game.owned_query(session['user_id'], game_id).first()
         
         if not game:
             # Create new game
@@ -273,14 +756,20 @@ def save_game():
         game.comment = data.get('comment', '')
         game.status = 'saved'
         game.saved_at = datetime.utcnow()
+        finish_game(game)
+        bump_game(game)
         
         db.session.commit()
+        stats_cache.invalidate(session['user_id'])
+        flag_scheduler.cancel(game_id)
         
         return jsonify({
             'message': 'Game saved successfully',
             'game_id': game_id
         }), 200
         
+    except GuestStoreError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to save game'}), 500
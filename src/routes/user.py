@@ -1,9 +1,20 @@
 from flask import Blueprint, request, jsonify, session
 from src.models.user import User, db
-from werkzeug.security import generate_password_hash
+from src.services.user_cache import user_cache, account_deleted
+from src.services.account_deletion import account_deletions
+from src.services.passwords import password_hasher, PasswordHasherBusy
+from src.services.rate_limit import auth_limiter
 
 user_bp = Blueprint('user', __name__)
 
+@user_bp.before_request
+def refuse_deleted_accounts():
+    # Another device's session of an account being deleted can't change it
+    if request.method != 'GET' and 'user_id' in session and not session.get('is_guest', False):
+        if account_deleted(session['user_id']):
+            session.clear()
+            return jsonify({'error': 'Not authenticated'}), 401
+
 @user_bp.route('/profile', methods=['GET'])
 def get_profile():
     try:
@@ -13,11 +24,11 @@ def get_profile():
         if session.get('is_guest', False):
             return jsonify({'error': 'Guest users do not have profiles'}), 403
         
-        user = User.query.get(session['user_id'])
-        if not user:
+        profile = user_cache.get(session['user_id'])
+        if not profile:
             return jsonify({'error': 'User not found'}), 404
         
-        return jsonify(user.to_dict()), 200
+        return jsonify(profile), 200
         
     except Exception as e:
         return jsonify({'error': 'Failed to get profile'}), 500
@@ -54,6 +65,7 @@ def update_profile():
             session['username'] = data['username']  # Update session
         
         db.session.commit()
+        user_cache.invalidate(user.id)
         
         return jsonify({
             'message': 'Profile updated successfully',
@@ -77,14 +89,19 @@ def change_password():
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
+        # Same limits as login, since this checks a password too
+        limited = auth_limiter.refuse(user.username)
+        if limited:
+            return limited
+        
         data = request.get_json()
         
         if not data or not all(k in data for k in ('current_password', 'new_password')):
             return jsonify({'error': 'Missing required fields'}), 400
         
         # Verify current password
-        from werkzeug.security import check_password_hash
-        if not check_password_hash(user.password_hash, data['current_password']):
+        matches, _ = password_hasher.verify(user.password_hash, data['current_password'])
+        if not matches:
             return jsonify({'error': 'Current password is incorrect'}), 400
         
         # Validate new password
@@ -92,11 +109,14 @@ def change_password():
             return jsonify({'error': 'New password must be at least 6 characters'}), 400
         
         # Update password
-        user.password_hash = generate_password_hash(data['new_password'])
+        user.password_hash = password_hasher.hash(data['new_password'])
         db.session.commit()
+        user_cache.invalidate(user.id)
         
         return jsonify({'message': 'Password changed successfully'}), 200
         
+    except PasswordHasherBusy as e:
+        return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to change password'}), 500
@@ -111,19 +131,38 @@ def delete_account():
             return jsonify({'error': 'Guest users cannot delete accounts'}), 403
         
         user = User.query.get(session['user_id'])
-        if not user:
+        if not user or user.deleted_at:
             return jsonify({'error': 'User not found'}), 404
         
-        # Delete user (cascade will handle related records)
-        db.session.delete(user)
-        db.session.commit()
+        # Chunked set-based deletes; large accounts are deleted by a background job
+        job_id = account_deletions.delete_account(user)
         
         # Clear session
         session.clear()
         
+        if job_id:
+            return jsonify({
+                'message': 'Account deletion started',
+                'job_id': job_id,
+                'progress_url': f'/api/account-deletions/{job_id}'
+            }), 202
+        
         return jsonify({'message': 'Account deleted successfully'}), 200
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to delete account'}), 500
 
+@user_bp.route('/account-deletions/<job_id>', methods=['GET'])
+def get_account_deletion(job_id):
+    try:
+        # The session ends with the account, so the unguessable job id is the credential
+        job = account_deletions.progress(job_id)
+        if not job:
+            return jsonify({'error': 'Deletion job not found'}), 404
+        
+        return jsonify(job), 200
+        
+    except Exception as e:
+        return jsonify({'error': 'Failed to get deletion progress'}), 500
+
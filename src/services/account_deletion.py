@@ -0,0 +1,156 @@
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime
+from sqlalchemy import delete, func, select
+from src.models.user import db, User, Game
+from src.models.move_history import MoveHistory
+from src.models.analytics import GameAnalytics, UserAnalytics, UserMoveTime
+from src.models.replay import ReplayPoint
+from src.services.stats_cache import stats_cache
+from src.services.user_cache import user_cache
+
+# Account deletion with set-based DELETE statements instead of loading every
+# Game and MoveHistory row through the ORM cascade.
+#
+# Rows go in chunks of ACCOUNT_DELETE_CHUNK_SIZE, each chunk its own short
+# transaction, so other requests get the SQLite writer between chunks however
+# big the account is. The user row goes last: until then the account is only
+# marked with deleted_at, which hides it from login, and keeps its id, so a
+# new account can't be given the id of the rows still being deleted. An
+# interrupted deletion is finished by flask --app src.main purge-deleted-accounts.
+#
+# Accounts with more than ACCOUNT_DELETE_SYNC_MOVES moves are deleted by a
+# background job. Its progress is kept in the state backend under the job id,
+# so any worker process can report it.
+
+DELETION_JOB_KEY = 'deletion-job:'
+
+# (table, key column, owner column), children before their parents
+USER_TABLES = (
+    (MoveHistory.__table__, 'id', 'user_id'),
+    (ReplayPoint.__table__, 'id', 'user_id'),
+    (GameAnalytics.__table__, 'game_id', 'user_id'),
+    (UserMoveTime.__table__, 'seconds', 'user_id'),
+    (UserAnalytics.__table__, 'user_id', 'user_id'),
+    (Game.__table__, 'id', 'user_id'),
+)
+
+
+def delete_in_chunks(table, key, owner, owner_id, chunk_size):
+    # DELETE ... WHERE key IN (SELECT key ... LIMIT n) until none are left,
+    # committing each chunk; yields the number of rows deleted per chunk
+    while True:
+        keys = select(table.c[key]).where(table.c[owner] == owner_id).limit(chunk_size).scalar_subquery()
+        deleted = db.session.execute(
+            delete(table).where(table.c[owner] == owner_id, table.c[key].in_(keys))
+        ).rowcount
+        db.session.commit()
+        if deleted:
+            yield deleted
+        if deleted < chunk_size:
+            return
+
+
+def count_user_rows(user_id):
+    return {
+        'moves': db.session.scalar(select(func.count()).where(MoveHistory.user_id == user_id)),
+        'games': db.session.scalar(select(func.count()).where(Game.user_id == user_id))
+    }
+
+
+def mark_user_deleted(user):
+    # The account disappears for login at once; its rows are deleted afterwards
+    user.deleted_at = datetime.utcnow()
+    db.session.commit()
+    user_cache.invalidate(user.id)
+    stats_cache.invalidate(user.id)
+
+
+def purge_user(user_id, chunk_size, progress=None):
+    # Deletes everything the user owns, then the user; progress(table, rows)
+    # is called after every chunk
+    for table, key, owner in USER_TABLES:
+        for deleted in delete_in_chunks(table, key, owner, user_id, chunk_size):
+            if progress:
+                progress(table.name, deleted)
+    db.session.execute(delete(User.__table__).where(User.__table__.c.id == user_id))
+    db.session.commit()
+    user_cache.invalidate(user_id)
+    stats_cache.invalidate(user_id)
+
+
+class AccountDeletionJobs:
+    # Background deletions run one at a time on one thread
+
+    def __init__(self, chunk_size=2000, sync_moves=5000):
+        self.chunk_size = chunk_size
+        self.sync_moves = sync_moves
+        self.app = None
+        self.backend = None
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app, backend):
+        self.app = app
+        self.backend = backend
+        self.chunk_size = app.config.get('ACCOUNT_DELETE_CHUNK_SIZE', self.chunk_size)
+        self.sync_moves = app.config.get('ACCOUNT_DELETE_SYNC_MOVES', self.sync_moves)
+
+    def delete_account(self, user):
+        # Returns None once the account is gone, or the job id of a background
+        # deletion for large accounts
+        totals = count_user_rows(user.id)
+        mark_user_deleted(user)
+        if totals['moves'] <= self.sync_moves:
+            purge_user(user.id, self.chunk_size)
+            return None
+
+        job_id = str(uuid.uuid4())
+        self.backend.set(DELETION_JOB_KEY + job_id, {
+            'job_id': job_id,
+            'status': 'queued',
+            'total': totals,
+            'deleted': {'moves': 0, 'games': 0},
+            'started_at': None,
+            'finished_at': None
+        })
+        self._queue.put((job_id, user.id))
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='account-deletion', daemon=True)
+                self._thread.start()
+        return job_id
+
+    def progress(self, job_id):
+        return self.backend.get(DELETION_JOB_KEY + job_id)
+
+    def _run(self):
+        while True:
+            job_id, user_id = self._queue.get()
+            job = self.progress(job_id)
+            job.update(status='running', started_at=datetime.utcnow().isoformat())
+            self.backend.set(DELETION_JOB_KEY + job_id, job)
+
+            def progress(table, deleted):
+                name = {'move_history': 'moves', 'games': 'games'}.get(table)
+                if name:
+                    job['deleted'][name] += deleted
+                    self.backend.set(DELETION_JOB_KEY + job_id, job)
+
+            with self.app.app_context():
+                started = time.perf_counter()
+                try:
+                    purge_user(user_id, self.chunk_size, progress)
+                    job['status'] = 'completed'
+                except Exception:
+                    db.session.rollback()
+                    job['status'] = 'failed'
+                    self.app.logger.exception('Deleting account %s failed', user_id)
+                job.update(finished_at=datetime.utcnow().isoformat(), seconds=round(time.perf_counter() - started, 3))
+                self.backend.set(DELETION_JOB_KEY + job_id, job)
+
+
+account_deletions = AccountDeletionJobs()
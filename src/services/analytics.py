@@ -0,0 +1,291 @@
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from datetime import datetime
+from itertools import accumulate, compress
+from operator import and_
+from sqlalchemy import delete, select
+from sqlalchemy.dialects.sqlite import insert
+from src.models.user import db, Game
+from src.models.move_history import MoveHistory
+from src.models.analytics import GameAnalytics, UserAnalytics, UserMoveTime
+from src.services.move_archive import decode_columns
+
+# Move timing analytics (GET /api/analytics and GET /api/games/<id>/analytics).
+#
+# A game's moves are loaded column by column, from plain query rows or the
+# packed move archive, into typed arrays, and every figure is one pass over a
+# column or a slice of it: phases are slices of the sorted move numbers found
+# by bisection, per color figures are masks over the columns. No ORM objects
+# are built. When a game finishes its figures are stored in game_analytics and
+# added to the owner's totals in user_analytics and user_move_times with
+# INSERT ... ON CONFLICT DO UPDATE, so the user dashboard reads one row and a
+# short distribution however many games the user has played.
+#
+# time_taken is whole seconds, so move-time percentiles come from a count of
+# moves per number of seconds, which adds up exactly across games.
+
+FIELDS = (
+    'move_number', 'player_color', 'time_taken', 'main_time_remaining',
+    'byoyomi_time_remaining', 'byoyomi_periods_remaining', 'in_byoyomi',
+)
+TOTAL_FIELDS = (
+    'games', 'moves', 'total_time',
+    'opening_moves', 'opening_time', 'middlegame_moves', 'middlegame_time', 'endgame_moves', 'endgame_time',
+    'byoyomi_entries', 'byoyomi_entry_moves', 'periods_used', 'trouble_moves', 'trouble_games',
+)
+PHASES = (('opening', 50), ('middlegame', 150), ('endgame', None))  # (phase, last move number)
+PERCENTILES = (50, 75, 90, 95, 99)
+TIME_TROUBLE_SECONDS = 10
+COLORS = ('black', 'white')
+FINISHED_STATUSES = ('completed', 'saved')
+
+
+def columns_from_moves(moves):
+    # Move dicts (imports, guest games) as one list per field, in move order
+    moves = sorted(moves, key=lambda move: move['move_number'])
+    return {field: [move.get(field) for move in moves] for field in FIELDS}
+
+
+def load_columns(game):
+    # The game's archived moves and move_history rows, one list per field
+    rows = db.session.execute(
+        select(*[getattr(MoveHistory, field) for field in FIELDS])
+        .where(MoveHistory.user_id == game.user_id, MoveHistory.game_id == game.id)
+        .order_by(MoveHistory.move_number)
+    ).all()
+    columns = {field: list(values) for field, values in zip(FIELDS, zip(*rows))} if rows else {field: [] for field in FIELDS}
+
+    if game.moves_archive:
+        archived = decode_columns(game.moves_archive)
+        columns = {field: archived[field] + columns[field] for field in FIELDS}
+        if rows:
+            order = sorted(range(len(columns['move_number'])), key=columns['move_number'].__getitem__)
+            columns = {field: [values[index] for index in order] for field, values in columns.items()}
+    return columns
+
+
+def game_summary(columns, byoyomi_periods):
+    # Totals (see TOTAL_FIELDS), the move-time distribution and per color figures
+    byoyomi_periods = byoyomi_periods or 0
+    numbers = array('q', columns['move_number'])
+    times = array('d', [value or 0 for value in columns['time_taken']])
+    main_left = array('d', [value or 0 for value in columns['main_time_remaining']])
+    periods_left = array('q', [byoyomi_periods if value is None else value for value in columns['byoyomi_periods_remaining']])
+    in_byoyomi = [bool(value) for value in columns['in_byoyomi']]
+
+    # On the last byo-yomi period, or close to flagging in games without byo-yomi
+    if byoyomi_periods:
+        trouble = [byoyomi and left <= 1 for byoyomi, left in zip(in_byoyomi, periods_left)]
+    else:
+        trouble = [left < TIME_TROUBLE_SECONDS for left in main_left]
+
+    summary = {'games': 1, 'moves': len(numbers), 'total_time': sum(times)}
+    start = 0
+    for phase, last_move in PHASES:
+        end = len(numbers) if last_move is None else bisect_right(numbers, last_move)
+        summary[f'{phase}_moves'] = end - start
+        summary[f'{phase}_time'] = sum(times[start:end])
+        start = end
+
+    players = {}
+    for color in COLORS:
+        is_color = [value == color for value in columns['player_color']]
+        color_byoyomi = list(map(and_, is_color, in_byoyomi))
+        lowest_periods = min(compress(periods_left, color_byoyomi), default=byoyomi_periods)
+        players[color] = {
+            'moves': sum(is_color),
+            'time': sum(compress(times, is_color)),
+            'byoyomi_entry_move': next(compress(numbers, color_byoyomi), None),
+            'periods_used': max(byoyomi_periods - lowest_periods, 0),
+            'trouble_moves': sum(map(and_, is_color, trouble))
+        }
+
+    entries = [player['byoyomi_entry_move'] for player in players.values() if player['byoyomi_entry_move'] is not None]
+    summary.update(
+        byoyomi_entries=len(entries),
+        byoyomi_entry_moves=sum(entries),
+        periods_used=sum(player['periods_used'] for player in players.values()),
+        trouble_moves=sum(trouble),
+        trouble_games=int(any(trouble)),
+        time_counts=dict(Counter(int(value + 0.5) for value in times)),
+        players=players
+    )
+    return summary
+
+
+def combine_summaries(summaries):
+    # Adds game summaries up the way user_analytics does
+    totals = dict.fromkeys(TOTAL_FIELDS, 0)
+    counts = Counter()
+    for summary in summaries:
+        for field in TOTAL_FIELDS:
+            totals[field] += summary[field]
+        counts.update(summary['time_counts'])
+    return totals, dict(counts)
+
+
+def pack_counts(counts):
+    return array('q', [value for pair in sorted(counts.items()) for value in pair]).tobytes()
+
+
+def unpack_counts(blob):
+    values = array('q')
+    values.frombytes(blob)
+    return dict(zip(values[::2], values[1::2]))
+
+
+def percentiles(counts):
+    # Nearest-rank percentiles of a {seconds: moves} distribution
+    seconds = sorted(value for value, moves in counts.items() if moves > 0)
+    if not seconds:
+        return dict({f'p{p}': None for p in PERCENTILES}, max=None)
+    cumulative = array('q', accumulate(counts[value] for value in seconds))
+    result = {
+        f'p{p}': seconds[bisect_left(cumulative, math.ceil(p * cumulative[-1] / 100))]
+        for p in PERCENTILES
+    }
+    result['max'] = seconds[-1]
+    return result
+
+
+def format_analytics(totals, counts):
+    def average(total, count):
+        return round(total / count, 2) if count else None
+
+    return {
+        'games': totals['games'],
+        'moves': totals['moves'],
+        'move_time': dict(average=average(totals['total_time'], totals['moves']), **percentiles(counts)),
+        'phases': {
+            phase: {
+                'moves': totals[f'{phase}_moves'],
+                'time': round(totals[f'{phase}_time'], 2),
+                'average_move_time': average(totals[f'{phase}_time'], totals[f'{phase}_moves'])
+            }
+            for phase, _ in PHASES
+        },
+        'byoyomi': {
+            'entries': totals['byoyomi_entries'],
+            'average_entry_move': average(totals['byoyomi_entry_moves'], totals['byoyomi_entries']),
+            'periods_used': totals['periods_used'],
+            'average_periods_used': average(totals['periods_used'], totals['byoyomi_entries'])
+        },
+        'time_trouble': {
+            'moves': totals['trouble_moves'],
+            'move_rate': average(totals['trouble_moves'], totals['moves']),
+            'games': totals['trouble_games'],
+            'game_rate': average(totals['trouble_games'], totals['games'])
+        }
+    }
+
+
+def format_game_analytics(game_id, summary, materialized):
+    return dict(
+        format_analytics(summary, summary['time_counts']),
+        game_id=game_id,
+        players=summary['players'],
+        materialized=materialized
+    )
+
+
+def store_game_summary(game_id, user_id, summary):
+    # Saves a finished game's figures and adds the change to the owner's
+    # totals, so a game finished twice is still counted once. The totals are
+    # updated in SQL, so concurrent completions don't lose each other's
+    # changes. The caller commits.
+    row = db.session.get(GameAnalytics, game_id)
+    if row is None:
+        previous, previous_counts = dict.fromkeys(TOTAL_FIELDS, 0), {}
+        row = GameAnalytics(game_id=game_id, user_id=user_id)
+        db.session.add(row)
+    else:
+        previous = {field: getattr(row, field) for field in TOTAL_FIELDS}
+        previous_counts = unpack_counts(row.time_counts)
+
+    now = datetime.utcnow()
+    for field in TOTAL_FIELDS:
+        setattr(row, field, summary[field])
+    row.time_counts = pack_counts(summary['time_counts'])
+    row.players = summary['players']
+    row.computed_at = now
+
+    table = UserAnalytics.__table__
+    statement = insert(table).values(
+        user_id=user_id,
+        updated_at=now,
+        **{field: summary[field] - previous[field] for field in TOTAL_FIELDS}
+    )
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=['user_id'],
+        set_=dict({field: table.c[field] + statement.excluded[field] for field in TOTAL_FIELDS}, updated_at=now)
+    ))
+
+    changes = [
+        {'user_id': user_id, 'seconds': seconds, 'moves': summary['time_counts'].get(seconds, 0) - previous_counts.get(seconds, 0)}
+        for seconds in set(summary['time_counts']) | set(previous_counts)
+    ]
+    changes = [change for change in changes if change['moves']]
+    if changes:
+        table = UserMoveTime.__table__
+        statement = insert(table)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=['user_id', 'seconds'],
+            set_={'moves': table.c.moves + statement.excluded.moves}
+        ), changes)
+
+
+def materialize_game(game):
+    # Called as a game finishes (complete, save or a flag fall on the server
+    # clock), with its moves flushed; the caller commits
+    store_game_summary(game.id, game.user_id, game_summary(load_columns(game), game.byoyomi_periods))
+
+
+def game_analytics(game):
+    # Stored figures of a finished game, computed on the spot for others
+    row = db.session.get(GameAnalytics, game.id)
+    if row is None or game.status not in FINISHED_STATUSES:
+        return format_game_analytics(game.id, game_summary(load_columns(game), game.byoyomi_periods), False)
+    summary = {field: getattr(row, field) for field in TOTAL_FIELDS}
+    summary.update(time_counts=unpack_counts(row.time_counts), players=row.players)
+    return format_game_analytics(game.id, summary, True)
+
+
+def user_analytics(user_id):
+    row = db.session.get(UserAnalytics, user_id)
+    totals = {field: getattr(row, field) for field in TOTAL_FIELDS} if row else dict.fromkeys(TOTAL_FIELDS, 0)
+    counts = dict(db.session.execute(
+        select(UserMoveTime.seconds, UserMoveTime.moves).where(UserMoveTime.user_id == user_id)
+    ).all())
+    return format_analytics(totals, counts)
+
+
+def moves_game_analytics(game_data):
+    # A game given as a dict with its moves, such as a guest game
+    summary = game_summary(columns_from_moves(game_data['moves']), game_data['byoyomi_periods'])
+    return format_game_analytics(game_data['id'], summary, False)
+
+
+def moves_user_analytics(games):
+    # Same as user_analytics() over games given as dicts with their moves
+    totals, counts = combine_summaries(
+        game_summary(columns_from_moves(game['moves']), game['byoyomi_periods'])
+        for game in games if game['status'] in FINISHED_STATUSES
+    )
+    return format_analytics(totals, counts)
+
+
+def delete_user_analytics(user_id):
+    for model in (GameAnalytics, UserAnalytics, UserMoveTime):
+        db.session.execute(delete(model).where(model.user_id == user_id))
+
+
+def rebuild_user_analytics(user_id):
+    # Recomputes a user's analytics from their finished games; returns the number of games
+    delete_user_analytics(user_id)
+    games = Game.query.filter(Game.user_id == user_id, Game.status.in_(FINISHED_STATUSES)).all()
+    for game in games:
+        materialize_game(game)
+    db.session.commit()
+    return len(games)
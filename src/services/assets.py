@@ -0,0 +1,148 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import posixpath
+import re
+from flask import Response, request
+
+try:
+    import brotli
+except ImportError:  # Optional; without it only gzip variants are built
+    brotli = None
+
+# In-memory static asset pipeline, built once at startup from src/static/.
+#
+# Every file is read once and served from memory with a strong ETag under its
+# own name (revalidated with Cache-Control: no-cache) and, except for HTML
+# pages, under a fingerprinted name such as timer.3f2a9c1b7e.js that is cached
+# for a year as immutable. The HTML pages are rewritten to reference the
+# fingerprinted names, so a browser revalidates the small page and reuses
+# everything else until a deploy changes it. gzip (and brotli, when the module
+# is installed) variants are compressed ahead of time and picked by
+# Accept-Encoding; If-None-Match is answered with 304 without touching disk.
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+MIN_COMPRESS_SIZE = 256
+FINGERPRINT_LENGTH = 10
+
+# href="style.css" / src="/timer.js"; external URLs contain ':' and are skipped
+HTML_REFERENCE = re.compile(r'''(\b(?:href|src)\s*=\s*["'])([^"'?#:]+)(["'])''', re.I)
+
+
+class Asset:
+
+    def __init__(self, path, body):
+        self.path = path
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.digest = hashlib.sha256(body).hexdigest()
+        self.variants = {'identity': body}
+
+        if len(body) >= MIN_COMPRESS_SIZE:
+            compressed = {'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed['br'] = brotli.compress(body, quality=11)
+            for encoding, data in compressed.items():
+                if len(data) < len(body):
+                    self.variants[encoding] = data
+
+        # Strong ETags must differ between encodings of the same file
+        self.etags = {
+            encoding: self.digest[:32] if encoding == 'identity' else f'{self.digest[:32]}-{encoding}'
+            for encoding in self.variants
+        }
+
+    @property
+    def fingerprinted_path(self):
+        root, ext = posixpath.splitext(self.path)
+        return f'{root}.{self.digest[:FINGERPRINT_LENGTH]}{ext}'
+
+    def negotiate(self, accept_encodings):
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and accept_encodings[encoding]:
+                return encoding
+        return 'identity'
+
+
+def rewrite_html(page_path, body, assets):
+    # Points references to other assets at their fingerprinted names
+    def replace(match):
+        reference = match.group(2)
+        if reference.startswith('/'):
+            target = reference.lstrip('/')
+        else:
+            target = posixpath.normpath(posixpath.join(posixpath.dirname(page_path), reference))
+        asset = assets.get(target)
+        if asset is None or target.endswith('.html'):
+            return match.group(0)
+        return f'{match.group(1)}/{asset.fingerprinted_path}{match.group(3)}'
+
+    return HTML_REFERENCE.sub(replace, body.decode('utf-8')).encode('utf-8')
+
+
+class StaticAssets:
+
+    def __init__(self):
+        self.enabled = False
+        self.routes = {}  # URL path -> (asset, Cache-Control)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('STATIC_ASSET_CACHE', False)
+        if self.enabled and app.static_folder:
+            self.load(app.static_folder)
+
+    def load(self, folder):
+        files = {}
+        for root, _, names in os.walk(folder):
+            for name in sorted(names):
+                full_path = os.path.join(root, name)
+                with open(full_path, 'rb') as f:
+                    files[os.path.relpath(full_path, folder).replace(os.sep, '/')] = f.read()
+
+        # Everything else first, so the pages can reference the fingerprints
+        assets = {path: Asset(path, body) for path, body in files.items() if not path.endswith('.html')}
+        for path, body in files.items():
+            if path.endswith('.html'):
+                assets[path] = Asset(path, rewrite_html(path, body, assets))
+
+        routes = {}
+        for path, asset in assets.items():
+            routes[path] = (asset, REVALIDATE)
+            if not path.endswith('.html'):
+                routes[asset.fingerprinted_path] = (asset, IMMUTABLE)
+        self.routes = routes
+
+    def response(self, path):
+        entry = self.routes.get(path)
+        if entry is None:
+            return None
+
+        asset, cache_control = entry
+        encoding = asset.negotiate(request.accept_encodings)
+        etag = asset.etags[encoding]
+        headers = {
+            'Cache-Control': cache_control,
+            'ETag': f'"{etag}"',
+            'Vary': 'Accept-Encoding'
+        }
+
+        if request.if_none_match.contains_weak(etag):
+            return Response(status=304, headers=headers)
+
+        if encoding != 'identity':
+            headers['Content-Encoding'] = encoding
+        return Response(asset.variants[encoding], mimetype=asset.mimetype, headers=headers)
+
+    def stats(self):
+        # (path, URL it is cached under, bytes per encoding)
+        return [
+            (path, url, {encoding: len(data) for encoding, data in asset.variants.items()})
+            for path, url, asset in sorted(
+                (asset.path, url, asset) for url, (asset, cache_control) in self.routes.items()
+                if cache_control == IMMUTABLE or asset.path.endswith('.html')
+            )
+        ]
+
+
+assets = StaticAssets()
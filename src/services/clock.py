@@ -0,0 +1,305 @@
+import time
+from array import array
+from datetime import datetime
+from flask import current_app
+from src.models.user import db, Game
+from src.services.move_buffer import move_buffer, insert_moves
+from src.services.stats_cache import stats_cache
+from src.services.move_archive import archive_game_moves
+from src.services.analytics import materialize_game
+from src.services.replay import index_game
+from src.services.state import LocalStateBackend
+from src.services.flag_fall import flag_scheduler
+from src.services.revisions import bump_game
+
+COLORS = ('black', 'white')
+CLOCK_KEY = 'clock:'
+CLOCK_MOVES_KEY = 'clock-moves:'
+STATE_FIELDS = (
+    'game_id', 'user_id', 'persist', 'main_time', 'byoyomi_time', 'byoyomi_periods',
+    'current', 'move_number', 'turn_started', 'paused',
+)
+
+
+class ClockError(Exception):
+    pass
+
+
+def charge(main_left, byo_left, periods_left, in_byoyomi, elapsed, byoyomi_time):
+    # Japanese byo-yomi: main time runs out first, then every period that
+    # expires in full is lost. Returns the new clock values and whether the
+    # player's flag fell.
+    if not in_byoyomi:
+        if elapsed < main_left:
+            return main_left - elapsed, byo_left, periods_left, False, False
+        elapsed -= main_left
+        main_left = 0
+        byo_left = byoyomi_time
+        in_byoyomi = True
+
+    if periods_left <= 0:
+        return main_left, 0, 0, in_byoyomi, True
+
+    if elapsed < byo_left:
+        return main_left, byo_left - elapsed, periods_left, in_byoyomi, False
+
+    elapsed -= byo_left
+    lost = 1
+    if byoyomi_time > 0:
+        lost += int(elapsed // byoyomi_time)
+        elapsed = elapsed % byoyomi_time
+    periods_left -= lost
+    if periods_left <= 0:
+        return main_left, 0, 0, in_byoyomi, True
+    return main_left, byoyomi_time - elapsed, periods_left, in_byoyomi, False
+
+
+class GameClock:
+    # Per-game state kept compact: slot attributes plus one array per field
+    # holding the black and white values side by side.
+    __slots__ = (
+        'game_id', 'user_id', 'persist', 'main_time', 'byoyomi_time', 'byoyomi_periods',
+        'current', 'move_number', 'turn_started', 'paused',
+        'main_left', 'byo_left', 'periods_left', 'in_byoyomi', 'moves'
+    )
+
+    def __init__(self, game_id, user_id, main_time, byoyomi_time, byoyomi_periods, now, persist=True):
+        self.game_id = game_id
+        self.user_id = user_id
+        self.persist = persist
+        self.main_time = main_time
+        self.byoyomi_time = byoyomi_time
+        self.byoyomi_periods = byoyomi_periods
+        self.current = 0  # index into COLORS, black moves first
+        self.move_number = 0
+        self.turn_started = now
+        self.paused = False
+        self.main_left = array('d', (main_time, main_time))
+        self.byo_left = array('d', (byoyomi_time, byoyomi_time))
+        self.periods_left = array('i', (byoyomi_periods, byoyomi_periods))
+        self.in_byoyomi = array('b', (main_time <= 0, main_time <= 0))
+        self.moves = []
+
+    def live(self, now):
+        # Clock values for the player to move as if they pressed right now
+        player = self.current
+        # While paused turn_started holds the time already used this turn
+        elapsed = self.turn_started if self.paused else max(0.0, now - self.turn_started)
+        return charge(
+            self.main_left[player], self.byo_left[player], self.periods_left[player],
+            bool(self.in_byoyomi[player]), elapsed, self.byoyomi_time
+        )
+
+    def next_deadline(self):
+        # Monotonic time at which the player to move flags, None while paused
+        if self.paused:
+            return None
+        player = self.current
+        if self.in_byoyomi[player]:
+            remaining = self.byo_left[player] + self.byoyomi_time * (self.periods_left[player] - 1)
+        else:
+            remaining = self.main_left[player] + self.byoyomi_time * self.periods_left[player]
+        return self.turn_started + remaining
+
+    def to_state(self):
+        # Plain values for a shared state backend; moves are stored on their own
+        state = {name: getattr(self, name) for name in STATE_FIELDS}
+        state.update(
+            main_left=list(self.main_left),
+            byo_left=list(self.byo_left),
+            periods_left=list(self.periods_left),
+            in_byoyomi=list(self.in_byoyomi)
+        )
+        return state
+
+    @classmethod
+    def from_state(cls, data):
+        state = cls.__new__(cls)
+        for name in STATE_FIELDS:
+            setattr(state, name, data[name])
+        state.main_left = array('d', data['main_left'])
+        state.byo_left = array('d', data['byo_left'])
+        state.periods_left = array('i', data['periods_left'])
+        state.in_byoyomi = array('b', data['in_byoyomi'])
+        state.moves = []
+        return state
+
+    def to_dict(self, now):
+        main_left, byo_left, periods_left, in_byoyomi, flagged = self.live(now)
+        players = {}
+        for index, color in enumerate(COLORS):
+            if index == self.current:
+                values = (main_left, byo_left, periods_left, in_byoyomi)
+            else:
+                values = (self.main_left[index], self.byo_left[index],
+                          self.periods_left[index], bool(self.in_byoyomi[index]))
+            players[color] = {
+                'main_time_remaining': round(values[0], 3),
+                'byoyomi_time_remaining': round(values[1], 3),
+                'byoyomi_periods_remaining': values[2],
+                'in_byoyomi': values[3]
+            }
+        return {
+            'game_id': self.game_id,
+            'current_player': COLORS[self.current],
+            'move_number': self.move_number,
+            'paused': self.paused,
+            'flagged': COLORS[self.current] if flagged else None,
+            'players': players
+        }
+
+
+class ClockTable:
+    # Active game clocks keyed by game_id, held by the state backend (see
+    # src/services/state.py). Every operation is one lookup plus constant work
+    # on one GameClock, so presses never touch SQLite. With a shared backend
+    # a GameClock travels as plain values and each recorded move is appended
+    # to a list of its own, so a press doesn't resend the game so far.
+    # time.monotonic() is system wide, so workers on one host agree on it.
+
+    def __init__(self, clock=time.monotonic, backend=None):
+        self.clock = clock
+        self.backend = backend or LocalStateBackend()
+
+    def init_app(self, app, backend):
+        self.backend = backend
+
+    def __contains__(self, game_id):
+        return self.backend.get(CLOCK_KEY + game_id) is not None
+
+    def get(self, game_id, with_moves=True):
+        return self._load(game_id, with_moves)
+
+    def start(self, game_id, user_id, main_time, byoyomi_time, byoyomi_periods, persist=True):
+        with self.backend.lock(CLOCK_KEY + game_id):
+            if game_id in self:
+                raise ClockError('Clock already running for this game')
+            state = GameClock(game_id, user_id, main_time, byoyomi_time, byoyomi_periods,
+                              self.clock(), persist=persist)
+            self._save(state)
+            return state
+
+    def press(self, game_id, player=None):
+        now = self.clock()
+        with self.backend.lock(CLOCK_KEY + game_id):
+            state = self._load(game_id)
+            if state is None:
+                raise ClockError('No running clock for this game')
+            if state.paused:
+                raise ClockError('Clock is paused')
+            if player is not None and player != COLORS[state.current]:
+                raise ClockError(f'It is {COLORS[state.current]} to move')
+
+            index = state.current
+            elapsed = now - state.turn_started
+            main_left, byo_left, periods_left, in_byoyomi, flagged = state.live(now)
+            if flagged:
+                return state, None
+
+            state.move_number += 1
+            # Record the clock as it stood at the press, before the period resets
+            move = {
+                'user_id': state.user_id,
+                'game_id': state.game_id,
+                'move_number': state.move_number,
+                'player_color': COLORS[index],
+                'time_taken': int(elapsed),
+                'main_time_remaining': int(main_left),
+                'byoyomi_time_remaining': int(byo_left),
+                'byoyomi_periods_remaining': periods_left,
+                'in_byoyomi': in_byoyomi,
+                'created_at': datetime.utcnow()
+            }
+            state.moves.append(move)
+
+            state.main_left[index] = main_left
+            state.byo_left[index] = state.byoyomi_time if in_byoyomi else byo_left
+            state.periods_left[index] = periods_left
+            state.in_byoyomi[index] = in_byoyomi
+            state.current = 1 - index
+            state.turn_started = now
+            self._save(state, move)
+            return state, move
+
+    def pause(self, game_id):
+        now = self.clock()
+        with self.backend.lock(CLOCK_KEY + game_id):
+            state = self._load(game_id)
+            if state is None:
+                raise ClockError('No running clock for this game')
+            # Pausing swaps turn_started for the time used so far this turn and
+            # resuming swaps it back, so the same expression serves both ways
+            state.turn_started = now - state.turn_started
+            state.paused = not state.paused
+            self._save(state)
+            return state
+
+    def finish(self, game_id):
+        with self.backend.lock(CLOCK_KEY + game_id):
+            state = self._load(game_id, with_moves=True)
+            self.backend.pop(CLOCK_KEY + game_id)
+            self.backend.pop(CLOCK_MOVES_KEY + game_id)
+            return state
+
+    def _load(self, game_id, with_moves=False):
+        value = self.backend.get(CLOCK_KEY + game_id)
+        if value is None or not self.backend.shared:
+            return value
+        state = GameClock.from_state(value)
+        if with_moves:
+            state.moves = [
+                dict(move, created_at=datetime.fromisoformat(move['created_at']))
+                for move in self.backend.get(CLOCK_MOVES_KEY + game_id) or ()
+            ]
+        return state
+
+    def _save(self, state, move=None):
+        flag_scheduler.watch_clock(state.game_id, state.next_deadline(), self.clock())
+        if not self.backend.shared:
+            # The backend holds this very object, already updated in place
+            self.backend.set(CLOCK_KEY + state.game_id, state)
+            return
+        self.backend.set(CLOCK_KEY + state.game_id, state.to_state())
+        if move is not None:
+            self.backend.append(CLOCK_MOVES_KEY + state.game_id, dict(move, created_at=move['created_at'].isoformat()))
+
+
+def persist_finished_game(state, winner):
+    # Writes a finished game's moves in one batch and marks the Game completed
+    if state is None or not state.persist:
+        return None
+
+    if state.moves:
+        insert_moves(state.moves)
+
+    game = Game.query.filter_by(id=state.game_id, user_id=state.user_id).first()
+    if game:
+        mark_game_completed(game, winner)
+    return game
+
+
+def finish_game(game):
+    # Store the game's move timing analytics and replay points and, with
+    # MOVE_ARCHIVE, fold its move rows into one packed blob; all are committed
+    # with the game
+    move_buffer.flush()
+    materialize_game(game)
+    index_game(game)
+    if current_app.config.get('MOVE_ARCHIVE'):
+        archive_game_moves(game)
+
+
+def mark_game_completed(game, winner):
+    # Shared by POST /api/games/<game_id>/complete, flag falls on the server
+    # clock and the flag-fall scheduler; the caller publishes the event
+    game.status = 'completed'
+    game.winner = winner  # 'white', 'black', or None for draw
+    game.completed_at = datetime.utcnow()
+    finish_game(game)
+    bump_game(game)
+    db.session.commit()
+    stats_cache.invalidate(game.user_id)
+    flag_scheduler.cancel(game.id)
+
+
+clock_table = ClockTable()
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import threading
+from collections import deque
+
+EVENT_CHANNEL = 'events:'
+
+
+class Subscriber:
+    # One viewer of a game. The queue is bounded: when a slow client falls
+    # behind, the oldest events are dropped instead of blocking publishers.
+    __slots__ = ('queue', 'ready', 'dropped')
+
+    def __init__(self, maxsize):
+        self.queue = deque(maxlen=maxsize)
+        self.ready = threading.Event()
+        self.dropped = 0
+
+    def push(self, message):
+        if len(self.queue) == self.queue.maxlen:
+            self.dropped += 1
+        self.queue.append(message)
+        self.ready.set()
+
+    def next(self, timeout):
+        if not self.queue:
+            self.ready.wait(timeout)
+            self.ready.clear()
+        try:
+            return self.queue.popleft()
+        except IndexError:
+            return None
+
+
+class AsyncSubscriber:
+    # Subscriber for an asyncio stream. Publishers run on worker threads, so
+    # delivery is handed to the subscriber's event loop.
+    __slots__ = ('queue', 'loop', 'dropped')
+
+    def __init__(self, maxsize, loop):
+        self.queue = asyncio.Queue(maxsize)
+        self.loop = loop
+        self.dropped = 0
+
+    def push(self, message):
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            # The stream's loop already shut down
+            pass
+
+    def _put(self, message):
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(message)
+
+
+class GameEventHub:
+    # Fans out per-game events to every subscriber. Each event is serialized
+    # once and the same bytes are queued for all viewers. With a shared state
+    # backend events go through it, and each worker process with viewers of
+    # the game delivers them to its own viewers.
+
+    def __init__(self, queue_size=64):
+        self.queue_size = queue_size
+        self._subscribers = {}
+        self._sequences = {}
+        self._lock = threading.Lock()
+        self.backend = None
+
+    def init_app(self, app, backend=None):
+        self.queue_size = app.config.get('EVENT_QUEUE_SIZE', self.queue_size)
+        if backend is not None and backend.shared:
+            self.backend = backend
+
+    def subscribe(self, game_id, loop=None):
+        if loop is not None:
+            subscriber = AsyncSubscriber(self.queue_size, loop)
+        else:
+            subscriber = Subscriber(self.queue_size)
+        with self._lock:
+            subscribers = self._subscribers.setdefault(game_id, set())
+            if not subscribers and self.backend is not None:
+                self.backend.subscribe(EVENT_CHANNEL + game_id, self._on_message)
+            subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, game_id, subscriber):
+        with self._lock:
+            subscribers = self._subscribers.get(game_id)
+            if subscribers is None:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._subscribers[game_id]
+                self._sequences.pop(game_id, None)
+                if self.backend is not None:
+                    self.backend.unsubscribe(EVENT_CHANNEL + game_id, self._on_message)
+
+    def subscriber_count(self, game_id=None):
+        with self._lock:
+            if game_id is not None:
+                return len(self._subscribers.get(game_id, ()))
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+    def publish(self, game_id, event, data):
+        if self.backend is not None:
+            # Delivered by every worker with viewers of the game, this one included
+            self.backend.publish(EVENT_CHANNEL + game_id, [event, data])
+            return None
+        return self._deliver(game_id, event, data)
+
+    def _on_message(self, channel, message):
+        event, data = message
+        self._deliver(channel[len(EVENT_CHANNEL):], event, data)
+
+    def _deliver(self, game_id, event, data):
+        with self._lock:
+            subscribers = self._subscribers.get(game_id)
+            if not subscribers:
+                return 0
+            sequence = self._sequences.get(game_id, 0) + 1
+            self._sequences[game_id] = sequence
+            subscribers = list(subscribers)
+
+        message = format_sse(event, data, sequence)
+        for subscriber in subscribers:
+            subscriber.push(message)
+        return len(subscribers)
+
+
+def format_sse(event, data, event_id=None):
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, separators=(',', ':')))
+    return '\n'.join(lines) + '\n\n'
+
+
+def move_delta(move):
+    # Only the mover's clock values, which is all a viewer needs to update
+    return {
+        'n': move['move_number'],
+        'c': move['player_color'],
+        't': move['time_taken'],
+        'm': move['main_time_remaining'],
+        'b': move['byoyomi_time_remaining'],
+        'p': move['byoyomi_periods_remaining'],
+        'y': bool(move['in_byoyomi'])
+    }
+
+
+game_events = GameEventHub()
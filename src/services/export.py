@@ -0,0 +1,106 @@
+import csv
+import io
+import json
+import zlib
+from sqlalchemy import select
+from src.models.user import db, Game
+from src.models.move_history import MoveHistory
+from src.services.move_archive import merge_archived_moves
+
+# Streaming export of a user's games and moves for GET /api/export.
+#
+# Games are read in keyset chunks on (created_at, id) and each chunk's moves
+# with one indexed query, so memory is bounded by the chunk size, not by the
+# size of the history. All chunks are read inside the request's single read
+# transaction and therefore see one consistent snapshot.
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+GAME_FIELDS = (
+    'id', 'title', 'comment', 'main_time', 'byoyomi_time', 'byoyomi_periods',
+    'status', 'winner', 'created_at', 'completed_at', 'saved_at',
+)
+MOVE_FIELDS = (
+    'move_number', 'player_color', 'time_taken', 'main_time_remaining',
+    'byoyomi_time_remaining', 'byoyomi_periods_remaining', 'in_byoyomi', 'created_at',
+)
+CSV_HEADER = ['game_' + field for field in GAME_FIELDS] + ['move_' + field for field in MOVE_FIELDS]
+
+
+def _chunk_moves(user_id, game_ids):
+    rows = db.session.execute(
+        select(MoveHistory.__table__).where(
+            MoveHistory.user_id == user_id,
+            MoveHistory.game_id.in_(game_ids)
+        ).order_by(MoveHistory.game_id, MoveHistory.move_number)
+    )
+    moves = {}
+    for row in rows.mappings():
+        move = dict(row)
+        move['created_at'] = move['created_at'].isoformat() if move['created_at'] else None
+        moves.setdefault(move['game_id'], []).append(move)
+    return moves
+
+
+def iter_game_chunks(user_id, chunk_size):
+    # Yields lists of (game dict, moves) in creation order, oldest first
+    after = None
+    while True:
+        query = Game.query.options(db.undefer(Game.moves_archive)).filter(Game.user_id == user_id)
+        if after:
+            query = query.filter(db.tuple_(Game.created_at, Game.id) > after)
+        games = query.order_by(Game.created_at, Game.id).limit(chunk_size).all()
+        if not games:
+            return
+
+        moves = _chunk_moves(user_id, [game.id for game in games])
+        chunk = []
+        for game in games:
+            game_moves = merge_archived_moves(game, moves.get(game.id, []))
+            chunk.append((game.to_dict(move_count=0) | {'move_count': len(game_moves)}, game_moves))
+            # Keep the session's identity map from growing with the history
+            db.session.expunge(game)
+        yield chunk
+
+        after = (games[-1].created_at, games[-1].id)
+
+
+def iter_ndjson(chunks):
+    # One line per game, moves included
+    for chunk in chunks:
+        lines = []
+        for game, moves in chunk:
+            game['moves'] = [{field: move[field] for field in MOVE_FIELDS} for move in moves]
+            lines.append(json.dumps(game, separators=(',', ':')) + '\n')
+        yield ''.join(lines).encode('utf-8')
+
+
+def iter_csv(chunks):
+    # One row per move; games without moves get a single row with empty move columns
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for chunk in chunks:
+        for game, moves in chunk:
+            game_values = [game[field] for field in GAME_FIELDS]
+            for move in moves or [None]:
+                move_values = [move[field] for field in MOVE_FIELDS] if move else [''] * len(MOVE_FIELDS)
+                writer.writerow(game_values + move_values)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+
+def gzip_stream(chunks, level=6):
+    # Compresses on the fly; each chunk is flushed so the client sees steady progress
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
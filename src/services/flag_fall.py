@@ -0,0 +1,382 @@
+import threading
+import time
+from datetime import datetime
+from sqlalchemy import and_, func, select
+from src.models.user import db, Game
+from src.models.move_history import MoveHistory
+from src.services.events import game_events
+
+# Ends active games whose player to move has run out of time, so a game left
+# running in a closed tab still finishes with a winner.
+#
+# Every active game has one timer at the moment the player to move flags: for
+# a game timed in the browser that is the time of its last saved move plus
+# what the player to move had left on their previous move (or the full time
+# control before their first one), plus FLAG_FALL_GRACE seconds for sync
+# delays; for a running server clock it is GameClock.next_deadline(). A
+# browser game paused through POST /api/games/<game_id>/sync has no timer
+# until it is resumed, and its turn is then counted from the resume. Games
+# with flag_fall = False (stored before the scheduler, imported, or started
+# offline and uploaded through /sync) are never watched. Timers live in a hashed timer wheel: one slot per
+# tick, so scheduling, rescheduling and cancelling are a couple of dict
+# operations whatever the number of games, and one background thread works
+# through the slots. Nothing is trusted blindly when a timer fires: the game
+# is re-read (clock from the state backend, moves from SQLite) and completed
+# through the same path as POST /api/games/<game_id>/complete only if its
+# flag really fell; otherwise it is rescheduled. That keeps every worker
+# process correct with timers built from the moves it happened to serve.
+# Workers share the check: the game's lock is held only to re-read its row by
+# primary key and claim it, never across the completion itself.
+
+COLORS = ('black', 'white')
+FLAG_FALL_KEY = 'flag-fall:'
+CLAIM_TIMEOUT = 60  # seconds before a claim left by a crashed worker lapses
+
+
+class TimerWheel:
+    # Hashed timer wheel. A timer goes into the slot of its tick modulo the
+    # number of slots; timers further out than one turn of the wheel share a
+    # slot with nearer ones and are kept until their turn comes round.
+
+    def __init__(self, now, tick=1.0, slots=4096):
+        self.tick = tick
+        self.slots = [{} for _ in range(slots)]  # key -> tick
+        self.ticks = {}  # key -> tick, to find a key's slot
+        self.position = int(now // tick)  # first tick not processed yet
+
+    def __len__(self):
+        return len(self.ticks)
+
+    def __contains__(self, key):
+        return key in self.ticks
+
+    def schedule(self, key, deadline):
+        # Rounded up, so a timer never fires before its deadline
+        tick = max(-int(-deadline // self.tick), self.position)
+        self.cancel(key)
+        self.ticks[key] = tick
+        self.slots[tick % len(self.slots)][key] = tick
+
+    def cancel(self, key):
+        tick = self.ticks.pop(key, None)
+        if tick is not None:
+            del self.slots[tick % len(self.slots)][key]
+
+    def advance(self, now):
+        # Removes and returns the keys whose deadline is at or before now
+        end = int(now // self.tick)
+        count = len(self.slots)
+        due = []
+        # After a stall longer than one turn each slot is still visited once
+        for position in range(self.position, min(end + 1, self.position + count)):
+            slot = self.slots[position % count]
+            expired = [key for key, tick in slot.items() if tick <= end]
+            for key in expired:
+                del slot[key]
+                del self.ticks[key]
+            due.extend(expired)
+        self.position = max(self.position, end + 1)
+        return due
+
+
+class GameWatch:
+    # What a game timed in the browser needs to know its next flag fall: the
+    # seconds each player has at the start of their turn and who moves next
+    __slots__ = (
+        'game_id', 'byoyomi_time', 'remaining', 'numbers', 'move_number', 'to_move', 'turn_started', 'paused'
+    )
+
+    def __init__(self, game_id, main_time, byoyomi_time, byoyomi_periods, started):
+        self.game_id = game_id
+        self.byoyomi_time = byoyomi_time
+        full = main_time + byoyomi_time * byoyomi_periods
+        self.remaining = [full, full]
+        self.numbers = [0, 0]  # last move number seen per color
+        self.move_number = 0
+        self.to_move = 0  # index into COLORS, black moves first
+        self.turn_started = started
+        self.paused = False
+
+    def record(self, move, now):
+        # A move as saved by the client: its clock values are the mover's
+        # after the move, and a byo-yomi period resets once the move is made
+        color = COLORS.index(move['player_color'])
+        number = move['move_number']
+        if number > self.numbers[color]:
+            self.numbers[color] = number
+            periods = move['byoyomi_periods_remaining'] or 0
+            if move['in_byoyomi']:
+                self.remaining[color] = self.byoyomi_time * periods
+            else:
+                self.remaining[color] = (move['main_time_remaining'] or 0) + self.byoyomi_time * periods
+        if number > self.move_number:
+            self.move_number = number
+            self.to_move = 1 - color
+            self.turn_started = now
+            # Nobody can move on a paused clock, so a new move means it runs again
+            self.paused = False
+
+    def pause(self, paused, now):
+        # The browser clock was paused or resumed. The time the player to move
+        # used before the pause isn't known, so the turn restarts at the resume.
+        self.paused = paused
+        if not paused:
+            self.turn_started = max(self.turn_started, now)
+
+    def deadline(self, grace):
+        # None while paused
+        if self.paused:
+            return None
+        return self.turn_started + self.remaining[self.to_move] + grace
+
+
+def _timestamp(value):
+    # Naive UTC datetimes from the database as time.time() seconds
+    return (value - datetime(1970, 1, 1)).total_seconds() if value else time.time()
+
+
+def game_version(game_id):
+    # What a move, completion, pause or resume changes on the game row
+    return db.session.execute(
+        select(Game.status, Game.revision, Game.paused_at, Game.resumed_at).where(Game.id == game_id)
+    ).first()
+
+
+def load_watches(game_id=None):
+    # GameWatch of every watched active game (or just game_id), from the
+    # game's time control, its pause state and the last stored move of each color
+    games = select(
+        Game.id, Game.main_time, Game.byoyomi_time, Game.byoyomi_periods, Game.created_at,
+        Game.paused_at, Game.resumed_at
+    ).where(Game.status == 'active', Game.flag_fall.is_(True))
+    if game_id is not None:
+        games = games.where(Game.id == game_id)
+    rows = db.session.execute(games).all()
+    watches = {
+        row.id: GameWatch(row.id, row.main_time, row.byoyomi_time, row.byoyomi_periods, _timestamp(row.created_at))
+        for row in rows
+    }
+    if not watches:
+        return watches
+
+    ranked = select(
+        MoveHistory.game_id, MoveHistory.move_number, MoveHistory.player_color,
+        MoveHistory.main_time_remaining, MoveHistory.byoyomi_periods_remaining,
+        MoveHistory.in_byoyomi, MoveHistory.created_at,
+        func.row_number().over(
+            partition_by=(MoveHistory.game_id, MoveHistory.player_color),
+            order_by=MoveHistory.move_number.desc()
+        ).label('rank')
+    ).join(Game, and_(Game.id == MoveHistory.game_id, Game.user_id == MoveHistory.user_id)).where(
+        Game.status == 'active', Game.flag_fall.is_(True)
+    )
+    if game_id is not None:
+        ranked = ranked.where(MoveHistory.game_id == game_id)
+    ranked = ranked.subquery()
+    for row in db.session.execute(select(ranked).where(ranked.c.rank == 1)).mappings():
+        watches[row['game_id']].record(row, _timestamp(row['created_at']))
+    # A move saved after the pause means the clock was running again
+    for row in rows:
+        watch = watches[row.id]
+        if row.paused_at is not None and _timestamp(row.paused_at) >= watch.turn_started:
+            watch.pause(True, _timestamp(row.paused_at))
+        elif row.resumed_at is not None:
+            watch.pause(False, _timestamp(row.resumed_at))
+    return watches
+
+
+class FlagFallScheduler:
+
+    def __init__(self, clock=time.time, tick=1.0, grace=120.0):
+        self.clock = clock
+        self.tick = tick
+        self.grace = grace
+        self.enabled = False
+        self.app = None
+        self.backend = None
+        self.wheel = TimerWheel(clock(), tick)
+        self._watches = {}  # game_id -> GameWatch, games timed in the browser
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.checks = 0
+        self.flag_falls = 0
+
+    def init_app(self, app, backend):
+        self.app = app
+        self.backend = backend
+        self.enabled = app.config.get('FLAG_FALL_SCHEDULER', False)
+        self.grace = app.config.get('FLAG_FALL_GRACE', self.grace)
+        self.tick = app.config.get('FLAG_FALL_TICK', self.tick)
+        self.wheel = TimerWheel(self.clock(), self.tick)
+
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='flag-fall-scheduler', daemon=True)
+            self._thread.start()
+
+    def watch_game(self, game):
+        # A game just created, before its first move
+        if not self.enabled:
+            return
+        watch = GameWatch(game.id, game.main_time, game.byoyomi_time, game.byoyomi_periods, self.clock())
+        with self._lock:
+            self._watches[game.id] = watch
+            self._schedule(watch)
+
+    def record_moves(self, rows):
+        # Called for every batch of stored moves; a game this process hasn't
+        # seen yet is looked up in the database on the next tick
+        if not self.enabled:
+            return
+        now = self.clock()
+        with self._lock:
+            for row in sorted(rows, key=lambda row: row['move_number']):
+                watch = self._watches.get(row['game_id'])
+                if watch is None:
+                    if row['game_id'] not in self.wheel:
+                        self.wheel.schedule(row['game_id'], now)
+                    continue
+                watch.record(row, now)
+                self._schedule(watch)
+
+    def pause_game(self, game_id, paused):
+        # The browser clock of a game was paused or resumed (see move_sync.py)
+        if not self.enabled:
+            return
+        now = self.clock()
+        with self._lock:
+            watch = self._watches.get(game_id)
+            if watch is None:
+                if game_id not in self.wheel:
+                    self.wheel.schedule(game_id, now)
+                return
+            watch.pause(paused, now)
+            self._schedule(watch)
+
+    def watch_clock(self, game_id, deadline, clock_now):
+        # A server clock changed; deadline is monotonic like the clock, None while paused
+        if not self.enabled:
+            return
+        with self._lock:
+            if deadline is None:
+                self.wheel.cancel(game_id)
+            else:
+                self.wheel.schedule(game_id, self.clock() + deadline - clock_now)
+
+    def cancel(self, game_id):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.wheel.cancel(game_id)
+            self._watches.pop(game_id, None)
+
+    def _schedule(self, watch):
+        # Caller holds self._lock
+        deadline = watch.deadline(self.grace)
+        if deadline is None:
+            self.wheel.cancel(watch.game_id)
+        else:
+            self.wheel.schedule(watch.game_id, deadline)
+
+    def due(self):
+        with self._lock:
+            return self.wheel.advance(self.clock())
+
+    def shutdown(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def metrics(self):
+        # Gauges and counters for src/services/metrics.py
+        return [
+            ('gotimer_flag_fall_timers', 'gauge', 'Active games with a flag-fall timer', len(self.wheel)),
+            ('gotimer_flag_fall_checks_total', 'counter', 'Flag-fall timers that fired and were checked', self.checks),
+            ('gotimer_flag_falls_total', 'counter', 'Games completed on time by the scheduler', self.flag_falls)
+        ]
+
+    def _run(self):
+        try:
+            with self.app.app_context():
+                watches = load_watches()
+            with self._lock:
+                for game_id, watch in watches.items():
+                    self._watches[game_id] = watch
+                    self._schedule(watch)
+        except Exception:
+            self.app.logger.exception('Failed to load active games for flag-fall detection')
+
+        while not self._stopped.wait(self.tick):
+            for game_id in self.due():
+                with self.app.app_context():
+                    try:
+                        self._expire(game_id)
+                    except Exception:
+                        db.session.rollback()
+                        self.app.logger.exception('Flag-fall check failed for game %s', game_id)
+
+    def _expire(self, game_id):
+        # Imported here because clock.py and move_buffer.py import this module
+        from src.services.clock import clock_table, persist_finished_game, mark_game_completed
+        from src.services.move_buffer import move_buffer
+
+        self.checks += 1
+        state = clock_table.get(game_id, with_moves=False)
+        if state is not None:
+            now = clock_table.clock()
+            if not state.live(now)[4]:
+                self.watch_clock(game_id, state.next_deadline(), now)
+                return
+            # Same as a press after the flag fell
+            state = clock_table.finish(game_id)
+            if state is None:
+                return  # Finished by another worker
+            winner = COLORS[1 - state.current]
+            persist_finished_game(state, winner)
+            self.flag_falls += 1
+            game_events.publish(game_id, 'complete', {'winner': winner, 'flagged': COLORS[state.current]})
+            return
+
+        move_buffer.flush()
+        version = game_version(game_id)
+        watch = load_watches(game_id).get(game_id)
+        db.session.rollback()  # Ends the read transaction before the claim
+        with self._lock:
+            if watch is None:
+                self._watches.pop(game_id, None)
+                return
+            deadline = watch.deadline(self.grace)
+            if deadline is None or deadline > self.clock():
+                self._watches[game_id] = watch
+                self._schedule(watch)
+                return
+
+        # Claim the game so only one worker completes it, and only if nothing
+        # changed since it was read; otherwise check again on the next tick
+        key = FLAG_FALL_KEY + game_id
+        with self.backend.lock(key):
+            claimed = self.backend.get(key)
+            if claimed is not None and claimed > time.time() - CLAIM_TIMEOUT:
+                # Being completed elsewhere; looked at again if that worker dies
+                with self._lock:
+                    self.wheel.schedule(game_id, self.clock() + CLAIM_TIMEOUT)
+                return
+            if game_version(game_id) != version:
+                db.session.rollback()
+                with self._lock:
+                    self.wheel.schedule(game_id, self.clock())
+                return
+            db.session.rollback()
+            self.backend.set(key, time.time())
+
+        try:
+            winner = COLORS[1 - watch.to_move]
+            mark_game_completed(db.session.get(Game, game_id), winner)
+            self.flag_falls += 1
+            game_events.publish(game_id, 'complete', {'winner': winner, 'flagged': COLORS[watch.to_move]})
+        finally:
+            self.backend.pop(key)
+
+
+flag_scheduler = FlagFallScheduler()
@@ -0,0 +1,247 @@
+import hashlib
+import json
+import os
+import re
+
+# Parsers for game archives: SGF files and the JSON produced by /api/export.
+#
+# Everything here is pure Python with no database or Flask imports, so it can
+# run in the worker processes of src/services/game_import.py. Games come out
+# as plain dicts shaped like the export rows; `id` is None for SGF games and
+# `key` is a content hash the importer turns into a stable UUID.
+
+SGF_TOKEN = re.compile(r'([();])|([A-Za-z]+)((?:\s*\[(?:\\.|[^\]\\])*\])+)', re.S)
+SGF_VALUE = re.compile(r'\[((?:\\.|[^\]\\])*)\]', re.S)
+SGF_ESCAPE = re.compile(r'\\(\r\n|\n\r|\n|\r|.)', re.S)
+OVERTIME = re.compile(r'(\d+)\s*[x×]\s*(\d+(?:\.\d+)?)', re.I)
+
+
+def _unescape(value):
+    # Escaped line breaks are soft breaks and vanish; other escapes keep the character
+    return SGF_ESCAPE.sub(lambda m: '' if m.group(1) in ('\n', '\r', '\r\n', '\n\r') else m.group(1), value)
+
+
+def sgf_main_lines(text):
+    # Returns the node list of each game tree, following the first variation
+    # at every branch. Nodes are dicts of property -> list of values.
+    games = []
+    nodes = None
+    depth = 0
+    skip_depth = None
+    descended = set()
+
+    for match in SGF_TOKEN.finditer(text):
+        token, ident, values = match.groups()
+        if token == '(':
+            depth += 1
+            if skip_depth is not None:
+                continue
+            if depth == 1:
+                nodes = []
+                descended = set()
+            elif depth - 1 in descended:
+                skip_depth = depth
+            else:
+                descended.add(depth - 1)
+        elif token == ')':
+            if skip_depth == depth:
+                skip_depth = None
+            elif skip_depth is None and depth == 1:
+                if nodes:
+                    games.append(nodes)
+                nodes = None
+            depth = max(depth - 1, 0)
+        elif skip_depth is not None or nodes is None:
+            continue
+        elif token == ';':
+            nodes.append({})
+        elif nodes:
+            # FF[3] allows lowercase letters inside identifiers
+            name = ''.join(ch for ch in ident if ch.isupper())
+            nodes[-1][name] = [_unescape(v) for v in SGF_VALUE.findall(values)]
+
+    return games
+
+
+def _number(value, default=None):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _sgf_date(value):
+    # DT may list several dates ("2021-03-04,05"); the first one is the start
+    match = re.match(r'(\d{4})-(\d{2})-(\d{2})', value or '')
+    return f'{match.group(1)}-{match.group(2)}-{match.group(3)}T00:00:00' if match else None
+
+
+def _sgf_winner(result):
+    if result.upper().startswith('B+'):
+        return 'black'
+    if result.upper().startswith('W+'):
+        return 'white'
+    return None
+
+
+def sgf_game(nodes):
+    root = nodes[0]
+    prop = lambda node, name: node.get(name, [''])[0]
+
+    main_time = int(_number(prop(root, 'TM'), 0))
+    overtime = OVERTIME.search(prop(root, 'OT'))
+    byoyomi_periods = int(overtime.group(1)) if overtime else 0
+    byoyomi_time = int(float(overtime.group(2))) if overtime else 0
+
+    title = prop(root, 'GN')
+    if not title and (root.get('PB') or root.get('PW')):
+        title = f"{prop(root, 'PB') or '?'} vs {prop(root, 'PW') or '?'}"
+    created_at = _sgf_date(prop(root, 'DT'))
+
+    # Clock of each player after their last move: (main left, period left, periods, in byo-yomi)
+    clocks = {
+        color: (main_time, byoyomi_time, byoyomi_periods, False)
+        for color in ('black', 'white')
+    }
+    moves = []
+    for node in nodes:
+        if 'B' in node:
+            color, time_prop, periods_prop = 'black', 'BL', 'OB'
+        elif 'W' in node:
+            color, time_prop, periods_prop = 'white', 'WL', 'OW'
+        else:
+            continue
+
+        previous = clocks[color]
+        time_left = _number(prop(node, time_prop))
+        periods_left = _number(prop(node, periods_prop))
+
+        if time_left is None:
+            clock = previous
+            time_taken = 0
+        elif periods_left is not None and byoyomi_periods:
+            # OB/OW are only written once the player is in byo-yomi; BL/WL then
+            # hold what is left of the current period
+            clock = (0, int(time_left), int(periods_left), True)
+            if previous[3]:
+                used = previous[2] - clock[2]
+                time_taken = used * byoyomi_time + (byoyomi_time - time_left)
+            else:
+                used = byoyomi_periods - clock[2]
+                time_taken = previous[0] + used * byoyomi_time + (byoyomi_time - time_left)
+        else:
+            clock = (int(time_left), byoyomi_time, byoyomi_periods, False)
+            time_taken = previous[0] - time_left
+
+        clocks[color] = clock
+        moves.append({
+            'move_number': len(moves) + 1,
+            'player_color': color,
+            'time_taken': max(int(round(time_taken)), 0),
+            'main_time_remaining': clock[0],
+            'byoyomi_time_remaining': clock[1],
+            'byoyomi_periods_remaining': clock[2],
+            'in_byoyomi': clock[3],
+            'created_at': created_at,
+        })
+
+    key = hashlib.sha1(json.dumps(nodes, sort_keys=True).encode('utf-8')).hexdigest()
+    return {
+        'id': None,
+        'key': key,
+        'title': title or None,
+        'comment': prop(root, 'GC') or None,
+        'main_time': main_time,
+        'byoyomi_time': byoyomi_time,
+        'byoyomi_periods': byoyomi_periods,
+        'status': 'completed',
+        'winner': _sgf_winner(prop(root, 'RE')),
+        'created_at': created_at,
+        'completed_at': created_at,
+        'saved_at': None,
+        'moves': moves,
+    }
+
+
+def parse_sgf(text):
+    return [sgf_game(nodes) for nodes in sgf_main_lines(text) if nodes]
+
+
+def json_game(data):
+    # One game as written by /api/export (NDJSON line or array item)
+    if not isinstance(data, dict) or not isinstance(data.get('moves', []), list):
+        raise ValueError('Expected a game object with a moves list')
+
+    moves = []
+    for index, move in enumerate(data.get('moves', [])):
+        if not isinstance(move, dict) or 'player_color' not in move:
+            raise ValueError(f'Move {index + 1} has no player_color')
+        moves.append({
+            'move_number': int(move.get('move_number', index + 1)),
+            'player_color': str(move['player_color']),
+            'time_taken': int(move.get('time_taken') or 0),
+            'main_time_remaining': int(move.get('main_time_remaining') or 0),
+            'byoyomi_time_remaining': int(move.get('byoyomi_time_remaining') or 0),
+            'byoyomi_periods_remaining': int(move.get('byoyomi_periods_remaining') or 0),
+            'in_byoyomi': bool(move.get('in_byoyomi', False)),
+            'created_at': move.get('created_at'),
+        })
+
+    game_id = data.get('id')
+    if game_id is not None and (not isinstance(game_id, str) or len(game_id) > 36):
+        raise ValueError('Game id must be a UUID string')
+
+    return {
+        'id': game_id,
+        'key': hashlib.sha1(json.dumps(data, sort_keys=True).encode('utf-8')).hexdigest(),
+        'title': data.get('title'),
+        'comment': data.get('comment'),
+        'main_time': int(data.get('main_time') or 0),
+        'byoyomi_time': int(data.get('byoyomi_time') or 0),
+        'byoyomi_periods': int(data.get('byoyomi_periods') or 0),
+        'status': data.get('status') or 'completed',
+        'winner': data.get('winner') if data.get('winner') in ('white', 'black') else None,
+        'created_at': data.get('created_at'),
+        'completed_at': data.get('completed_at'),
+        'saved_at': data.get('saved_at'),
+        'moves': moves,
+    }
+
+
+def parse_json(text):
+    text = text.strip()
+    if not text:
+        return []
+    if text[0] == '[':
+        items = json.loads(text)
+    elif '\n' in text:
+        items = [json.loads(line) for line in text.splitlines() if line.strip()]
+    else:
+        items = [json.loads(text)]
+    return [json_game(item) for item in items]
+
+
+def document_format(name, text):
+    extension = os.path.splitext(name or '')[1].lower()
+    if extension == '.sgf':
+        return 'sgf'
+    if extension in ('.json', '.ndjson', '.jsonl'):
+        return 'json'
+    return 'sgf' if text.lstrip().startswith('(') else 'json'
+
+
+def parse_document(document):
+    # Worker entry point. document is (name, content) for uploads or
+    # (path, None) to read the file in the worker. Returns (name, games, error).
+    name, content = document
+    try:
+        if content is None:
+            with open(name, 'rb') as f:
+                content = f.read()
+        if isinstance(content, bytes):
+            content = content.decode('utf-8-sig', errors='replace')
+        if document_format(name, content) == 'sgf':
+            return name, parse_sgf(content), None
+        return name, parse_json(content), None
+    except Exception as e:
+        return name, [], f'{type(e).__name__}: {e}'
@@ -0,0 +1,189 @@
+import base64
+import re
+from datetime import datetime
+from sqlalchemy import func, select, text
+from sqlalchemy.orm import with_expression
+from src.models.user import db, Game
+from src.models.move_history import MoveHistory
+
+# Game history listing for GET /api/games, shared by the Flask route and the
+# async handler in src/asgi.py.
+#
+# Pages are fetched by keyset on (created_at, id) rather than OFFSET, so every
+# page is one range read on ix_games_user_created_id however deep it is. Each
+# game's move count comes with it from ix_move_history_user_game_move, so a
+# page is one statement however many moves its games have.
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+STATUSES = ('active', 'completed', 'abandoned', 'saved')
+WINNERS = ('white', 'black', 'none')  # 'none' matches draws and unfinished games
+TIME_CONTROL_FILTERS = ('main_time', 'byoyomi_time', 'byoyomi_periods')
+
+# Full-text index over Game.title and Game.comment. It reads its text from the
+# games table by rowid and triggers keep it in step with every insert, update
+# and delete. games has a TEXT primary key, so rebuild it after a VACUUM:
+#     INSERT INTO games_fts(games_fts) VALUES ('rebuild')
+SEARCH_TABLE = 'games_fts'
+SEARCH_DDL = (
+    f"CREATE VIRTUAL TABLE {SEARCH_TABLE} USING fts5("
+    f"title, comment, content='games', content_rowid='rowid')",
+    f"CREATE TRIGGER {SEARCH_TABLE}_insert AFTER INSERT ON games BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}(rowid, title, comment) VALUES (new.rowid, new.title, new.comment); END",
+    f"CREATE TRIGGER {SEARCH_TABLE}_delete AFTER DELETE ON games BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, title, comment) "
+    f"VALUES ('delete', old.rowid, old.title, old.comment); END",
+    f"CREATE TRIGGER {SEARCH_TABLE}_update AFTER UPDATE OF title, comment ON games BEGIN "
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, title, comment) "
+    f"VALUES ('delete', old.rowid, old.title, old.comment); "
+    f"INSERT INTO {SEARCH_TABLE}(rowid, title, comment) VALUES (new.rowid, new.title, new.comment); END",
+)
+
+
+class GameQueryError(ValueError):
+    pass
+
+
+def search_expression(query):
+    # Every word must match as a prefix; quoting keeps FTS5 syntax out of user input
+    terms = ['"' + term.replace('"', '""') + '"*' for term in query.split()]
+    return ' AND '.join(terms)
+
+
+def encode_cursor(game):
+    raw = f'{game.created_at.isoformat()}|{game.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, game_id = raw.split('|', 1)
+        return datetime.fromisoformat(created_at), game_id
+    except (ValueError, UnicodeDecodeError):
+        raise GameQueryError('Invalid cursor')
+
+
+def _parse_int(args, name):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise GameQueryError(f'{name} must be an integer')
+
+
+def _parse_date(args, name):
+    value = args.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise GameQueryError(f'{name} must be an ISO 8601 date')
+
+
+def parse_game_query(args):
+    # Validates the query string of GET /api/games
+    limit = _parse_int(args, 'limit')
+    if limit is None:
+        limit = DEFAULT_PAGE_SIZE
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise GameQueryError(f'limit must be between 1 and {MAX_PAGE_SIZE}')
+
+    status = args.get('status') or None
+    if status and status not in STATUSES:
+        raise GameQueryError(f"status must be one of {', '.join(STATUSES)}")
+
+    winner = args.get('winner') or None
+    if winner and winner not in WINNERS:
+        raise GameQueryError(f"winner must be one of {', '.join(WINNERS)}")
+
+    cursor = args.get('cursor')
+    return {
+        'limit': limit,
+        'cursor': decode_cursor(cursor) if cursor else None,
+        'status': status,
+        'winner': winner,
+        'time_control': {name: _parse_int(args, name) for name in TIME_CONTROL_FILTERS},
+        'created_after': _parse_date(args, 'created_after'),
+        'created_before': _parse_date(args, 'created_before'),
+        'search': (args.get('q') or '').strip() or None,
+    }
+
+
+def move_row_count():
+    # Correlated count of a game's move_history rows, for Game.move_row_count
+    return select(func.count()).where(
+        MoveHistory.user_id == Game.user_id,
+        MoveHistory.game_id == Game.id
+    ).scalar_subquery()
+
+
+def user_games_query(user_id, params=None):
+    # One page of a user's games, newest first, with Game.move_row_count
+    # loaded. Fetches one row past the page so the caller can tell whether
+    # another page follows.
+    params = params or parse_game_query({})
+    query = select(Game).where(Game.user_id == user_id).options(with_expression(Game.move_row_count, move_row_count()))
+
+    if params['cursor']:
+        created_at, game_id = params['cursor']
+        query = query.where(db.tuple_(Game.created_at, Game.id) < (created_at, game_id))
+    if params['status']:
+        query = query.where(Game.status == params['status'])
+    if params['winner'] == 'none':
+        query = query.where(Game.winner.is_(None))
+    elif params['winner']:
+        query = query.where(Game.winner == params['winner'])
+    for name, value in params['time_control'].items():
+        if value is not None:
+            query = query.where(getattr(Game, name) == value)
+    if params['created_after']:
+        query = query.where(Game.created_at >= params['created_after'])
+    if params['created_before']:
+        query = query.where(Game.created_at < params['created_before'])
+    if params['search']:
+        query = query.where(text(
+            f'games.rowid IN (SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH :search)'
+        ).bindparams(search=search_expression(params['search'])))
+
+    return query.order_by(Game.created_at.desc(), Game.id.desc()).limit(params['limit'] + 1)
+
+
+def filter_games(games, params):
+    # user_games_query() for games held in memory (src/services/guest_store.py).
+    # games have the Game attributes; search matches word prefixes like FTS5.
+    terms = params['search'].lower().split() if params['search'] else []
+
+    def matches(game):
+        if params['cursor'] and (game.created_at, game.id) >= params['cursor']:
+            return False
+        if params['status'] and game.status != params['status']:
+            return False
+        if params['winner'] and game.winner != (None if params['winner'] == 'none' else params['winner']):
+            return False
+        for name, value in params['time_control'].items():
+            if value is not None and getattr(game, name) != value:
+                return False
+        if params['created_after'] and game.created_at < params['created_after']:
+            return False
+        if params['created_before'] and game.created_at >= params['created_before']:
+            return False
+        if terms:
+            words = re.findall(r'\w+', f"{game.title or ''} {game.comment or ''}".lower())
+            return all(any(word.startswith(term) for word in words) for term in terms)
+        return True
+
+    games = sorted(filter(matches, games), key=lambda game: (game.created_at, game.id), reverse=True)
+    return games[:params['limit'] + 1]
+
+
+def page_games(games, limit):
+    # Returns the page and the cursor of the next one (None on the last page)
+    if len(games) <= limit:
+        return games, None
+    games = games[:limit]
+    return games, encode_cursor(games[-1])
@@ -0,0 +1,194 @@
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from sqlalchemy import select
+from src.models.user import db, Game
+from src.models.move_history import MoveHistory
+from src.services.game_formats import parse_document
+from src.services.game_history import STATUSES
+from src.services.move_buffer import move_row
+from src.services.stats_cache import stats_cache
+from src.services.revisions import bump_user
+from src.services.analytics import FINISHED_STATUSES, columns_from_moves, game_summary, store_game_summary
+from src.services.replay import replay_points, store_replay_points
+
+# Bulk import of SGF and exported JSON games for POST /api/import and
+# `flask import-games`.
+#
+# `flask import-games` parses documents in a process pool while the parent
+# inserts the games already parsed; POST /api/import parses them in the request
+# thread, so uploads never start processes. Either way games are inserted
+# batch_size games (and all their moves) per transaction with two executemany
+# statements. A game whose UUID is already stored is skipped,
+# so re-running an import is a no-op; one owned by another user is counted
+# as a conflict and left alone. SGF games have no UUID; theirs is derived
+# from the importing user and the game's content. Parsed games get the same
+# checks as games and moves saved through the API before they are inserted;
+# a game that fails them is reported as an error and not imported.
+
+IMPORT_NAMESPACE = uuid.UUID('0b7e3a52-5c4e-4f0e-9d3e-6a2f4c1b8d90')
+IMPORT_EXTENSIONS = ('.sgf', '.json', '.ndjson', '.jsonl')
+
+GAME_COLUMNS = (
+    'id', 'user_id', 'title', 'comment', 'main_time', 'byoyomi_time', 'byoyomi_periods',
+    'status', 'winner', 'created_at', 'completed_at', 'saved_at',
+    'archived_move_count', 'archived_move_time',
+)
+
+
+def import_paths(paths):
+    # Files to import; directories are searched recursively
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                found.extend(
+                    os.path.join(root, name) for name in sorted(names)
+                    if name.lower().endswith(IMPORT_EXTENSIONS)
+                )
+        else:
+            found.append(path)
+    return found
+
+
+def _datetime(value, default):
+    if not value:
+        return default
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _game_id(user_id, game):
+    return game['id'] or str(uuid.uuid5(IMPORT_NAMESPACE, f"{user_id}:{game['key']}"))
+
+
+def checked_game(user_id, game):
+    # Raises ValueError (MoveDataError for a move) if the API would refuse the game
+    if game['status'] not in STATUSES:
+        raise ValueError(f"status must be one of {', '.join(STATUSES)}")
+    for field in ('main_time', 'byoyomi_time', 'byoyomi_periods'):
+        if game[field] < 0:
+            raise ValueError(f'{field} must not be negative')
+    moves = []
+    for move in game['moves']:
+        row = move_row(move, user_id, None)
+        del row['user_id'], row['game_id']
+        moves.append(dict(row, created_at=move['created_at']))
+    return dict(game, moves=moves)
+
+
+def insert_games(user_id, games, report):
+    # Writes one batch in a single transaction, skipping games already stored
+    batch = {}
+    for game in games:
+        batch.setdefault(_game_id(user_id, game), game)
+
+    existing = dict(db.session.execute(select(Game.id, Game.user_id).where(Game.id.in_(list(batch)))).all())
+    conflicting = sum(1 for owner in existing.values() if owner != user_id)
+    report['games_skipped'] += len(games) - len(batch) + len(existing) - conflicting
+    report['games_conflicting'] += conflicting
+
+    now = datetime.utcnow()
+    game_rows = []
+    move_rows = []
+    for game_id, game in batch.items():
+        if game_id in existing:
+            continue
+        created_at = _datetime(game['created_at'], now)
+        row = {column: game.get(column) for column in GAME_COLUMNS}
+        row.update(
+            id=game_id,
+            user_id=user_id,
+            created_at=created_at,
+            completed_at=_datetime(game['completed_at'], None),
+            saved_at=_datetime(game['saved_at'], None),
+            archived_move_count=0,
+            archived_move_time=0,
+            # Timed somewhere else, so never completed by the flag-fall scheduler
+            flag_fall=False,
+        )
+        game_rows.append(row)
+        for move in game['moves']:
+            move_rows.append(dict(
+                move,
+                user_id=user_id,
+                game_id=game_id,
+                created_at=_datetime(move['created_at'], created_at)
+            ))
+
+    if game_rows:
+        db.session.execute(Game.__table__.insert(), game_rows)
+    if move_rows:
+        db.session.execute(MoveHistory.__table__.insert(), move_rows)
+    # Finished games arrive with their move timing analytics and replay points already computed
+    for row in game_rows:
+        if row['status'] in FINISHED_STATUSES:
+            columns = columns_from_moves(batch[row['id']]['moves'])
+            store_game_summary(row['id'], user_id, game_summary(columns, row['byoyomi_periods']))
+            points = replay_points(row['main_time'], row['byoyomi_time'], row['byoyomi_periods'], columns)
+            store_replay_points(row['id'], user_id, points)
+    if game_rows:
+        bump_user(user_id)
+    db.session.commit()
+
+    report['games_imported'] += len(game_rows)
+    report['moves_imported'] += len(move_rows)
+
+
+def import_documents(user_id, documents, workers=None, batch_size=500):
+    # documents are (name, content) pairs, or (path, None) to read from disk
+    report = {
+        'documents': len(documents),
+        'games_parsed': 0,
+        'games_imported': 0,
+        'games_skipped': 0,
+        'games_conflicting': 0,  # UUID already used by another user's game
+        'games_invalid': 0,
+        'moves_imported': 0,
+        'errors': [],
+    }
+    started = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+
+    executor = None
+    if workers > 1 and len(documents) > 1:
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(documents)))
+        results = executor.map(parse_document, documents, chunksize=max(1, min(64, len(documents) // (workers * 4))))
+    else:
+        results = map(parse_document, documents)
+
+    try:
+        pending = []
+        for name, games, error in results:
+            if error:
+                report['errors'].append({'document': os.path.basename(name or ''), 'error': error})
+            report['games_parsed'] += len(games)
+            for index, game in enumerate(games):
+                try:
+                    pending.append(checked_game(user_id, game))
+                except ValueError as e:
+                    report['games_invalid'] += 1
+                    report['errors'].append({'document': os.path.basename(name or ''), 'error': f'Game {index + 1}: {e}'})
+            if len(pending) >= batch_size:
+                insert_games(user_id, pending, report)
+                pending = []
+        if pending:
+            insert_games(user_id, pending, report)
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+        if report['games_imported']:
+            stats_cache.invalidate(user_id)
+
+    seconds = time.perf_counter() - started
+    report['seconds'] = round(seconds, 3)
+    report['games_per_second'] = round(report['games_imported'] / seconds, 1) if seconds else 0
+    report['moves_per_second'] = round(report['moves_imported'] / seconds, 1) if seconds else 0
+    return report
@@ -0,0 +1,290 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from src.services.game_history import filter_games, page_games
+from src.services.game_import import insert_games
+from src.services.stats_cache import stats_cache
+
+# In-memory store for guest games, so guests get game history, stats and
+# move sync without writing guest rows into app.db.
+#
+# Games sit in one ring ordered by their last write: writes move a game to the
+# end, and the oldest game is dropped once GUEST_STORE_MAX_GAMES games or
+# GUEST_STORE_MAX_MOVES moves are held, or GUEST_STORE_TTL seconds after its
+# last write. Memory is therefore bounded by the caps, not by traffic. Each
+# worker process has its own store, so a guest's games live in the worker that
+# served them; src/main.py only runs several workers with STICKY_SESSIONS=1.
+# On registration or login the guest's games are promoted to
+# real Game and MoveHistory rows (see promote_guest_games).
+
+MOVE_FIELDS = (
+    'move_number', 'player_color', 'time_taken', 'main_time_remaining',
+    'byoyomi_time_remaining', 'byoyomi_periods_remaining', 'in_byoyomi', 'created_at',
+)
+
+
+class GuestStoreError(ValueError):
+    pass
+
+
+class GuestGame:
+    __slots__ = (
+        'id', 'guest_id', 'title', 'comment', 'main_time', 'byoyomi_time', 'byoyomi_periods',
+        'status', 'winner', 'created_at', 'completed_at', 'saved_at', 'moves', 'expires_at',
+    )
+
+    def __init__(self, game_id, guest_id, main_time, byoyomi_time, byoyomi_periods):
+        self.id = game_id
+        self.guest_id = guest_id
+        self.title = None
+        self.comment = None
+        self.main_time = main_time
+        self.byoyomi_time = byoyomi_time
+        self.byoyomi_periods = byoyomi_periods
+        self.status = 'active'
+        self.winner = None
+        self.created_at = datetime.utcnow()
+        self.completed_at = None
+        self.saved_at = None
+        self.moves = {}  # move_number -> tuple of MOVE_FIELDS
+        self.expires_at = 0
+
+    def to_dict(self):
+        # Same shape as Game.to_dict()
+        return {
+            'id': self.id,
+            'user_id': self.guest_id,
+            'title': self.title,
+            'comment': self.comment,
+            'main_time': self.main_time,
+            'byoyomi_time': self.byoyomi_time,
+            'byoyomi_periods': self.byoyomi_periods,
+            'status': self.status,
+            'winner': self.winner,
+            'created_at': self.created_at.isoformat(),
+            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'saved_at': self.saved_at.isoformat() if self.saved_at else None,
+            'move_count': len(self.moves)
+        }
+
+    def move_dicts(self, after=0):
+        # Same shape as MoveHistory.to_dict(); guest moves have no row id
+        return [
+            dict(zip(MOVE_FIELDS, values), id=None, user_id=self.guest_id, game_id=self.id,
+                 created_at=values[-1].isoformat())
+            for number, values in sorted(self.moves.items()) if number > after
+        ]
+
+
+class GuestGameStore:
+
+    def __init__(self, max_games=10000, max_moves=200000, max_moves_per_game=1000, ttl=86400, clock=time.monotonic):
+        self.max_games = max_games
+        self.max_moves = max_moves
+        self.max_moves_per_game = max_moves_per_game
+        self.ttl = ttl
+        self.clock = clock
+        self._games = OrderedDict()  # game id -> GuestGame, least recently written first
+        self._guests = {}  # guest id -> set of game ids
+        self._move_count = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def init_app(self, app):
+        self.max_games = app.config.get('GUEST_STORE_MAX_GAMES', self.max_games)
+        self.max_moves = app.config.get('GUEST_STORE_MAX_MOVES', self.max_moves)
+        self.max_moves_per_game = app.config.get('GUEST_STORE_MAX_MOVES_PER_GAME', self.max_moves_per_game)
+        self.ttl = app.config.get('GUEST_STORE_TTL', self.ttl)
+
+    def create_game(self, guest_id, game_id, settings=None):
+        with self._lock:
+            game = self._game(guest_id, game_id) or self._create(guest_id, game_id, settings)
+            self._touch(game)
+            return game.to_dict()
+
+    def add_moves(self, guest_id, game_id, rows, settings=None):
+        # Stores moves whose number the game doesn't have yet, creating the
+        # game if needed. Returns the move numbers that were stored.
+        with self._lock:
+            game = self._game(guest_id, game_id) or self._create(guest_id, game_id, settings)
+
+            new_numbers = {row['move_number'] for row in rows} - set(game.moves)
+            if len(game.moves) + len(new_numbers) > self.max_moves_per_game:
+                raise GuestStoreError(f'Guest games are limited to {self.max_moves_per_game} moves')
+
+            now = datetime.utcnow()
+            accepted = []
+            for row in rows:
+                if row['move_number'] not in game.moves:
+                    game.moves[row['move_number']] = tuple(row.get(field) for field in MOVE_FIELDS[:-1]) + (now,)
+                    accepted.append(row['move_number'])
+            self._move_count += len(accepted)
+            self._touch(game)
+            return accepted
+
+    def sync(self, guest_id, game_id, since, moves, settings=None):
+        # Same contract as src/services/move_sync.py: first stored move wins
+        accepted = set(self.add_moves(guest_id, game_id, moves, settings))
+        with self._lock:
+            game = self._game(guest_id, game_id)
+            stored = game.move_dicts(since) if game else []
+        return {
+            'moves': [move for move in stored if move['move_number'] not in accepted],
+            'accepted': sorted(accepted),
+            'conflicts': sorted({move['move_number'] for move in moves} - accepted),
+            'last_move_number': max([since] + [move['move_number'] for move in stored])
+        }
+
+    def update_game(self, guest_id, game_id, **fields):
+        with self._lock:
+            game = self._game(guest_id, game_id)
+            if game is None:
+                return None
+            for name, value in fields.items():
+                setattr(game, name, value)
+            self._touch(game)
+            return game.to_dict()
+
+    def game(self, guest_id, game_id, with_moves=False):
+        with self._lock:
+            game = self._game(guest_id, game_id)
+            if game is None:
+                return None
+            data = game.to_dict()
+            if with_moves:
+                data['moves'] = game.move_dicts()
+            return data
+
+    def games(self, guest_id, params):
+        # One page of GET /api/games: (games, next cursor)
+        with self._lock:
+            games, next_cursor = page_games(filter_games(self._guest_games(guest_id), params), params['limit'])
+            return [game.to_dict() for game in games], next_cursor
+
+    def games_with_moves(self, guest_id):
+        with self._lock:
+            return [dict(game.to_dict(), moves=game.move_dicts()) for game in self._guest_games(guest_id)]
+
+    def user_stats(self, guest_id):
+        # Raw totals in the shape of stats_cache.load_user_stats()
+        with self._lock:
+            games = self._guest_games(guest_id)
+            return {
+                'total_games': len(games),
+                'completed_games': sum(1 for game in games if game.status == 'completed'),
+                'wins_as_white': sum(1 for game in games if game.status == 'completed' and game.winner == 'white'),
+                'wins_as_black': sum(1 for game in games if game.status == 'completed' and game.winner == 'black'),
+                'total_moves': sum(len(game.moves) for game in games),
+                'total_move_time': sum(move[2] or 0 for game in games for move in game.moves.values())
+            }
+
+    def pop_games(self, guest_id):
+        # Removes the guest's games and returns them shaped like the parsed
+        # games src/services/game_import.py inserts
+        with self._lock:
+            exported = []
+            for game in self._guest_games(guest_id):
+                data = game.to_dict()
+                data['moves'] = [
+                    {field: move[field] for field in MOVE_FIELDS}
+                    for move in game.move_dicts()
+                ]
+                exported.append(data)
+                self._remove(game)
+            return exported
+
+    def usage(self):
+        with self._lock:
+            return {
+                'games': len(self._games),
+                'moves': self._move_count,
+                'guests': len(self._guests),
+                'max_games': self.max_games,
+                'max_moves': self.max_moves,
+                'ttl': self.ttl,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+    def metrics(self):
+        # Gauges and counters for src/services/metrics.py
+        usage = self.usage()
+        return [
+            ('gotimer_guest_store_games', 'gauge', 'Guest games held in memory', usage['games']),
+            ('gotimer_guest_store_moves', 'gauge', 'Guest moves held in memory', usage['moves']),
+            ('gotimer_guest_store_evictions_total', 'counter', 'Guest games dropped by the size caps', usage['evictions']),
+            ('gotimer_guest_store_expirations_total', 'counter', 'Guest games dropped by the TTL', usage['expirations'])
+        ]
+
+    def _create(self, guest_id, game_id, settings):
+        # Caller holds the lock
+        if game_id in self._games or len(game_id) > 36:
+            raise GuestStoreError('Invalid game id')
+        settings = settings or {}
+        game = GuestGame(
+            game_id, guest_id,
+            settings.get('main_time', 600),
+            settings.get('byoyomi_time', 30),
+            settings.get('byoyomi_periods', 3)
+        )
+        self._games[game_id] = game
+        self._guests.setdefault(guest_id, set()).add(game_id)
+        return game
+
+    def _guest_games(self, guest_id):
+        # Caller holds the lock
+        games = [self._game(guest_id, game_id) for game_id in list(self._guests.get(guest_id, ()))]
+        return [game for game in games if game is not None]
+
+    def _game(self, guest_id, game_id):
+        # Caller holds the lock
+        game = self._games.get(game_id)
+        if game is None or game.guest_id != guest_id:
+            return None
+        if game.expires_at <= self.clock():
+            self._remove(game)
+            self.expirations += 1
+            return None
+        return game
+
+    def _touch(self, game):
+        game.expires_at = self.clock() + self.ttl
+        self._games.move_to_end(game.id)
+
+        # Expired games are at the front of the ring, followed by the least recently written
+        now = self.clock()
+        while self._games:
+            oldest = next(iter(self._games.values()))
+            if oldest.expires_at <= now:
+                self.expirations += 1
+            elif oldest is not game and (len(self._games) > self.max_games or self._move_count > self.max_moves):
+                self.evictions += 1
+            else:
+                break
+            self._remove(oldest)
+
+    def _remove(self, game):
+        del self._games[game.id]
+        self._move_count -= len(game.moves)
+        game_ids = self._guests.get(game.guest_id)
+        if game_ids is not None:
+            game_ids.discard(game.id)
+            if not game_ids:
+                del self._guests[game.guest_id]
+
+
+guest_store = GuestGameStore()
+
+
+def promote_guest_games(guest_id, user_id):
+    # Moves a guest's games into the database under the account they just
+    # registered or logged in to. Returns the number of games stored.
+    games = guest_store.pop_games(guest_id)
+    if not games:
+        return 0
+    report = {'games_imported': 0, 'games_skipped': 0, 'games_conflicting': 0, 'moves_imported': 0}
+    insert_games(user_id, games, report)
+    stats_cache.invalidate(user_id)
+    return report['games_imported']
@@ -0,0 +1,252 @@
+import bisect
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from flask import Response, g, has_request_context, request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+
+# Opt-in request instrumentation (METRICS_ENABLED=1) for the Flask app:
+#
+# - latency histogram and response counts per endpoint
+# - SQL statements per request and per-statement duration, via engine events
+# - JSON serialization time, via a timing JSON provider
+#
+# GET /api/metrics renders them in the Prometheus text format. With
+# PROFILER_ENABLED=1 a sampling thread also records the stacks of threads that
+# are serving a request, per route, and GET /api/metrics/profile returns them
+# as folded stacks ("route;outer;inner count") for flamegraph.pl or speedscope.
+#
+# Routes served by the native async handlers in src/asgi.py (move saves, the
+# game listing and the event stream) bypass Flask and are not included; time
+# them at the ASGI server or proxy instead.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SQL_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+FAST_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1)
+
+BACKGROUND = 'background'  # SQL issued outside a request, e.g. the move buffer flusher
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+        lines.append(f'{name}_sum{_labels(labels)} {self.sum:.6f}')
+        lines.append(f'{name}_count{_labels(labels)} {self.count}')
+        return lines
+
+
+def _labels(labels, **extra):
+    items = list(labels) + [(key, value) for key, value in extra.items()]
+    if not items:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in items)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(items, escaped)) + '}'
+
+
+def current_endpoint():
+    if not has_request_context():
+        return BACKGROUND
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    # jsonify() and the async handlers serialize through app.json.dumps
+
+    def __init__(self, app, metrics):
+        super().__init__(app)
+        self.metrics = metrics
+
+    def dumps(self, obj, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().dumps(obj, **kwargs)
+        finally:
+            self.metrics.observe('json', (current_endpoint(),), time.perf_counter() - start)
+
+
+class StackSampler:
+    # Samples the stacks of request threads every `interval` seconds
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.active = {}  # thread id -> route
+        self.stacks = defaultdict(lambda: defaultdict(int))
+        self.samples = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+            self._thread.start()
+
+    def enter(self, route):
+        self.active[threading.get_ident()] = route
+
+    def leave(self):
+        self.active.pop(threading.get_ident(), None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for thread_id, route in list(self.active.items()):
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        self.stacks[route][self._fold(frame)] += 1
+                        self.samples += 1
+
+    @staticmethod
+    def _fold(frame):
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'.replace(';', ':'))
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def folded(self, route=None, reset=False):
+        with self._lock:
+            lines = [
+                f'{name.replace(";", ":")};{stack} {count}'
+                for name, stacks in sorted(self.stacks.items()) if route in (None, name)
+                for stack, count in sorted(stacks.items(), key=lambda item: -item[1])
+            ]
+            if reset:
+                self.stacks.clear()
+                self.samples = 0
+        return '\n'.join(lines) + ('\n' if lines else '')
+
+
+class RequestMetrics:
+
+    HISTOGRAMS = {
+        'latency': ('gotimer_http_request_duration_seconds', 'Time spent handling a request', ('endpoint', 'method'), LATENCY_BUCKETS),
+        'sql_count': ('gotimer_sql_statements_per_request', 'SQL statements issued per request', ('endpoint',), SQL_COUNT_BUCKETS),
+        'sql_time': ('gotimer_sql_statement_duration_seconds', 'Duration of one SQL statement', ('endpoint',), FAST_BUCKETS),
+        'json': ('gotimer_json_serialize_seconds', 'Time spent serializing one JSON document', ('endpoint',), FAST_BUCKETS),
+    }
+
+    def __init__(self):
+        self.enabled = False
+        self.sampler = None
+        self.collectors = []
+        self._histograms = {kind: {} for kind in self.HISTOGRAMS}
+        self._responses = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def init_app(self, app, db):
+        self.enabled = app.config.get('METRICS_ENABLED', False)
+        if not self.enabled:
+            return
+
+        app.json = TimedJSONProvider(app, self)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+        app.add_url_rule('/api/metrics', 'metrics', self.render_view)
+
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+        if app.config.get('PROFILER_ENABLED', False):
+            self.sampler = StackSampler(app.config.get('PROFILER_INTERVAL', 0.005))
+            self.sampler.start()
+            app.add_url_rule('/api/metrics/profile', 'metrics_profile', self.profile_view)
+
+    def add_collector(self, collector):
+        # collector() returns [(name, type, help, value)] rendered on every scrape
+        self.collectors.append(collector)
+
+    def observe(self, kind, labels, value):
+        with self._lock:
+            histogram = self._histograms[kind].get(labels)
+            if histogram is None:
+                histogram = self._histograms[kind][labels] = Histogram(self.HISTOGRAMS[kind][3])
+            histogram.observe(value)
+
+    def _before_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_statements = 0
+        if self.sampler:
+            self.sampler.enter(current_endpoint())
+
+    def _after_request(self, response):
+        # Streamed responses are measured up to the start of the body
+        endpoint = current_endpoint()
+        started = g.pop('metrics_started', None)
+        if started is not None:
+            self.observe('latency', (endpoint, request.method), time.perf_counter() - started)
+            self.observe('sql_count', (endpoint,), g.pop('metrics_statements', 0))
+        with self._lock:
+            self._responses[(endpoint, request.method, str(response.status_code))] += 1
+        return response
+
+    def _teardown_request(self, exc):
+        if self.sampler:
+            self.sampler.leave()
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['metrics_started'].pop()
+        endpoint = current_endpoint()
+        if endpoint != BACKGROUND and 'metrics_statements' in g:
+            g.metrics_statements += 1
+        self.observe('sql_time', (endpoint,), elapsed)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for kind, (name, help_text, label_names, _) in self.HISTOGRAMS.items():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+                for labels, histogram in sorted(self._histograms[kind].items()):
+                    lines += histogram.render(name, list(zip(label_names, labels)))
+
+            name = 'gotimer_http_responses_total'
+            lines += [f'# HELP {name} Responses by endpoint, method and status code', f'# TYPE {name} counter']
+            for (endpoint, method, status), count in sorted(self._responses.items()):
+                lines.append(f'{name}{_labels([("endpoint", endpoint), ("method", method), ("status", status)])} {count}')
+
+        for collector in self.collectors:
+            for name, metric_type, help_text, value in collector():
+                lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}', f'{name} {value}']
+
+        if self.sampler:
+            lines += ['# HELP gotimer_profiler_samples Stack samples held by the profiler',
+                      '# TYPE gotimer_profiler_samples gauge', f'gotimer_profiler_samples {self.sampler.samples}']
+        return '\n'.join(lines) + '\n'
+
+    def render_view(self):
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+    def profile_view(self):
+        route = request.args.get('route')
+        reset = request.args.get('reset') == '1'
+        return Response(self.sampler.folded(route, reset), mimetype='text/plain')
+
+
+metrics = RequestMetrics()
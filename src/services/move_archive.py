@@ -0,0 +1,232 @@
+import zlib
+from datetime import datetime, timedelta, timezone
+from src.models.move_history import MoveHistory
+
+# Packed move timelines for finished games.
+#
+# A game's moves are stored column by column. Each column is a run of
+# zigzag varints holding the difference to the value `stride` moves earlier
+# (stride 2 compares a player's clock with their own previous move), and the
+# whole payload is deflated. A 300-move game shrinks from 300 rows to a blob
+# of well under a kilobyte.
+
+FORMAT_VERSION = 1
+
+# (field, stride); stride 0 stores the raw value
+COLUMNS = (
+    ('id', 1),
+    ('move_number', 1),
+    ('player_color', 0),
+    ('time_taken', 0),
+    ('main_time_remaining', 2),
+    ('byoyomi_time_remaining', 2),
+    ('byoyomi_periods_remaining', 2),
+    ('in_byoyomi', 0),
+    ('created_at', 1),
+)
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _write_varint(out, value):
+    value = (value << 1) ^ (value >> 63)  # zigzag keeps small negatives short
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            break
+        shift += 7
+    return (result >> 1) ^ -(result & 1), pos
+
+
+def _to_micros(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    delta = value - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+def _from_micros(value):
+    return EPOCH + timedelta(microseconds=value)
+
+
+def can_pack(moves):
+    # Only integer clock values fit the format; anything else stays in rows
+    for move in moves:
+        if not isinstance(move['id'], int) or not isinstance(move['player_color'], str):
+            return False
+        for field in ('move_number', 'time_taken', 'main_time_remaining',
+                      'byoyomi_time_remaining', 'byoyomi_periods_remaining', 'in_byoyomi'):
+            if move[field] is not None and not isinstance(move[field], int):
+                return False
+    return True
+
+
+def encode_moves(moves):
+    colors = sorted({move['player_color'] for move in moves})
+    color_index = {color: index for index, color in enumerate(colors)}
+
+    out = bytearray()
+    _write_varint(out, len(moves))
+    _write_varint(out, len(colors))
+    for color in colors:
+        raw = color.encode('utf-8')
+        _write_varint(out, len(raw))
+        out += raw
+
+    for field, stride in COLUMNS:
+        if field == 'player_color':
+            values = [color_index[move[field]] for move in moves]
+        elif field == 'created_at':
+            values = [_to_micros(move[field]) if move[field] else None for move in moves]
+        else:
+            values = [None if move[field] is None else int(move[field]) for move in moves]
+
+        # Positions of missing values, then the column with those read as 0
+        nulls = [index for index, value in enumerate(values) if value is None]
+        _write_varint(out, len(nulls))
+        previous = 0
+        for index in nulls:
+            _write_varint(out, index - previous)
+            previous = index
+        values = [0 if value is None else value for value in values]
+
+        for index, value in enumerate(values):
+            if stride and index >= stride:
+                value -= values[index - stride]
+            _write_varint(out, value)
+
+    return bytes([FORMAT_VERSION]) + zlib.compress(bytes(out))
+
+
+def decode_columns(blob):
+    if not blob:
+        return {field: [] for field, _ in COLUMNS}
+    if blob[0] != FORMAT_VERSION:
+        raise ValueError(f'Unsupported move archive version {blob[0]}')
+
+    data = zlib.decompress(blob[1:])
+    count, pos = _read_varint(data, 0)
+    color_count, pos = _read_varint(data, pos)
+    colors = []
+    for _ in range(color_count):
+        length, pos = _read_varint(data, pos)
+        colors.append(data[pos:pos + length].decode('utf-8'))
+        pos += length
+
+    columns = {}
+    for field, stride in COLUMNS:
+        null_count, pos = _read_varint(data, pos)
+        nulls = []
+        previous = 0
+        for _ in range(null_count):
+            step, pos = _read_varint(data, pos)
+            previous += step
+            nulls.append(previous)
+
+        values = []
+        for index in range(count):
+            value, pos = _read_varint(data, pos)
+            if stride and index >= stride:
+                value += values[index - stride]
+            values.append(value)
+
+        if field == 'player_color':
+            values = [colors[value] for value in values]
+        elif field == 'in_byoyomi':
+            values = [bool(value) for value in values]
+        elif field == 'created_at':
+            values = [_from_micros(value) for value in values]
+        for index in nulls:
+            values[index] = None
+        columns[field] = values
+
+    return columns
+
+
+def _column_rows(columns):
+    fields = [field for field, _ in COLUMNS]
+    return [dict(zip(fields, values)) for values in zip(*(columns[field] for field in fields))]
+
+
+def decode_moves(blob, user_id, game_id):
+    # Rows shaped like MoveHistory.to_dict()
+    moves = []
+    for row in _column_rows(decode_columns(blob)):
+        row['user_id'] = user_id
+        row['game_id'] = game_id
+        row['created_at'] = row['created_at'].isoformat() if row['created_at'] else None
+        moves.append(row)
+    return moves
+
+
+def moves_to_columns(moves):
+    # One list per field instead of one object per move, for ?format=columns
+    fields = [field for field, _ in COLUMNS]
+    return {field: [move[field] for move in moves] for field in fields}
+
+
+def archive_game_moves(game):
+    # Folds the game's move rows into game.moves_archive and deletes them.
+    # The caller commits, so the blob and the deletes land together.
+    rows = game_moves_query(game.user_id, game.id).all()
+    if not rows:
+        return 0
+
+    moves = [{field: getattr(row, field) for field, _ in COLUMNS} for row in rows]
+    if not can_pack(moves):
+        return 0
+
+    # Moves saved after an earlier archive are merged into it
+    if game.moves_archive:
+        moves = _column_rows(decode_columns(game.moves_archive)) + moves
+        moves.sort(key=lambda move: (move['move_number'], move['id']))
+
+    game.moves_archive = encode_moves(moves)
+    game.archived_move_count = len(moves)
+    game.archived_move_time = sum(move['time_taken'] or 0 for move in moves)
+
+    MoveHistory.query.filter(
+        MoveHistory.id.in_([row.id for row in rows])
+    ).delete(synchronize_session=False)
+    return len(rows)
+
+
+def game_moves_query(user_id, game_id, since=None):
+    # A game's move_history rows in move order; with since, only those numbered after it
+    query = MoveHistory.query.filter_by(
+        game_id=game_id,
+        user_id=user_id
+    )
+    if since is not None:
+        query = query.filter(MoveHistory.move_number > since)
+    return query.order_by(MoveHistory.move_number)
+
+
+def game_moves(game, since=None):
+    # Archived moves followed by any rows saved since, in move order; with
+    # since, only the moves numbered after it
+    moves = merge_archived_moves(game, [move.to_dict() for move in game_moves_query(game.user_id, game.id, since).all()])
+    if since is not None and game.moves_archive:
+        moves = [move for move in moves if move['move_number'] > since]
+    return moves
+
+
+def merge_archived_moves(game, moves):
+    # moves are to_dict() rows of the game that are still in move_history
+    if not game.moves_archive:
+        return moves
+    merged = decode_moves(game.moves_archive, game.user_id, game.id) + moves
+    if moves:
+        merged.sort(key=lambda move: move['move_number'])
+    return merged
@@ -0,0 +1,193 @@
+import atexit
+import threading
+from src.models.user import db
+from src.models.move_history import MoveHistory
+from src.services.stats_cache import stats_cache
+from src.services.flag_fall import flag_scheduler
+from src.services.revisions import bump_moves
+
+
+MOVE_COLORS = ('black', 'white')
+# (field, smallest value, default when missing or null; None means required)
+MOVE_COUNTS = (
+    ('move_number', 1, None),
+    ('time_taken', 0, None),
+    ('main_time_remaining', 0, 0),
+    ('byoyomi_time_remaining', 0, 0),
+    ('byoyomi_periods_remaining', 0, 0),
+)
+
+
+class MoveDataError(ValueError):
+    pass
+
+
+class MoveWriteBuffer:
+    # Groups single-move inserts from all games and writes them with one
+    # executemany once the buffer is full or the flush interval elapses.
+    #
+    # A batch whose INSERT fails goes back to the front of the queue, so a
+    # briefly locked database loses nothing. If it fails again its rows are
+    # written one by one and any row that still fails is logged and dropped,
+    # so one bad row never holds up every game's moves.
+
+    def __init__(self, max_size=200, flush_interval=0.5):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.enabled = False
+        self.app = None
+        self._pending = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._failed_flushes = 0
+        self.dropped = 0
+
+    def init_app(self, app):
+        self.app = app
+        self.enabled = app.config.get('MOVE_WRITE_BUFFER', False)
+        self.max_size = app.config.get('MOVE_WRITE_BUFFER_SIZE', self.max_size)
+        self.flush_interval = app.config.get('MOVE_WRITE_BUFFER_INTERVAL', self.flush_interval)
+
+        if self.enabled and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='move-write-buffer', daemon=True)
+            self._thread.start()
+            atexit.register(self.shutdown)
+
+    def add(self, row):
+        with self._lock:
+            self._pending.append(row)
+            full = len(self._pending) >= self.max_size
+
+        if full:
+            self._wake.set()
+
+    def flush(self):
+        # Serialize flushes so batches reach the database in arrival order
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+
+            if not rows:
+                return 0
+
+            with self.app.app_context(), stats_cache.writing_moves(row['user_id'] for row in rows):
+                if self._failed_flushes:
+                    rows = self._write_one_by_one(rows)
+                else:
+                    try:
+                        write_moves(rows)
+                    except Exception:
+                        db.session.rollback()
+                        # Put the rows back in front so the next flush retries them in order
+                        with self._lock:
+                            self._pending[:0] = rows
+                        self._failed_flushes += 1
+                        self.app.logger.exception('Failed to flush %d buffered moves', len(rows))
+                        return 0
+
+                # The rows are committed; they must not be queued again whatever happens next
+                self._failed_flushes = 0
+                try:
+                    record_inserted_moves(rows)
+                except Exception:
+                    self.app.logger.exception('Failed to record %d flushed moves', len(rows))
+
+            return len(rows)
+
+    def _write_one_by_one(self, rows):
+        # Returns the rows that were written
+        written = []
+        for row in rows:
+            try:
+                write_moves([row])
+                written.append(row)
+            except Exception:
+                db.session.rollback()
+                self.dropped += 1
+                self.app.logger.exception('Dropped buffered move %r', row)
+        return written
+
+    def metrics(self):
+        # Gauges and counters for src/services/metrics.py
+        with self._lock:
+            pending = len(self._pending)
+        return [
+            ('gotimer_move_buffer_pending', 'gauge', 'Moves waiting in the write-behind buffer', pending),
+            ('gotimer_move_buffer_dropped_total', 'counter', 'Buffered moves dropped after failing to insert twice', self.dropped)
+        ]
+
+    def shutdown(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+
+def _move_count(data, field, minimum, default):
+    # Whole numbers may arrive as 5, 5.0 or "5"; stored as int
+    value = data.get(field)
+    if value is None and default is not None:
+        return default
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    elif isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if not isinstance(value, int) or isinstance(value, bool) or value < minimum:
+        raise MoveDataError(f'{field} must be an integer of at least {minimum}')
+    return value
+
+
+def move_row(data, user_id, game_id):
+    # Validates one move from a request; raises MoveDataError, so bad data is
+    # refused with a 400 instead of failing later in the write-behind buffer
+    if data['player_color'] not in MOVE_COLORS:
+        raise MoveDataError(f"player_color must be one of {', '.join(MOVE_COLORS)}")
+    in_byoyomi = data.get('in_byoyomi')
+    if in_byoyomi not in (None, True, False):
+        raise MoveDataError('in_byoyomi must be true or false')
+
+    row = {'user_id': user_id, 'game_id': game_id, 'player_color': data['player_color']}
+    for field, minimum, default in MOVE_COUNTS:
+        row[field] = _move_count(data, field, minimum, default)
+    row['in_byoyomi'] = bool(in_byoyomi)
+    return row
+
+
+def write_moves(rows):
+    # A list of parameter sets makes SQLAlchemy issue a single executemany
+    db.session.execute(MoveHistory.__table__.insert(), rows)
+    bump_moves(rows)
+    db.session.commit()
+
+
+def insert_moves(rows):
+    with stats_cache.writing_moves(row['user_id'] for row in rows):
+        write_moves(rows)
+        record_inserted_moves(rows)
+
+
+def record_inserted_moves(rows):
+    # Keep cached stats current instead of recomputing them on the next read;
+    # call it inside the stats_cache.writing_moves() block of the insert
+    totals = {}
+    for row in rows:
+        count, time_taken = totals.get(row['user_id'], (0, 0))
+        totals[row['user_id']] = (count + 1, time_taken + row['time_taken'])
+    for user_id, (count, time_taken) in totals.items():
+        stats_cache.record_moves(user_id, count, time_taken)
+    # Each move moves its game's flag-fall deadline
+    flag_scheduler.record_moves(rows)
+
+
+move_buffer = MoveWriteBuffer()
@@ -0,0 +1,189 @@
+from datetime import datetime
+from sqlalchemy import bindparam, exists, select
+from src.models.user import db, Game
+from src.models.move_history import MoveHistory
+from src.services.move_archive import decode_moves
+from src.services.move_buffer import move_row, record_inserted_moves
+from src.services.stats_cache import stats_cache
+from src.services.flag_fall import flag_scheduler
+from src.services.revisions import bump_moves, bump_user
+
+# Delta sync for offline-first clients (POST /api/games/<id>/sync).
+#
+# The client keeps every move locally and sends, in one request, the highest
+# move number it has confirmed with the server (`since`) and its moves after
+# it. Moves are identified by move_number: numbers the server does not have
+# yet are inserted, numbers it already has are conflicts and the stored move
+# wins. The response carries the server's moves after `since` that the client
+# did not just get accepted, including the winning side of every conflict, so
+# one round trip brings both sides up to date and a retried request is a no-op.
+#
+# The request also carries whether the browser clock is paused, so the
+# flag-fall scheduler never times out a paused game. Moves are only accepted
+# into active games: new moves for a finished game are refused.
+
+MAX_SYNC_MOVES = 1000
+REQUIRED_FIELDS = ('move_number', 'player_color', 'time_taken')
+GAME_SETTINGS = ('main_time', 'byoyomi_time', 'byoyomi_periods')
+INSERT_COLUMNS = (
+    'user_id', 'game_id', 'move_number', 'player_color', 'time_taken', 'main_time_remaining',
+    'byoyomi_time_remaining', 'byoyomi_periods_remaining', 'in_byoyomi', 'created_at',
+)
+
+
+class SyncError(ValueError):
+    pass
+
+
+class GameFinishedError(SyncError):
+    pass
+
+
+def _is_count(value, minimum):
+    return isinstance(value, int) and not isinstance(value, bool) and value >= minimum
+
+
+def parse_sync_request(data):
+    # Returns (since, moves, game settings or None, paused or None)
+    if not isinstance(data, dict):
+        raise SyncError('Expected a JSON object')
+
+    since = data.get('since', 0)
+    moves = data.get('moves', [])
+    settings = data.get('game')
+    paused = data.get('paused')
+    if not _is_count(since, 0):
+        raise SyncError('since must be a non-negative integer')
+    if not isinstance(moves, list):
+        raise SyncError('moves must be a list')
+    if len(moves) > MAX_SYNC_MOVES:
+        raise SyncError(f'At most {MAX_SYNC_MOVES} moves per sync')
+    for move in moves:
+        if not isinstance(move, dict) or not all(k in move for k in REQUIRED_FIELDS):
+            raise SyncError('Missing required move data')
+        if not _is_count(move['move_number'], 1):
+            raise SyncError('move_number must be a positive integer')
+    if settings is not None:
+        if not isinstance(settings, dict) or not all(_is_count(settings.get(k, 0), 0) for k in GAME_SETTINGS):
+            raise SyncError('game settings must be non-negative integers')
+    if paused is not None and not isinstance(paused, bool):
+        raise SyncError('paused must be true or false')
+
+    return since, moves, settings, paused
+
+
+def sync_game(user_id, game_id, settings):
+    # The user's game, created on first sync so games started offline can be
+    # uploaded later. Returns None if the id belongs to another user.
+    game = db.session.get(Game, game_id)
+    if game is not None:
+        return game if game.user_id == user_id else None
+    if settings is None or len(game_id) > 36:
+        return None
+
+    game = Game(
+        id=game_id,
+        user_id=user_id,
+        main_time=settings.get('main_time', 600),
+        byoyomi_time=settings.get('byoyomi_time', 30),
+        byoyomi_periods=settings.get('byoyomi_periods', 3),
+        status='active',
+        # Played offline, so the server can't know its clocks; the scheduler
+        # would time it out while later moves still wait on the device
+        flag_fall=False
+    )
+    db.session.add(game)
+    bump_user(user_id)
+    db.session.commit()
+    stats_cache.invalidate(user_id)
+    return game
+
+
+def sync_pause(game, paused):
+    # Records a pause or resume of the browser clock; a no-op if nothing changed
+    if paused is None or game.status != 'active' or paused == (game.paused_at is not None):
+        return
+    now = datetime.utcnow()
+    if paused:
+        game.paused_at = now
+    else:
+        game.paused_at = None
+        game.resumed_at = now
+    db.session.commit()
+    flag_scheduler.pause_game(game.id, paused)
+
+
+def _insert_missing_statement():
+    # INSERT ... SELECT ... WHERE NOT EXISTS: a move number stored by a
+    # concurrent sync between our read and this write is still never duplicated,
+    # and nothing is added to a game completed in the meantime
+    table = MoveHistory.__table__
+    games = Game.__table__
+    values = select(*[bindparam(column) for column in INSERT_COLUMNS]).where(~exists().where(
+        table.c.user_id == bindparam('user_id'),
+        table.c.game_id == bindparam('game_id'),
+        table.c.move_number == bindparam('move_number')
+    ), exists().where(
+        games.c.id == bindparam('game_id'),
+        games.c.status == 'active'
+    ))
+    return table.insert().from_select(INSERT_COLUMNS, values)
+
+
+def stored_moves_after(game, floor):
+    # The game's moves with move_number > floor, one per number, first stored wins
+    moves = {}
+    if game.moves_archive:
+        for move in decode_moves(game.moves_archive, game.user_id, game.id):
+            if move['move_number'] > floor:
+                moves.setdefault(move['move_number'], move)
+
+    rows = MoveHistory.query.filter(
+        MoveHistory.user_id == game.user_id,
+        MoveHistory.game_id == game.id,
+        MoveHistory.move_number > floor
+    ).order_by(MoveHistory.move_number, MoveHistory.id).all()
+    for row in rows:
+        moves.setdefault(row.move_number, row.to_dict())
+
+    return [moves[number] for number in sorted(moves)]
+
+
+def sync_moves(game, since, client_moves):
+    # Stores the client's new moves and returns (response, inserted rows)
+    floor = min([since] + [move['move_number'] - 1 for move in client_moves])
+    stored = {move['move_number'] for move in stored_moves_after(game, floor)}
+
+    now = datetime.utcnow()
+    rows = {}
+    for move in client_moves:
+        if move['move_number'] not in stored:
+            rows.setdefault(move['move_number'], dict(move_row(move, game.user_id, game.id), created_at=now))
+
+    if rows and game.status != 'active':
+        raise GameFinishedError('Game is already finished')
+
+    with stats_cache.writing_moves([game.user_id] if rows else []):
+        if rows:
+            db.session.execute(_insert_missing_statement(), list(rows.values()))
+            bump_moves(list(rows.values()))
+            db.session.commit()
+
+        # A row carrying this request's timestamp is ours; any other row for one of
+        # our numbers came from a concurrent sync and wins like any stored move
+        moves = stored_moves_after(game, floor)
+        accepted = {
+            move['move_number'] for move in moves
+            if move['move_number'] in rows and move['created_at'] == now.isoformat()
+        }
+        inserted = [rows[number] for number in sorted(accepted)]
+        if inserted:
+            record_inserted_moves(inserted)
+
+    return {
+        # Accepted moves are already on the client; everything else after since is not
+        'moves': [move for move in moves if move['move_number'] > since and move['move_number'] not in accepted],
+        'accepted': sorted(accepted),
+        'conflicts': sorted({move['move_number'] for move in client_moves} - accepted),
+        'last_move_number': max([since] + [move['move_number'] for move in moves])
+    }, inserted
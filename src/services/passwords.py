@@ -0,0 +1,121 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Password hashing off the request threads.
+#
+# scrypt and pbkdf2 are built to be slow, and a burst of logins hashing on the
+# request threads holds every one of them, so moves and game listings queue up
+# behind the logins. Hashes are computed in a pool of PASSWORD_HASH_WORKERS
+# processes instead, which caps the CPU that logins can take. The request
+# thread waits for its hash without holding the GIL. At most
+# PASSWORD_HASH_QUEUE_DEPTH hashes may be queued or running; past that,
+# callers get PasswordHasherBusy at once (a 503) instead of piling up.
+#
+# The pool is created on the first hash, so CLI commands and benchmarks that
+# never check a password start no workers. By then the app's threads are
+# running, and a fork would copy locks they hold in their held state, so the
+# workers come from a forkserver (spawned where there is none) instead.
+#
+# Hashes use PASSWORD_HASH_METHOD (werkzeug's method syntax, e.g. scrypt or
+# pbkdf2:sha256:600000). A successful login with a hash made by another
+# method or cost hashes the password again with the current one, so changing
+# the setting upgrades accounts as their users log in.
+
+
+class PasswordHasherBusy(RuntimeError):
+    pass
+
+
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def hash_password(password, method):
+    return generate_password_hash(password, method)
+
+
+def verify_password(pwhash, password, method, prefix):
+    # Returns (matches, new hash or None); prefix is the method part of a hash
+    # made with the current settings, such as scrypt:32768:8:1
+    if not check_password_hash(pwhash, password):
+        return False, None
+    if pwhash.split('$', 1)[0] != prefix:
+        return True, generate_password_hash(password, method)
+    return True, None
+
+
+def method_prefix(method):
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+class PasswordHasher:
+
+    def __init__(self, method='scrypt', workers=0, queue_depth=32):
+        self.method = method
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self._prefix = None
+        self._executor = None
+        self._slots = threading.BoundedSemaphore(queue_depth)
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.rejected = 0
+        self.rehashed = 0
+
+    def init_app(self, app):
+        self.method = app.config.get('PASSWORD_HASH_METHOD', self.method)
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', self.workers) or os.cpu_count() or 1
+        self.queue_depth = app.config.get('PASSWORD_HASH_QUEUE_DEPTH', self.queue_depth)
+        self._slots = threading.BoundedSemaphore(self.queue_depth)
+
+    def hash(self, password):
+        return self._run(hash_password, password, self.method)
+
+    def verify(self, pwhash, password):
+        # (matches, new hash to store or None)
+        if self._prefix is None:
+            self._prefix = self._run(method_prefix, self.method)
+        matches, new_hash = self._run(verify_password, pwhash, password, self.method, self._prefix)
+        if new_hash is not None:
+            self.rehashed += 1
+        return matches, new_hash
+
+    def metrics(self):
+        # Gauges and counters for src/services/metrics.py
+        return [
+            ('gotimer_password_hashes_pending', 'gauge', 'Password hashes queued or running', self.pending),
+            ('gotimer_password_hashes_rejected_total', 'counter', 'Password hashes refused because the queue was full', self.rejected),
+            ('gotimer_password_rehashes_total', 'counter', 'Logins that upgraded a hash to the current method', self.rehashed)
+        ]
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise PasswordHasherBusy('Too many password checks in progress')
+        with self._lock:
+            self.pending += 1
+        try:
+            return self._pool().submit(function, *args).result()
+        except BrokenProcessPool:
+            # A worker died; the next caller gets a fresh pool
+            with self._lock:
+                self._executor = None
+            raise
+        finally:
+            with self._lock:
+                self.pending -= 1
+            self._slots.release()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context(START_METHOD)
+                )
+            return self._executor
+
+
+password_hasher = PasswordHasher()
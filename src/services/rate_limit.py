@@ -0,0 +1,97 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from flask import jsonify, request
+
+# Token-bucket rate limits in front of login, register and change-password,
+# the routes that cost real CPU (a password hash each).
+#
+# Every client IP and every username has a bucket holding up to BURST tokens
+# that refills at RATE tokens per second; a request takes one token from the
+# IP's bucket and, when it names a username, one from that username's bucket.
+# The per-IP limit keeps one client from flooding the hash pool, the
+# per-username limit stops password guessing against one account from many
+# addresses. Buckets are kept for the MAX_KEYS most recently seen keys; a
+# dropped bucket comes back full, which only ever errs on the lenient side.
+# Limits apply per worker process.
+#
+# The client IP is request.remote_addr. Behind a load balancer or reverse
+# proxy set TRUSTED_PROXIES, so it comes from X-Forwarded-For (see
+# src/main.py) instead of every client sharing the proxy's bucket.
+
+
+class TokenBuckets:
+
+    def __init__(self, rate, burst, max_keys=100000, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()  # key -> [tokens, last refill]
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def take(self, key):
+        # Seconds until a token is available, 0 if one was taken
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0
+            self.limited += 1
+            return (1 - bucket[0]) / self.rate if self.rate > 0 else math.inf
+
+
+class AuthRateLimiter:
+
+    def __init__(self):
+        self.enabled = False
+        self.ip_buckets = None
+        self.username_buckets = None
+
+    def init_app(self, app):
+        self.enabled = app.config.get('AUTH_RATE_LIMIT', False)
+        max_keys = app.config.get('AUTH_RATE_LIMIT_KEYS', 100000)
+        self.ip_buckets = TokenBuckets(app.config.get('AUTH_IP_RATE', 1.0), app.config.get('AUTH_IP_BURST', 60), max_keys)
+        self.username_buckets = TokenBuckets(
+            app.config.get('AUTH_USERNAME_RATE', 0.1), app.config.get('AUTH_USERNAME_BURST', 10), max_keys
+        )
+
+    def check(self, ip, username=None):
+        # Seconds to wait before retrying, 0 if the request may go ahead
+        if not self.enabled:
+            return 0
+        wait = self.ip_buckets.take(ip)
+        if wait or not isinstance(username, str):
+            return wait
+        return self.username_buckets.take(username.lower())
+
+    def refuse(self, username=None):
+        # The 429 response for the current request if it is over a limit, else None
+        wait = self.check(request.remote_addr, username)
+        if wait:
+            return jsonify({'error': 'Too many attempts, try again later'}), 429, {'Retry-After': str(math.ceil(wait))}
+        return None
+
+    def metrics(self):
+        # Counters for src/services/metrics.py
+        if self.ip_buckets is None:
+            return []
+        return [
+            ('gotimer_auth_limited_ip_total', 'counter', 'Auth requests refused by the per-IP limit', self.ip_buckets.limited),
+            ('gotimer_auth_limited_username_total', 'counter', 'Auth requests refused by the per-username limit', self.username_buckets.limited)
+        ]
+
+
+auth_limiter = AuthRateLimiter()
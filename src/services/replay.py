@@ -0,0 +1,202 @@
+import math
+from bisect import bisect_right
+from sqlalchemy import delete, select
+from src.models.user import db, Game
+from src.models.replay import ReplayPoint
+from src.services.analytics import COLORS, FIELDS, FINISHED_STATUSES, columns_from_moves, load_columns
+
+# Game replay (GET /api/games/<game_id>/replay): both players' clocks at any
+# move number or any number of seconds into the game.
+#
+# When a game finishes, the clocks after each of its moves are stored as one
+# game_replay_points row per move, next to the game's analytics, with the
+# seconds played so far. A seek is then one ORDER BY ... LIMIT 1 read on
+# ix_game_replay_points_game_move or ix_game_replay_points_game_elapsed, so a
+# timeline slider costs one index lookup per position however long the game
+# is. Between two moves the clock of the player to move is run down from the
+# last point with the same byo-yomi rules as the server clock.
+#
+# Active games, guest games and games finished before the index existed get
+# the same points computed from their moves on every request.
+
+CLOCK_FIELDS = ('main_time_remaining', 'byoyomi_time_remaining', 'byoyomi_periods_remaining', 'in_byoyomi')
+POINT_FIELDS = (
+    'move_number', 'elapsed', 'player_color', 'to_move',
+    *[f'{color}_{field}' for color in COLORS for field in CLOCK_FIELDS]
+)
+
+
+class ReplayQueryError(ValueError):
+    pass
+
+
+def parse_replay_query(args):
+    # Exactly one of ?move=N or ?elapsed=seconds; returns (move_number, elapsed)
+    move_number = args.get('move')
+    elapsed = args.get('elapsed')
+    if (move_number is None) == (elapsed is None):
+        raise ReplayQueryError('Pass either move or elapsed')
+
+    if move_number is not None:
+        if not move_number.isdigit():
+            raise ReplayQueryError('move must be a non-negative integer')
+        return int(move_number), None
+
+    try:
+        elapsed = float(elapsed)
+    except ValueError:
+        elapsed = -1
+    if not 0 <= elapsed < math.inf:
+        raise ReplayQueryError('elapsed must be a non-negative number of seconds')
+    return None, elapsed
+
+
+def replay_points(main_time, byoyomi_time, byoyomi_periods, columns):
+    # Point 0 with both clocks full, then one point per move number (the first
+    # stored move wins) from columns in move order, as from load_columns()
+    clocks = {
+        color: {
+            'main_time_remaining': main_time,
+            'byoyomi_time_remaining': byoyomi_time,
+            'byoyomi_periods_remaining': byoyomi_periods,
+            'in_byoyomi': main_time <= 0
+        }
+        for color in COLORS
+    }
+    points = [(0, 0, None, {color: dict(clock) for color, clock in clocks.items()})]
+    elapsed = 0
+    for move in zip(*(columns[field] for field in FIELDS)):
+        move = dict(zip(FIELDS, move))
+        if move['move_number'] <= points[-1][0]:
+            continue
+        elapsed += move['time_taken'] or 0
+        if move['player_color'] in clocks:
+            clocks[move['player_color']] = {
+                'main_time_remaining': move['main_time_remaining'] or 0,
+                'byoyomi_time_remaining': move['byoyomi_time_remaining'] or 0,
+                'byoyomi_periods_remaining': move['byoyomi_periods_remaining'] or 0,
+                'in_byoyomi': bool(move['in_byoyomi'])
+            }
+        points.append((move['move_number'], elapsed, move['player_color'], {color: dict(clock) for color, clock in clocks.items()}))
+
+    return [
+        dict(
+            {f'{color}_{field}': state[color][field] for color in COLORS for field in CLOCK_FIELDS},
+            move_number=move_number,
+            elapsed=elapsed,
+            player_color=player_color,
+            to_move=points[index + 1][2] if index + 1 < len(points) else None
+        )
+        for index, (move_number, elapsed, player_color, state) in enumerate(points)
+    ]
+
+
+def store_replay_points(game_id, user_id, points):
+    # Replaces the game's stored points; the caller commits
+    db.session.execute(delete(ReplayPoint).where(ReplayPoint.game_id == game_id))
+    db.session.execute(ReplayPoint.__table__.insert(), [dict(point, game_id=game_id, user_id=user_id) for point in points])
+
+
+def index_game(game):
+    # Called as a game finishes, next to materialize_game(); the caller commits
+    points = replay_points(game.main_time, game.byoyomi_time, game.byoyomi_periods, load_columns(game))
+    store_replay_points(game.id, game.user_id, points)
+
+
+def rebuild_user_replay_points(user_id):
+    # Re-indexes a user's finished games; returns the number of games
+    games = Game.query.filter(Game.user_id == user_id, Game.status.in_(FINISHED_STATUSES)).all()
+    for game in games:
+        index_game(game)
+    db.session.commit()
+    return len(games)
+
+
+def _point_query(game_id):
+    return select(*[ReplayPoint.__table__.c[field] for field in POINT_FIELDS]).where(ReplayPoint.game_id == game_id)
+
+
+def point_at_move_query(game_id, move_number):
+    return _point_query(game_id).where(
+        ReplayPoint.move_number <= move_number
+    ).order_by(ReplayPoint.move_number.desc()).limit(1)
+
+
+def point_at_elapsed_query(game_id, elapsed):
+    return _point_query(game_id).where(
+        ReplayPoint.elapsed <= elapsed
+    ).order_by(ReplayPoint.elapsed.desc(), ReplayPoint.move_number.desc()).limit(1)
+
+
+def last_point_query(game_id):
+    return _point_query(game_id).order_by(ReplayPoint.move_number.desc()).limit(1)
+
+
+def seek_points(points, move_number=None, elapsed=None):
+    # In-memory counterpart of the queries above: (point, last point)
+    if move_number is not None:
+        index = bisect_right([point['move_number'] for point in points], move_number) - 1
+    else:
+        index = bisect_right([point['elapsed'] for point in points], elapsed) - 1
+    return points[index], points[-1]
+
+
+def format_replay(game_id, point, last, elapsed, byoyomi_time, indexed):
+    from src.services.clock import charge  # clock.py imports this module
+
+    clocks = {color: {field: point[f'{color}_{field}'] for field in CLOCK_FIELDS} for color in COLORS}
+    at = point['elapsed']
+
+    # Between moves, the player to move has been thinking since the point
+    to_move = point['to_move']
+    if elapsed is not None and elapsed > at and to_move in clocks:
+        clock = clocks[to_move]
+        main_left, byo_left, periods_left, in_byoyomi, _ = charge(
+            clock['main_time_remaining'], clock['byoyomi_time_remaining'], clock['byoyomi_periods_remaining'],
+            clock['in_byoyomi'], elapsed - at, byoyomi_time
+        )
+        clocks[to_move] = {
+            'main_time_remaining': main_left,
+            'byoyomi_time_remaining': byo_left,
+            'byoyomi_periods_remaining': periods_left,
+            'in_byoyomi': in_byoyomi
+        }
+        at = elapsed
+
+    return {
+        'game_id': game_id,
+        'move_number': point['move_number'],
+        'elapsed': at,
+        'player_color': point['player_color'],
+        'to_move': to_move,
+        'clocks': clocks,
+        'last_move_number': last['move_number'],
+        'total_elapsed': last['elapsed'],
+        'indexed': indexed
+    }
+
+
+def game_replay(game, move_number=None, elapsed=None):
+    # Stored points of a finished game, computed on the spot for others
+    if game.status in FINISHED_STATUSES:
+        last = db.session.execute(last_point_query(game.id)).mappings().first()
+        if last is not None:
+            if move_number is not None:
+                point = db.session.execute(point_at_move_query(game.id, move_number)).mappings().first()
+            else:
+                point = db.session.execute(point_at_elapsed_query(game.id, elapsed)).mappings().first()
+            return format_replay(game.id, point, last, elapsed, game.byoyomi_time, True)
+
+    points = replay_points(game.main_time, game.byoyomi_time, game.byoyomi_periods, load_columns(game))
+    point, last = seek_points(points, move_number, elapsed)
+    return format_replay(game.id, point, last, elapsed, game.byoyomi_time, False)
+
+
+def moves_game_replay(game_data, move_number=None, elapsed=None):
+    # A game given as a dict with its moves, such as a guest game
+    points = replay_points(
+        game_data['main_time'], game_data['byoyomi_time'], game_data['byoyomi_periods'],
+        columns_from_moves(game_data['moves'])
+    )
+    point, last = seek_points(points, move_number, elapsed)
+    return format_replay(game_data['id'], point, last, elapsed, game_data['byoyomi_time'], False)
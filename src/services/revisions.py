@@ -0,0 +1,97 @@
+import hashlib
+from flask import Response, request
+from sqlalchemy import inspect, select, update
+from src.models.user import db, User, Game
+
+# Revision counters behind the ETags of GET /api/games, /api/games/<game_id>,
+# /api/games/<game_id>/moves, /api/games/<game_id>/replay and /api/stats.
+#
+# games.revision goes up with every write to a game or its moves, and
+# users.revision with every write to any of the user's games, in the same
+# transaction as the write. A conditional GET reads one counter by primary key
+# and answers If-None-Match with 304 before any game or move row is loaded.
+# The responses carry Cache-Control: private, no-cache, so browsers keep them
+# but revalidate on every fetch.
+#
+# Guest games live in the in-memory guest store and get no ETags.
+
+REVALIDATE = 'private, no-cache'
+
+# Part of every ETag; bump it when the JSON of these endpoints changes shape
+REPRESENTATION = 1
+
+
+def revision_statements(rows):
+    # UPDATEs bumping the games and users that move rows were inserted for;
+    # run them in the transaction that inserts the rows
+    games = Game.__table__
+    users = User.__table__
+    game_ids = sorted({row['game_id'] for row in rows})
+    user_ids = sorted({row['user_id'] for row in rows})
+    return [
+        update(games).where(games.c.id.in_(game_ids)).values(revision=games.c.revision + 1),
+        update(users).where(users.c.id.in_(user_ids)).values(revision=users.c.revision + 1)
+    ]
+
+
+def bump_moves(rows):
+    for statement in revision_statements(rows):
+        db.session.execute(statement)
+
+
+def bump_user(user_id):
+    # For changes to the user's list of games, such as a new game
+    users = User.__table__
+    db.session.execute(update(users).where(users.c.id == user_id).values(revision=users.c.revision + 1))
+
+
+def bump_game(game):
+    # For changes to the game row itself; committed with the caller's changes.
+    # A game that is only being added is inserted at revision 0.
+    if inspect(game).persistent:
+        game.revision = Game.revision + 1
+    bump_user(game.user_id)
+
+
+def game_revision_query(user_id, game_id):
+    return select(Game.revision).where(Game.id == game_id, Game.user_id == user_id)
+
+
+def user_revision_query(user_id):
+    # Also run by the async handler in src/asgi.py
+    return select(User.revision).where(User.id == user_id)
+
+
+def game_revision(user_id, game_id):
+    return db.session.scalar(game_revision_query(user_id, game_id))
+
+
+def user_revision(user_id):
+    return db.session.scalar(user_revision_query(user_id))
+
+
+def make_etag(*parts):
+    # Opaque and strong: the same parts always give the same body
+    key = repr((REPRESENTATION,) + parts).encode()
+    return hashlib.blake2b(key, digest_size=12).hexdigest()
+
+
+def games_etag(user_id, revision, query_string):
+    # Shared by the Flask route and the async handler in src/asgi.py
+    return make_etag('games', user_id, revision, query_string)
+
+
+def cache_headers(etag):
+    return {'Cache-Control': REVALIDATE, 'ETag': f'"{etag}"'}
+
+
+def not_modified(etag):
+    # The 304 response if the client already holds this version, else None
+    if request.if_none_match.contains_weak(etag):
+        return Response(status=304, headers=cache_headers(etag))
+    return None
+
+
+def with_etag(response, etag):
+    response.headers.update(cache_headers(etag))
+    return response
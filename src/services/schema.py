@@ -0,0 +1,131 @@
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import event, text
+from src.models.user import db, Game
+from src.services.stats_cache import games_aggregate_query, moves_aggregate_query
+from src.services.game_history import SEARCH_TABLE, SEARCH_DDL, parse_game_query, user_games_query
+from src.services.replay import point_at_move_query, point_at_elapsed_query, last_point_query
+from src.services.move_archive import game_moves_query
+from src.services.revisions import game_revision_query, user_revision_query
+
+
+def ensure_indexes():
+    # create_all() only builds indexes for brand new tables, so add any that an
+    # existing app.db is missing. Creating an index leaves the table data untouched.
+    created = []
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                existing = conn.execute(
+                    text("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name"),
+                    {'name': index.name}
+                ).first()
+                if not existing:
+                    index.create(conn, checkfirst=False)
+                    created.append(index.name)
+    return created
+
+
+def ensure_columns():
+    # Same for columns: ALTER TABLE ... ADD COLUMN keeps the existing rows and
+    # fills the new column with its server default (or NULL)
+    added = []
+    with db.engine.begin() as conn:
+        for table in db.metadata.sorted_tables:
+            existing = {row[1] for row in conn.execute(text(f'PRAGMA table_info({table.name})'))}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(conn.dialect)}'
+                if column.server_default is not None:
+                    if not column.nullable:
+                        ddl += ' NOT NULL'
+                    ddl += f" DEFAULT '{column.server_default.arg}'"
+                conn.execute(text(ddl))
+                added.append(f'{table.name}.{column.name}')
+    return added
+
+
+def ensure_search_index():
+    # Creates the game search FTS table and its sync triggers on databases that
+    # predate them and indexes the games already stored
+    with db.engine.begin() as conn:
+        existing = conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': SEARCH_TABLE}
+        ).first()
+        if existing:
+            return False
+        for statement in SEARCH_DDL:
+            conn.execute(text(statement))
+        conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+    return True
+
+
+def rebuild_search_index():
+    with db.engine.begin() as conn:
+        conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+
+
+def route_queries(user_id=1, game_id='00000000-0000-0000-0000-000000000000'):
+    # The lookups issued by the move_bp routes, keyed by route name, built by
+    # the same functions the routes call
+    return {
+        'game_revision': game_revision_query(user_id, game_id),
+        'user_revision': user_revision_query(user_id),
+        'get_game_moves': game_moves_query(user_id, game_id),
+        'get_game_moves.since_move': game_moves_query(user_id, game_id, since=100),
+        'get_game_details.game': Game.owned_query(user_id, game_id),
+        'get_game_details.moves': game_moves_query(user_id, game_id),
+        'get_user_games': user_games_query(user_id),
+        'get_user_games.next_page': user_games_query(
+            user_id, dict(parse_game_query({}), cursor=(datetime(2024, 1, 1), game_id))
+        ),
+        'get_user_stats.games': games_aggregate_query(user_id),
+        'get_user_stats.moves': moves_aggregate_query(user_id),
+        'get_game_replay.move': point_at_move_query(game_id, 100),
+        'get_game_replay.elapsed': point_at_elapsed_query(game_id, 600),
+        'get_game_replay.last': last_point_query(game_id),
+    }
+
+
+def explain(query):
+    statement = getattr(query, 'statement', query)
+    sql = statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+    rows = db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}')).all()
+    return [row[-1] for row in rows]
+
+
+def find_table_scans(queries=None):
+    # Returns {name: [plan lines]} for every query whose plan scans a table
+    # instead of searching an index
+    tables = {table.name for table in db.metadata.sorted_tables}
+    failures = {}
+    for name, query in (queries or route_queries()).items():
+        plan = explain(query)
+        scans = [
+            line for line in plan
+            if line.startswith('SCAN ') and line.split()[1] in tables
+            or 'USE TEMP B-TREE' in line
+        ]
+        if scans:
+            failures[name] = plan
+    return failures
+
+
+@contextmanager
+def count_statements():
+    # Collects every SQL statement the engine runs inside the block
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engines = list(db.engines.values())
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
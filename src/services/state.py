@@ -0,0 +1,369 @@
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+# State shared by the worker processes of one deployment: live game clocks,
+# game event pub/sub and cache invalidations.
+#
+# STATE_BACKEND=local (the default) keeps it in the process, which is all a
+# single worker needs; values are plain Python objects and nothing is copied.
+# STATE_BACKEND=socket connects every worker to a state server on a Unix
+# socket (flask --app src.main state-server), so any worker can serve any
+# game: clocks live in the server, events published by one worker reach
+# viewers connected to another, and workers drop cached users and stats that
+# another worker changed. The server is a stand-in for a networked store
+# such as Redis and offers the same handful of operations:
+#
+#   get, set, pop        values are anything JSON can encode
+#   append               appends to a list value
+#   lock, unlock         a mutex per key, released if its holder disconnects
+#   publish, subscribe   fire-and-forget messages per channel
+#
+# Each thread has its own connection, and a connection's commands run in
+# order, so commands that don't return anything are not waited for.
+
+DEFAULT_SOCKET = '/tmp/go-timer-state.sock'
+HEADER = struct.Struct('!I')
+NO_REPLY = frozenset(('set', 'append', 'unlock', 'publish', 'subscribe', 'unsubscribe'))
+
+
+class StateBackendError(ConnectionError):
+    pass
+
+
+def send_frame(sock, data):
+    payload = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    sock.sendall(HEADER.pack(len(payload)) + payload)
+
+
+def recv_frame(stream):
+    header = stream.read(HEADER.size)
+    if len(header) < HEADER.size:
+        return None
+    payload = stream.read(HEADER.unpack(header)[0])
+    return json.loads(payload)
+
+
+class LocalStateBackend:
+    shared = False
+
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.RLock()
+        self._locks = {}  # key -> [lock, holders and waiters]
+        self._subscribers = {}
+
+    def get(self, key):
+        return self._values.get(key)
+
+    def set(self, key, value):
+        self._values[key] = value
+
+    def pop(self, key):
+        return self._values.pop(key, None)
+
+    def append(self, key, item):
+        with self._lock:
+            self._values.setdefault(key, []).append(item)
+
+    @contextmanager
+    def lock(self, key):
+        # A mutex per key like the state server's, so games never wait on
+        # each other; dropped once nobody holds or waits for it
+        with self._lock:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.RLock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+    def publish(self, channel, message):
+        for callback in list(self._subscribers.get(channel, ())):
+            callback(channel, message)
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(callback)
+
+    def unsubscribe(self, channel, callback):
+        with self._lock:
+            callbacks = self._subscribers.get(channel)
+            if callbacks is not None:
+                callbacks.discard(callback)
+                if not callbacks:
+                    del self._subscribers[channel]
+
+    def close(self):
+        pass
+
+
+class SocketStateBackend:
+    shared = True
+
+    def __init__(self, path=DEFAULT_SOCKET, reconnect_delay=1.0):
+        self.path = path
+        self.reconnect_delay = reconnect_delay
+        self.node_id = uuid.uuid4().hex  # Lets caches skip their own broadcasts
+        self._local = threading.local()
+        self._callbacks = {}  # channel -> set of callbacks in this process
+        self._lock = threading.Lock()
+        self._listener = None
+        self._listener_socket = None
+        self._closed = False
+
+    def get(self, key):
+        return self._call('get', key)
+
+    def set(self, key, value):
+        self._call('set', key, value)
+
+    def pop(self, key):
+        return self._call('pop', key)
+
+    def append(self, key, item):
+        self._call('append', key, item)
+
+    @contextmanager
+    def lock(self, key):
+        self._call('lock', key)
+        try:
+            yield
+        finally:
+            self._call('unlock', key)
+
+    def publish(self, channel, message):
+        self._call('publish', channel, message)
+
+    def subscribe(self, channel, callback):
+        with self._lock:
+            callbacks = self._callbacks.setdefault(channel, set())
+            first = not callbacks
+            callbacks.add(callback)
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='state-listener', daemon=True)
+                self._listener.start()
+            elif first:
+                self._send_listener('subscribe', channel)
+
+    def unsubscribe(self, channel, callback):
+        with self._lock:
+            callbacks = self._callbacks.get(channel)
+            if callbacks is None:
+                return
+            callbacks.discard(callback)
+            if not callbacks:
+                del self._callbacks[channel]
+                self._send_listener('unsubscribe', channel)
+
+    def close(self):
+        self._closed = True
+        if self._listener_socket is not None:
+            self._listener_socket.close()
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError as e:
+            sock.close()
+            raise StateBackendError(f'State server at {self.path} is unavailable: {e}') from e
+        return sock, sock.makefile('rb')
+
+    def _call(self, *command):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        sock, stream = connection
+        try:
+            send_frame(sock, command)
+            if command[0] in NO_REPLY:
+                return None
+            reply = recv_frame(stream)
+        except OSError as e:
+            reply = None
+            error = e
+        else:
+            error = None
+        if reply is None:
+            # Reconnect on the next call; locks held by this connection are released by the server
+            self._local.connection = None
+            sock.close()
+            raise StateBackendError(f'Lost the state server connection: {error or "closed"}')
+        return reply[0]
+
+    def _send_listener(self, *command):
+        # Caller holds self._lock
+        if self._listener_socket is not None:
+            try:
+                send_frame(self._listener_socket, command)
+            except OSError:
+                pass  # The listener resubscribes when it reconnects
+
+    def _listen(self):
+        # Delivers messages for this process's channels; reconnects and
+        # resubscribes if the state server goes away
+        while not self._closed:
+            try:
+                sock, stream = self._connect()
+            except StateBackendError:
+                time.sleep(self.reconnect_delay)
+                continue
+            with self._lock:
+                self._listener_socket = sock
+                for channel in self._callbacks:
+                    send_frame(sock, ('subscribe', channel))
+            try:
+                while True:
+                    frame = recv_frame(stream)
+                    if frame is None:
+                        break
+                    _, channel, message = frame
+                    for callback in list(self._callbacks.get(channel, ())):
+                        callback(channel, message)
+            except OSError:
+                pass
+            with self._lock:
+                self._listener_socket = None
+            sock.close()
+
+
+def create_state_backend(app):
+    kind = app.config.get('STATE_BACKEND', 'local')
+    if kind == 'local':
+        return LocalStateBackend()
+    if kind == 'socket':
+        return SocketStateBackend(app.config.get('STATE_SOCKET', DEFAULT_SOCKET))
+    raise ValueError(f'Unknown STATE_BACKEND {kind!r}; expected local or socket')
+
+
+class StateServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    # The socket backend's server. One thread per connection; every command
+    # is applied under one lock, so each is atomic.
+    daemon_threads = True
+
+    def __init__(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, StateRequestHandler)
+        self.values = {}
+        self.lock_owners = {}  # key -> handler holding the lock
+        self.channels = {}  # channel -> set of subscribed handlers
+        self.condition = threading.Condition()
+
+
+class StateRequestHandler(socketserver.StreamRequestHandler):
+
+    def setup(self):
+        super().setup()
+        self.send_lock = threading.Lock()
+        self.held = set()
+        self.channels = set()
+
+    def handle(self):
+        while True:
+            try:
+                frame = recv_frame(self.rfile)
+            except OSError:
+                return
+            if frame is None:
+                return
+            reply = getattr(self, 'do_' + frame[0])(*frame[1:])
+            if frame[0] not in NO_REPLY:
+                self.send((reply,))
+
+    def finish(self):
+        server = self.server
+        with server.condition:
+            for key in self.held:
+                server.lock_owners.pop(key, None)
+            for channel in self.channels:
+                subscribers = server.channels.get(channel)
+                if subscribers is not None:
+                    subscribers.discard(self)
+                    if not subscribers:
+                        del server.channels[channel]
+            server.condition.notify_all()
+        super().finish()
+
+    def send(self, data):
+        with self.send_lock:
+            send_frame(self.connection, data)
+
+    def do_get(self, key):
+        with self.server.condition:
+            return self.server.values.get(key)
+
+    def do_set(self, key, value):
+        with self.server.condition:
+            self.server.values[key] = value
+
+    def do_pop(self, key):
+        with self.server.condition:
+            return self.server.values.pop(key, None)
+
+    def do_append(self, key, item):
+        with self.server.condition:
+            self.server.values.setdefault(key, []).append(item)
+
+    def do_lock(self, key):
+        server = self.server
+        with server.condition:
+            while server.lock_owners.get(key, self) is not self:
+                server.condition.wait()
+            server.lock_owners[key] = self
+            self.held.add(key)
+        return True
+
+    def do_unlock(self, key):
+        server = self.server
+        with server.condition:
+            if server.lock_owners.get(key) is self:
+                del server.lock_owners[key]
+                self.held.discard(key)
+                server.condition.notify_all()
+
+    def do_publish(self, channel, message):
+        with self.server.condition:
+            subscribers = list(self.server.channels.get(channel, ()))
+        for subscriber in subscribers:
+            try:
+                subscriber.send(('message', channel, message))
+            except OSError:
+                pass  # Cleaned up when its connection closes
+
+    def do_subscribe(self, channel):
+        with self.server.condition:
+            self.server.channels.setdefault(channel, set()).add(self)
+            self.channels.add(channel)
+
+    def do_unsubscribe(self, channel):
+        with self.server.condition:
+            subscribers = self.server.channels.get(channel)
+            if subscribers is not None:
+                subscribers.discard(self)
+                if not subscribers:
+                    del self.server.channels[channel]
+            self.channels.discard(channel)
+
+
+def serve_state(path=DEFAULT_SOCKET):
+    server = StateServer(path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
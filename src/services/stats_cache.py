@@ -0,0 +1,141 @@
+import threading
+from contextlib import contextmanager
+from src.models.user import db, Game
+from src.models.move_history import MoveHistory
+
+STATS_CHANNEL = 'stats-cache'
+
+
+def games_aggregate_query(user_id):
+    return db.session.query(
+        db.func.count(Game.id),
+        db.func.coalesce(db.func.sum(db.case((Game.status == 'completed', 1), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((Game.winner == 'white', 1), else_=0)), 0),
+        db.func.coalesce(db.func.sum(db.case((Game.winner == 'black', 1), else_=0)), 0),
+        # Moves of archived games no longer have move_history rows
+        db.func.coalesce(db.func.sum(Game.archived_move_count), 0),
+        db.func.coalesce(db.func.sum(Game.archived_move_time), 0)
+    ).filter(Game.user_id == user_id)
+
+
+def moves_aggregate_query(user_id):
+    return db.session.query(
+        db.func.count(MoveHistory.id),
+        db.func.coalesce(db.func.sum(MoveHistory.time_taken), 0)
+    ).filter(MoveHistory.user_id == user_id)
+
+
+def load_user_stats(user_id):
+    (total_games, completed_games, wins_as_white, wins_as_black,
+     archived_moves, archived_move_time) = games_aggregate_query(user_id).one()
+    total_moves, total_move_time = moves_aggregate_query(user_id).one()
+    return {
+        'total_games': total_games,
+        'completed_games': completed_games,
+        'wins_as_white': wins_as_white,
+        'wins_as_black': wins_as_black,
+        'total_moves': total_moves + archived_moves,
+        'total_move_time': total_move_time + archived_move_time
+    }
+
+
+def format_user_stats(stats):
+    average_move_time = stats['total_move_time'] / stats['total_moves'] if stats['total_moves'] else 0
+    return {
+        'total_games': stats['total_games'],
+        'completed_games': stats['completed_games'],
+        'total_moves': stats['total_moves'],
+        'average_move_time': round(average_move_time, 2),
+        'wins_as_white': stats['wins_as_white'],
+        'wins_as_black': stats['wins_as_black']
+    }
+
+
+class UserStatsCache:
+    # Raw per-user aggregates. Move inserts update an entry in place, game
+    # changes drop it so the next read recomputes it from the database.
+    #
+    # A move insert runs inside writing_moves(): from before its INSERT until
+    # after record_moves(), loads for those users are returned but not cached.
+    # An entry that record_moves() finds was therefore loaded before the
+    # INSERT, and adding the new moves to it never counts them twice. With a
+    # shared state backend the other worker processes can't order the
+    # broadcast against their own loads, so they drop the entry instead.
+
+    def __init__(self):
+        self._entries = {}
+        self._versions = {}
+        self._writers = {}  # user id -> move inserts in progress
+        self._lock = threading.Lock()
+        self.backend = None
+
+    def init_app(self, app, backend=None):
+        if backend is not None and backend.shared:
+            self.backend = backend
+            backend.subscribe(STATS_CHANNEL, self._on_message)
+
+    def get(self, user_id, loader=load_user_stats):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                return dict(entry)
+            version = self._versions.get(user_id, 0)
+
+        stats = loader(user_id)
+
+        with self._lock:
+            # Only keep the result if nothing changed while it was being loaded
+            if self._versions.get(user_id, 0) == version and user_id not in self._writers:
+                self._entries[user_id] = dict(stats)
+        return stats
+
+    @contextmanager
+    def writing_moves(self, user_ids):
+        # Wraps a move INSERT, its commit and the record_moves() calls after it
+        user_ids = set(user_ids)
+        with self._lock:
+            for user_id in user_ids:
+                self._writers[user_id] = self._writers.get(user_id, 0) + 1
+                self._versions[user_id] = self._versions.get(user_id, 0) + 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                for user_id in user_ids:
+                    self._writers[user_id] -= 1
+                    if not self._writers[user_id]:
+                        del self._writers[user_id]
+
+    def record_moves(self, user_id, count, time_taken):
+        self._record_moves(user_id, count, time_taken)
+        self._broadcast('invalidate', user_id)
+
+    def invalidate(self, user_id):
+        self._invalidate(user_id)
+        self._broadcast('invalidate', user_id)
+
+    def _record_moves(self, user_id, count, time_taken):
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                entry['total_moves'] += count
+                entry['total_move_time'] += time_taken
+
+    def _invalidate(self, user_id):
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._entries.pop(user_id, None)
+
+    def _broadcast(self, *message):
+        if self.backend is not None:
+            self.backend.publish(STATS_CHANNEL, [self.backend.node_id, *message])
+
+    def _on_message(self, channel, message):
+        origin, action, user_id = message[:3]
+        if origin == self.backend.node_id:
+            return
+        self._invalidate(user_id)
+
+
+stats_cache = UserStatsCache()
@@ -0,0 +1,99 @@
+from flask_sqlalchemy.session import Session
+from sqlalchemy import Delete, Insert, Update, event
+from sqlalchemy.engine import make_url
+
+# PRAGMAs applied to every new SQLite connection, by profile name
+STORAGE_PROFILES = {
+    # SQLite defaults: rollback journal, full fsync on every commit
+    'default': {},
+    # Readers never block behind the writer, commits skip the per-transaction
+    # fsync of the WAL, and hot pages stay mapped in memory
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -64 * 1024,  # negative means KiB
+        'busy_timeout': 5000,
+        'temp_store': 'MEMORY',
+    },
+}
+
+READER_BIND = 'reader'
+
+
+def is_file_database(url):
+    url = make_url(url)
+    return url.get_backend_name() == 'sqlite' and url.database not in (None, '', ':memory:')
+
+
+def configure_storage(app):
+    # Must run before db.init_app: a single pooled writer connection and a
+    # separate bind with a pool of reader connections to the same file
+    url = app.config['SQLALCHEMY_DATABASE_URI']
+    profile = app.config.setdefault('SQLITE_PROFILE', 'wal')
+    if profile not in STORAGE_PROFILES:
+        raise ValueError(f'Unknown SQLITE_PROFILE {profile!r}')
+
+    if not is_file_database(url):
+        return
+
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {
+        'pool_size': 1,
+        'max_overflow': 0,
+        'pool_timeout': 30,
+    })
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    binds.setdefault(READER_BIND, {
+        'url': url,
+        'pool_size': app.config.get('SQLITE_READER_POOL_SIZE', 8),
+        'max_overflow': 0,
+        'pool_timeout': 30,
+    })
+
+
+def storage_pragmas(app):
+    pragmas = dict(STORAGE_PROFILES[app.config.get('SQLITE_PROFILE', 'default')])
+    pragmas.update(app.config.get('SQLITE_PRAGMAS', {}))
+    return pragmas
+
+
+def apply_storage_profile(app, db):
+    # Must run inside an app context after db.init_app, before the first connection
+    pragmas = storage_pragmas(app)
+    for engine in db.engines.values():
+        install_pragmas(engine, pragmas)
+    return pragmas
+
+
+def install_pragmas(engine, pragmas):
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+class RoutingSession(Session):
+    # Sends reads to the reader pool and writes to the single writer
+    # connection. Once a transaction has written, everything else in it stays
+    # on the writer so it sees its own uncommitted changes.
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None:
+            engines = self._db.engines
+            writing = self._flushing or isinstance(clause, (Insert, Update, Delete))
+            if writing:
+                self.info['wrote'] = True
+            elif READER_BIND in engines and not self.info.get('wrote'):
+                return engines[READER_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def reset_writer_routing(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('wrote', None)
@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import OrderedDict
+from src.models.user import db, User
+
+USER_CACHE_CHANNEL = 'user-cache'
+
+
+def load_user_profile(user_id):
+    # An account marked deleted is gone for its sessions while its rows are purged
+    user = db.session.get(User, user_id)
+    return user.to_dict() if user and user.deleted_at is None else None
+
+
+class UserProfileCache:
+    # Serialized User.to_dict() per user id for /api/auth/me and /api/profile.
+    # Least recently used entries are evicted past USER_CACHE_SIZE and entries
+    # expire after USER_CACHE_TTL seconds, which bounds how stale another
+    # worker process can be after a profile change. With a shared state
+    # backend, changes are broadcast and other workers drop the entry at once.
+
+    def __init__(self, max_size=1024, ttl=300, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.backend = None
+
+    def init_app(self, app, backend=None):
+        self.max_size = app.config.get('USER_CACHE_SIZE', self.max_size)
+        self.ttl = app.config.get('USER_CACHE_TTL', self.ttl)
+        if backend is not None and backend.shared:
+            self.backend = backend
+            backend.subscribe(USER_CACHE_CHANNEL, self._on_message)
+
+    def get(self, user_id, loader=load_user_profile):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                profile, expires_at = entry
+                if expires_at > self.clock():
+                    self._entries.move_to_end(user_id)
+                    self.hits += 1
+                    return dict(profile)
+                del self._entries[user_id]
+                self.expirations += 1
+            self.misses += 1
+            version = self._versions.get(user_id, 0)
+
+        profile = loader(user_id)
+        if profile is None:
+            return None
+
+        with self._lock:
+            # Only keep the result if nothing changed while it was being loaded
+            if self._versions.get(user_id, 0) == version:
+                self._store(user_id, profile)
+        return dict(profile)
+
+    def put(self, user_id, profile):
+        # For routes that just loaded or changed the user anyway
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._store(user_id, profile)
+        self._broadcast(user_id)
+
+    def invalidate(self, user_id):
+        self._invalidate(user_id)
+        self._broadcast(user_id)
+
+    def _invalidate(self, user_id):
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+            self._entries.pop(user_id, None)
+
+    def _broadcast(self, user_id):
+        if self.backend is not None:
+            self.backend.publish(USER_CACHE_CHANNEL, [self.backend.node_id, user_id])
+
+    def _on_message(self, channel, message):
+        origin, user_id = message
+        if origin != self.backend.node_id:
+            self._invalidate(user_id)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+    def metrics(self):
+        # Counters for src/services/metrics.py
+        stats = self.stats()
+        return [
+            ('gotimer_user_cache_hits_total', 'counter', 'User profile cache hits', stats['hits']),
+            ('gotimer_user_cache_misses_total', 'counter', 'User profile cache misses', stats['misses']),
+            ('gotimer_user_cache_evictions_total', 'counter', 'User profiles evicted by the size limit', stats['evictions']),
+            ('gotimer_user_cache_entries', 'gauge', 'User profiles currently cached', stats['size'])
+        ]
+
+    def _store(self, user_id, profile):
+        self._entries[user_id] = (dict(profile), self.clock() + self.ttl)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+user_cache = UserProfileCache()
+
+
+def account_deleted(user_id):
+    # Sessions on other devices outlive the account; their writes are refused
+    return user_cache.get(user_id) is None
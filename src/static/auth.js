@@ -59,6 +59,7 @@ document.addEventListener('DOMContentLoaded', () => {
             const result = await response.json();
 
             if (response.ok) {
+                await uploadGuestGames();
                 window.location.href = '/settings.html';
             } else {
                 showError(result.error || 'Login failed');
@@ -91,6 +92,7 @@ document.addEventListener('DOMContentLoaded', () => {
             const result = await response.json();
 
             if (response.ok) {
+                await uploadGuestGames();
                 window.location.href = '/settings.html';
             } else {
                 showError(result.error || 'Registration failed');
@@ -100,6 +102,79 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // Games played as a guest only exist in localStorage (see timer.js). Once
+    // the player has an account they are uploaded in one /api/import request;
+    // re-uploading is harmless since the server skips game ids it already has.
+    async function uploadGuestGames() {
+        const savedGames = JSON.parse(localStorage.getItem('savedGames') || '[]');
+        const keys = [];
+        const games = [];
+
+        for (let i = 0; i < localStorage.length; i++) {
+            const key = localStorage.key(i);
+            if (!key || !key.startsWith('game_')) continue;
+
+            let gameData;
+            try {
+                gameData = JSON.parse(localStorage.getItem(key));
+            } catch (error) {
+                continue;
+            }
+            if (!gameData || !gameData.guest || !gameData.gameId || !gameData.moves || gameData.moves.length === 0) continue;
+
+            const settings = gameData.settings || {};
+            const saved = savedGames.find(game => game.gameId === gameData.gameId) || {};
+            keys.push(key);
+            games.push({
+                id: gameData.gameId,
+                title: saved.title || null,
+                comment: saved.comment || null,
+                main_time: (settings.mainTime || 10) * 60,
+                byoyomi_time: settings.byoYomiTime || 30,
+                byoyomi_periods: settings.byoYomiPeriods || 3,
+                status: saved.title ? 'saved' : 'completed',
+                created_at: gameData.createdAt || null,
+                saved_at: saved.savedAt || null,
+                moves: gameData.moves.map(move => ({
+                    move_number: move.moveNumber,
+                    player_color: move.player,
+                    time_taken: move.timeUsed,
+                    main_time_remaining: move.mainTime,
+                    byoyomi_time_remaining: move.byoyomiTime,
+                    byoyomi_periods_remaining: move.byoyomiPeriods,
+                    in_byoyomi: move.inByoyomi,
+                    created_at: move.timestamp || null
+                }))
+            });
+        }
+
+        if (games.length === 0) return;
+
+        try {
+            const response = await fetch('/api/import?filename=guest-games.json', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                credentials: 'include',
+                body: JSON.stringify(games)
+            });
+
+            if (response.ok) {
+                // The games now belong to the account and sync like any other
+                keys.forEach(key => {
+                    const gameData = JSON.parse(localStorage.getItem(key));
+                    gameData.guest = false;
+                    gameData.syncedMoveNumber = Math.max(...gameData.moves.map(move => move.moveNumber));
+                    localStorage.setItem(key, JSON.stringify(gameData));
+                });
+            }
+        } catch (error) {
+            // Left marked as guest games, so the next login tries again
+            console.error('Error uploading guest games:', error);
+        }
+    }
+
     function switchToRegister() {
         isLoginMode = false;
         
@@ -78,8 +78,8 @@ document.addEventListener('DOMContentLoaded', async () => {
         startGameButton.innerHTML = 'Creating Game...';
 
         try {
-            // Generate a unique game ID for local storage
-            const gameId = 'game_' + Date.now();
+            // Generate a unique game ID; the server creates the game on first sync
+            const gameId = crypto.randomUUID ? crypto.randomUUID() : 'game_' + Date.now();
 
             // Store game settings in sessionStorage
             sessionStorage.setItem('gameSettings', JSON.stringify({
@@ -14,6 +14,7 @@ document.addEventListener('DOMContentLoaded', () => {
         gameId: null,
         moveNumber: 0,
         moves: [],
+        syncedMoveNumber: 0,  // Highest move number confirmed by the server
         lastMoveTime: null
     };
 
@@ -21,6 +22,15 @@ document.addEventListener('DOMContentLoaded', () => {
     let currentUser = null;
     let utilityButton = null;
 
+    // Move sync state: at most one request in flight, failures back off
+    let syncTimer = null;
+    let syncInFlight = false;
+    let syncRetryDelay = 0;
+    let syncDisabled = false;
+    let syncedPaused = false;  // Pause state last confirmed by the server
+    const MAX_SYNC_BATCH = 1000;
+    const MAX_SYNC_RETRY_DELAY = 30000;
+
     // DOM elements
     const timerSection = document.querySelector('.timer-section');
     const whiteTimer = document.querySelector('.white-timer');
@@ -43,11 +53,11 @@ document.addEventListener('DOMContentLoaded', () => {
                     currentUser = await response.json();
                 } else {
                     // Set as guest user if not authenticated
-                    currentUser = { username: 'Guest User' };
+                    currentUser = { username: 'Guest User', is_guest: true };
                 }
             } catch (error) {
                 // Set as guest user if authentication fails
-                currentUser = { username: 'Guest User' };
+                currentUser = { username: 'Guest User', is_guest: true };
             }
 
             // Get game settings from sessionStorage (set by settings page)
@@ -62,6 +72,11 @@ document.addEventListener('DOMContentLoaded', () => {
             gameState.blackByoyomiPeriods = gameSettings.byoYomiPeriods || 3;
             gameState.gameId = gameSettings.gameId;
 
+            // Pick up where a reloaded page left off, then send anything unsynced
+            restoreFromLocalStorage();
+            scheduleSync();
+            window.addEventListener('online', () => scheduleSync());
+
             // Create utility button AFTER DOM elements are ready
             createUtilityButton();
             updateDisplay();
@@ -221,10 +236,8 @@ document.addEventListener('DOMContentLoaded', () => {
         // Always save to local storage for persistence
         saveToLocalStorage();
 
-        // Save move to backend (if not guest)
-        if (!currentUser.is_guest && gameState.gameId) {
-            saveMoveToBackend(move);
-        }
+        // Sync with the backend (if not guest)
+        scheduleSync();
 
         // Switch players instantly
         gameState.currentPlayer = gameState.currentPlayer === 'white' ? 'black' : 'white';
@@ -235,38 +248,111 @@ document.addEventListener('DOMContentLoaded', () => {
         updateDisplay();
     }
 
-    // Save move to backend (if not guest) and local storage
-    async function saveMoveToBackend(move) {
-        // Always save to local storage for guests
-        if (currentUser.is_guest) {
-            saveToLocalStorage();
-            return;
-        }
+    function toServerMove(move) {
+        return {
+            move_number: move.moveNumber,
+            player_color: move.player,
+            time_taken: move.timeUsed,
+            main_time_remaining: move.mainTime,
+            byoyomi_time_remaining: move.byoyomiTime,
+            byoyomi_periods_remaining: move.byoyomiPeriods,
+            in_byoyomi: move.inByoyomi
+        };
+    }
+
+    function fromServerMove(move) {
+        return {
+            moveNumber: move.move_number,
+            player: move.player_color,
+            timeUsed: move.time_taken,
+            mainTime: move.main_time_remaining,
+            byoyomiTime: move.byoyomi_time_remaining,
+            byoyomiPeriods: move.byoyomi_periods_remaining,
+            inByoyomi: move.in_byoyomi,
+            timestamp: move.created_at
+        };
+    }
+
+    function scheduleSync(delay = 0) {
+        if (syncDisabled || !gameState.gameId || syncTimer) return;
+
+        syncTimer = setTimeout(() => {
+            syncTimer = null;
+            syncMoves();
+        }, delay);
+    }
+
+    // Send every move the server hasn't confirmed and take back the moves this
+    // device is missing, in one request. Moves are matched by move number and
+    // the server's copy wins a conflict.
+    async function syncMoves() {
+        if (syncInFlight) return;
 
-        // For registered users, save to both backend and local storage
+        const pending = gameState.moves
+            .filter(move => move.moveNumber > gameState.syncedMoveNumber)
+            .slice(0, MAX_SYNC_BATCH);
+        const gameSettings = JSON.parse(sessionStorage.getItem('gameSettings') || '{}');
+        const paused = gameState.isPaused;
+
+        syncInFlight = true;
         try {
-            await fetch(`/api/games/${gameState.gameId}/moves`, {
+            const response = await fetch(`/api/games/${gameState.gameId}/sync`, {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 credentials: 'include',
                 body: JSON.stringify({
-                    move_number: move.moveNumber,
-                    player_color: move.player,
-                    time_taken: move.timeUsed,
-                    main_time_remaining: move.mainTime,
-                    byoyomi_time_remaining: move.byoyomiTime,
-                    byoyomi_periods_remaining: move.byoyomiPeriods,
-                    in_byoyomi: move.inByoyomi
+                    since: gameState.syncedMoveNumber,
+                    moves: pending.map(toServerMove),
+                    // Keeps the server from timing out a paused game
+                    paused: paused,
+                    // Lets the server create the game if it was started offline
+                    game: {
+                        main_time: (gameSettings.mainTime || 10) * 60,
+                        byoyomi_time: gameSettings.byoYomiTime || 30,
+                        byoyomi_periods: gameSettings.byoYomiPeriods || 3
+                    }
                 })
             });
-            
-            // Also save to local storage as backup
-            saveToLocalStorage(move);
+
+            if (response.status === 401 || response.status === 409) {
+                // No session (offline-only play), or the game already ended on
+                // the server: keep the moves locally
+                syncDisabled = true;
+                return;
+            }
+            if (!response.ok) {
+                throw new Error(`Sync failed with status ${response.status}`);
+            }
+
+            const result = await response.json();
+            mergeServerMoves(result.moves.map(fromServerMove));
+            gameState.syncedMoveNumber = Math.max(gameState.syncedMoveNumber, result.last_move_number);
+            syncedPaused = paused;
+            syncRetryDelay = 0;
+            saveToLocalStorage();
         } catch (error) {
-            console.error('Error saving move to backend:', error);
-            // Fallback to local storage
-            saveToLocalStorage(move);
+            console.error('Error syncing moves:', error);
+            syncRetryDelay = Math.min(syncRetryDelay ? syncRetryDelay * 2 : 1000, MAX_SYNC_RETRY_DELAY);
+        } finally {
+            syncInFlight = false;
         }
+
+        // Moves made and pauses toggled while the request was out go in the next one
+        if (syncRetryDelay) {
+            scheduleSync(syncRetryDelay);
+        } else if (gameState.isPaused !== syncedPaused
+                || gameState.moves.some(move => move.moveNumber > gameState.syncedMoveNumber)) {
+            scheduleSync();
+        }
+    }
+
+    function mergeServerMoves(serverMoves) {
+        if (serverMoves.length === 0) return;
+
+        const byNumber = new Map(gameState.moves.map(move => [move.moveNumber, move]));
+        serverMoves.forEach(move => byNumber.set(move.moveNumber, move));
+        gameState.moves = [...byNumber.values()].sort((a, b) => a.moveNumber - b.moveNumber);
+        gameState.moveNumber = Math.max(gameState.moveNumber, ...gameState.moves.map(move => move.moveNumber));
     }
 
     function saveToLocalStorage() {
@@ -277,6 +363,11 @@ document.addEventListener('DOMContentLoaded', () => {
             gameData.moves = gameState.moves; // Save the entire moves array
             gameData.lastUpdated = new Date().toISOString();
             gameData.gameId = gameState.gameId;
+            gameData.syncedMoveNumber = gameState.syncedMoveNumber;
+            gameData.createdAt = gameData.createdAt || gameData.lastUpdated;
+            // Guest games are uploaded when the player registers (see auth.js)
+            gameData.guest = !!currentUser.is_guest;
+            gameData.settings = JSON.parse(sessionStorage.getItem('gameSettings') || '{}');
             
             localStorage.setItem(gameKey, JSON.stringify(gameData));
         } catch (error) {
@@ -284,6 +375,33 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    function restoreFromLocalStorage() {
+        try {
+            const gameKey = `game_${gameState.gameId || 'current'}`;
+            const gameData = JSON.parse(localStorage.getItem(gameKey) || '{}');
+            if (!gameData.moves || gameData.moves.length === 0) return;
+
+            gameState.moves = gameData.moves;
+            gameState.syncedMoveNumber = gameData.syncedMoveNumber || 0;
+            gameState.moveNumber = Math.max(...gameData.moves.map(move => move.moveNumber));
+
+            // Each player's clock as of their last move; the byo-yomi period
+            // starts over after every move
+            const gameSettings = JSON.parse(sessionStorage.getItem('gameSettings') || '{}');
+            gameData.moves.forEach(move => {
+                const player = move.player === 'white' ? 'white' : 'black';
+                gameState[`${player}Time`] = move.mainTime;
+                gameState[`${player}ByoyomiTime`] = gameSettings.byoYomiTime || 30;
+                gameState[`${player}ByoyomiPeriods`] = move.byoyomiPeriods;
+                gameState[`${player}InByoyomi`] = move.inByoyomi;
+            });
+            const lastMove = gameData.moves[gameData.moves.length - 1];
+            gameState.currentPlayer = lastMove.player === 'white' ? 'black' : 'white';
+        } catch (error) {
+            console.error('Error restoring from local storage:', error);
+        }
+    }
+
     function loadFromLocalStorage() {
         try {
             const gameKey = `game_${gameState.gameId || 'current'}`;
@@ -404,15 +522,25 @@ document.addEventListener('DOMContentLoaded', () => {
         } else {
             startTimer();
         }
+        scheduleSync();
     }
 
     function restartGame() {
         if (confirm('Are you sure you want to restart the game?')) {
             clearInterval(timerInterval);
-            window.location.reload();
+            startNewGame();
         }
     }
 
+    function startNewGame() {
+        // Same settings under a new game id, so the restarted game's moves
+        // don't collide with the previous game's move numbers
+        const gameSettings = JSON.parse(sessionStorage.getItem('gameSettings') || '{}');
+        gameSettings.gameId = crypto.randomUUID ? crypto.randomUUID() : 'game_' + Date.now();
+        sessionStorage.setItem('gameSettings', JSON.stringify(gameSettings));
+        window.location.reload();
+    }
+
     async function showMoveHistory() {
         if (!historyModal) return;
         
@@ -593,28 +721,22 @@ document.addEventListener('DOMContentLoaded', () => {
                 savedAt: new Date().toISOString()
             };
 
-            // For guests, save to local storage
-            if (currentUser.is_guest) {
+            // Guest games are kept by the server until the guest registers
+            const response = await fetch('/api/games/save', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                credentials: 'include',
+                body: JSON.stringify(gameData)
+            });
+
+            if (response.ok) {
+                // Also save to local storage as backup
                 saveGameToLocalStorage(gameData);
-                alert('Game saved locally!');
+                alert('Game saved successfully!');
             } else {
-                // For registered users, save to backend
-                const response = await fetch('/api/games/save', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    credentials: 'include',
-                    body: JSON.stringify(gameData)
-                });
-
-                if (response.ok) {
-                    // Also save to local storage as backup
-                    saveGameToLocalStorage(gameData);
-                    alert('Game saved successfully!');
-                } else {
-                    // Fallback to local storage
-                    saveGameToLocalStorage(gameData);
-                    alert('Game saved locally (server unavailable)');
-                }
+                // Fallback to local storage
+                saveGameToLocalStorage(gameData);
+                alert('Game saved locally (server unavailable)');
             }
 
             closeSaveModal();
@@ -719,7 +841,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
         if (e.target.classList.contains('timeout-btn')) {
             if (e.target.textContent === 'Restart') {
-                window.location.reload();
+                startNewGame();
             } else {
                 window.location.href = '/settings.html';
             }
@@ -0,0 +1,57 @@
+import os
+import tempfile
+import uuid
+import pytest
+
+# src.main binds the database and every service when it is imported, so the
+# environment has to point at a throwaway database before the first import
+_directory = tempfile.mkdtemp(prefix='go-timer-tests-')
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(_directory, 'test.db')}",
+    STATE_BACKEND='local',
+    FLAG_FALL_SCHEDULER='0',
+    MOVE_WRITE_BUFFER='0',
+    AUTH_RATE_LIMIT='0'
+)
+
+from src.main import app as flask_app
+from src.models.user import db, User
+
+
+@pytest.fixture
+def app():
+    with flask_app.app_context():
+        yield flask_app
+        db.session.rollback()
+
+
+def make_user():
+    # Logged in through the session cookie, so no password hash is needed
+    name = uuid.uuid4().hex[:12]
+    user = User(username=name, email=f'{name}@example.com', password_hash='-')
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def login(client, user):
+    with client.session_transaction() as sess:
+        sess.update(user_id=user.id, username=user.username, is_guest=False)
+    return client
+
+
+@pytest.fixture
+def user(app):
+    return make_user()
+
+
+@pytest.fixture
+def client(app, user):
+    return login(app.test_client(), user)
+
+
+@pytest.fixture
+def game_id(client):
+    response = client.post('/api/games/new', json={'main_time': 60, 'byoyomi_time': 10, 'byoyomi_periods': 1})
+    assert response.status_code == 201
+    return response.get_json()['game_id']
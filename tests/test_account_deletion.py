@@ -0,0 +1,20 @@
+from conftest import login
+from src.models.user import db, Game
+from src.models.move_history import MoveHistory
+from src.services.account_deletion import mark_user_deleted
+
+MOVE = {'move_number': 1, 'player_color': 'black', 'time_taken': 3}
+
+
+def test_sessions_of_a_deleted_account_cannot_write(app, client, user, game_id):
+    other_device = login(app.test_client(), user)
+    assert other_device.get('/api/auth/me').status_code == 200
+
+    # Deleted elsewhere, before the purge reaches the games
+    mark_user_deleted(user)
+
+    assert other_device.post(f'/api/games/{game_id}/moves', json=MOVE).status_code == 401
+    assert other_device.post('/api/games/new', json={}).status_code == 401
+    assert client.get('/api/auth/me').status_code == 401
+    assert db.session.scalar(Game.status_query(user.id, game_id)) is None
+    assert db.session.scalar(db.select(db.func.count()).where(MoveHistory.game_id == game_id)) == 0
@@ -0,0 +1,66 @@
+import pytest
+from src.services.clock import ClockTable, ClockError, charge
+from src.services.state import LocalStateBackend
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def table():
+    return ClockTable(clock=FakeClock(), backend=LocalStateBackend())
+
+
+def test_charge_byoyomi():
+    # Main time first, then every byo-yomi period that runs out in full
+    assert charge(10, 5, 3, False, 4, 5) == (6, 5, 3, False, False)
+    assert charge(10, 5, 3, False, 12, 5) == (0, 3, 3, True, False)
+    assert charge(0, 5, 3, True, 11, 5) == (0, 4, 1, True, False)
+    assert charge(0, 5, 1, True, 5, 5)[4] is True
+
+
+def test_press_charges_the_player_to_move(table):
+    table.start('g', 1, 60, 10, 2)
+    table.clock.now += 7.5
+
+    state, move = table.press('g', 'black')
+
+    assert move['player_color'] == 'black' and move['move_number'] == 1 and move['time_taken'] == 7
+    assert state.main_left[0] == 52.5 and state.main_left[1] == 60
+    with pytest.raises(ClockError):
+        table.press('g', 'black')
+
+
+def test_pause_stops_the_clock(table):
+    table.start('g', 1, 60, 10, 2)
+    table.clock.now += 5
+    table.pause('g')
+    table.clock.now += 1000
+    assert table.get('g').next_deadline() is None
+    with pytest.raises(ClockError):
+        table.press('g')
+
+    table.pause('g')
+    table.clock.now += 5
+    assert table.get('g').to_dict(table.clock())['players']['black']['main_time_remaining'] == 50
+
+
+def test_flag_falls_at_the_deadline(table):
+    state = table.start('g', 1, 60, 10, 2)
+    deadline = state.next_deadline()
+    assert deadline == table.clock() + 80
+
+    table.clock.now = deadline - 0.5
+    assert table.get('g').to_dict(table.clock())['flagged'] is None
+    table.clock.now = deadline
+    assert table.get('g').to_dict(table.clock())['flagged'] == 'black'
+
+    # A press after the flag fell records nothing
+    state, move = table.press('g')
+    assert move is None and state.move_number == 0
@@ -0,0 +1,66 @@
+import time
+from src.models.user import db, Game
+from src.services.flag_fall import FlagFallScheduler, TimerWheel
+from src.services.state import LocalStateBackend
+
+
+def scheduler(app, offset):
+    # Time control in conftest: 60s main time plus one 10s period, 120s grace
+    scheduler = FlagFallScheduler(clock=lambda: time.time() + offset)
+    scheduler.app = app
+    scheduler.backend = LocalStateBackend()
+    return scheduler
+
+
+def game(game_id):
+    db.session.expire_all()
+    return db.session.get(Game, game_id)
+
+
+def test_timer_wheel_fires_at_or_after_the_deadline():
+    wheel = TimerWheel(now=0, tick=1.0, slots=8)
+    wheel.schedule('a', 2.5)
+    wheel.schedule('b', 20)  # more than one turn of the wheel away
+    wheel.schedule('c', 4)
+    wheel.cancel('c')
+
+    assert wheel.advance(2) == []
+    assert wheel.advance(3) == ['a']
+    assert wheel.advance(19) == []
+    assert wheel.advance(20) == ['b']
+    assert len(wheel) == 0
+
+
+def test_expire_completes_a_game_whose_flag_fell(app, client, game_id):
+    flag = scheduler(app, 1000)
+    flag._expire(game_id)
+
+    assert game(game_id).status == 'completed'
+    assert game(game_id).winner == 'white'
+    assert flag.flag_falls == 1
+
+
+def test_expire_counts_from_the_last_move(app, client, game_id):
+    client.post(f'/api/games/{game_id}/moves', json={
+        'move_number': 1, 'player_color': 'black', 'time_taken': 5, 'main_time_remaining': 55
+    })
+
+    flag = scheduler(app, 150)
+    flag._expire(game_id)
+    assert game(game_id).status == 'active'
+    assert game_id in flag.wheel
+
+    flag = scheduler(app, 1000)
+    flag._expire(game_id)
+    assert game(game_id).status == 'completed'
+    assert game(game_id).winner == 'black'
+
+
+def test_unwatched_games_are_left_alone(app, client, game_id):
+    game(game_id).flag_fall = False
+    db.session.commit()
+
+    flag = scheduler(app, 1000)
+    flag._expire(game_id)
+    assert game(game_id).status == 'active'
+    assert flag.flag_falls == 0
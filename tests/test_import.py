@@ -0,0 +1,24 @@
+import json
+
+GAME = {
+    'main_time': 60, 'byoyomi_time': 10, 'byoyomi_periods': 1, 'status': 'completed',
+    'moves': [{'move_number': 1, 'player_color': 'black', 'time_taken': 3}]
+}
+
+
+def test_import_skips_games_the_api_would_refuse(client):
+    games = [
+        dict(GAME, title='good'),
+        dict(GAME, title='color', moves=[{'move_number': 1, 'player_color': 'red', 'time_taken': 3}]),
+        dict(GAME, title='status', status='won'),
+        dict(GAME, title='time', moves=[{'move_number': 1, 'player_color': 'black', 'time_taken': -3}]),
+    ]
+
+    response = client.post('/api/import?filename=games.ndjson', data='\n'.join(json.dumps(game) for game in games))
+
+    report = response.get_json()
+    assert response.status_code == 200
+    assert report['games_parsed'] == 4
+    assert report['games_imported'] == 1 and report['moves_imported'] == 1
+    assert report['games_invalid'] == 3
+    assert [error['error'].split(':')[0] for error in report['errors']] == ['Game 2', 'Game 3', 'Game 4']
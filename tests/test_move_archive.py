@@ -0,0 +1,9 @@
+from datetime import datetime, timezone
+from src.services.move_archive import _from_micros, _to_micros
+
+
+def test_timestamps_round_trip_as_naive_utc():
+    for value in (datetime(2024, 5, 6, 7, 8, 9, 123456), datetime(1969, 12, 31, 23, 59, 59, 1), datetime(1970, 1, 1)):
+        assert _from_micros(_to_micros(value)) == value
+    aware = datetime(2024, 5, 6, 9, 8, 9, tzinfo=timezone.utc)
+    assert _from_micros(_to_micros(aware)) == datetime(2024, 5, 6, 9, 8, 9)
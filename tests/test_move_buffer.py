@@ -0,0 +1,73 @@
+import pytest
+from src.models.user import db
+from src.models.move_history import MoveHistory
+from src.services import move_buffer as move_buffer_module
+from src.services.move_buffer import MoveWriteBuffer, MoveDataError, move_row
+
+
+@pytest.fixture
+def buffer(app):
+    buffer = MoveWriteBuffer()
+    buffer.app = app
+    return buffer
+
+
+def stored_moves(game_id):
+    return db.session.scalars(
+        db.select(MoveHistory.move_number).where(MoveHistory.game_id == game_id).order_by(MoveHistory.id)
+    ).all()
+
+
+def moves(user, game_id, numbers):
+    return [move_row({'move_number': n, 'player_color': ('white', 'black')[n % 2], 'time_taken': 3}, user.id, game_id)
+            for n in numbers]
+
+
+def test_move_row_validates(user):
+    row = move_row({'move_number': '4', 'player_color': 'white', 'time_taken': 2.0}, user.id, 'g')
+    assert row['move_number'] == 4 and row['time_taken'] == 2 and row['in_byoyomi'] is False
+    with pytest.raises(MoveDataError):
+        move_row({'move_number': 1, 'player_color': 'red', 'time_taken': 1}, user.id, 'g')
+    with pytest.raises(MoveDataError):
+        move_row({'move_number': 1, 'player_color': 'black', 'time_taken': -1}, user.id, 'g')
+    with pytest.raises(MoveDataError):
+        move_row({'move_number': 1, 'player_color': 'black', 'time_taken': 1, 'in_byoyomi': 'yes'}, user.id, 'g')
+
+
+def test_flush_writes_in_arrival_order(buffer, user, game_id):
+    for row in moves(user, game_id, [1, 2, 3]):
+        buffer.add(row)
+
+    assert buffer.flush() == 3
+    assert buffer.flush() == 0
+    assert stored_moves(game_id) == [1, 2, 3]
+
+
+def test_failed_flush_is_retried_then_written_one_by_one(buffer, user, game_id, monkeypatch):
+    write_moves = move_buffer_module.write_moves
+    calls = []
+
+    def flaky_write(rows):
+        calls.append(len(rows))
+        if len(calls) == 1:
+            raise RuntimeError('database is locked')
+        if rows[0]['move_number'] == 2:
+            raise RuntimeError('bad row')
+        write_moves(rows)
+
+    monkeypatch.setattr(move_buffer_module, 'write_moves', flaky_write)
+    for row in moves(user, game_id, [1, 2, 3]):
+        buffer.add(row)
+
+    # The failed batch goes back in front of the queue
+    assert buffer.flush() == 0
+    buffer.add(moves(user, game_id, [4])[0])
+    assert buffer.flush() == 3
+    assert calls == [3, 1, 1, 1, 1]
+    assert buffer.dropped == 1
+    assert stored_moves(game_id) == [1, 3, 4]
+
+    # Back to batches once a flush got through
+    buffer.add(moves(user, game_id, [5])[0])
+    assert buffer.flush() == 1
+    assert calls[-1] == 1 and len(calls) == 6
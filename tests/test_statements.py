@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+from src.models.user import db, Game
+from src.models.move_history import MoveHistory
+from src.services.schema import count_statements
+
+GAMES = 30
+MOVES = 40
+
+
+def test_listing_games_costs_two_statements(client, user):
+    # The user's revision and one page query counting each game's moves,
+    # however many games and moves there are
+    started = datetime(2024, 1, 1)
+    games = [
+        dict(id=f'{index:08d}-{user.id:04d}-0000-0000-000000000000', user_id=user.id, main_time=600,
+             byoyomi_time=30, byoyomi_periods=3, status='completed', created_at=started + timedelta(minutes=index))
+        for index in range(GAMES)
+    ]
+    moves = [
+        dict(user_id=user.id, game_id=game['id'], move_number=number, player_color=('black', 'white')[number % 2],
+             time_taken=5, main_time_remaining=600, byoyomi_time_remaining=30, byoyomi_periods_remaining=3,
+             in_byoyomi=False, created_at=game['created_at'])
+        for game in games for number in range(1, MOVES + 1)
+    ]
+    db.session.execute(Game.__table__.insert(), games)
+    db.session.execute(MoveHistory.__table__.insert(), moves)
+    db.session.commit()
+
+    with count_statements() as statements:
+        response = client.get('/api/games')
+
+    assert response.status_code == 200
+    listed = response.get_json()
+    assert listed and all(game['move_count'] == MOVES for game in listed)
+    assert len(statements) <= 2, '\n'.join(statements)
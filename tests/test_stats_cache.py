@@ -0,0 +1,57 @@
+from src.services.stats_cache import UserStatsCache
+
+
+def loader(stats):
+    calls = []
+
+    def load(user_id):
+        calls.append(user_id)
+        return dict(stats)
+    return load, calls
+
+
+def test_get_caches_and_record_moves_updates_in_place():
+    cache = UserStatsCache()
+    load, calls = loader({'total_moves': 2, 'total_move_time': 10})
+
+    assert cache.get(1, load)['total_moves'] == 2
+    cache.record_moves(1, 3, 12)
+    assert cache.get(1, load) == {'total_moves': 5, 'total_move_time': 22}
+    assert calls == [1]
+
+    cache.invalidate(1)
+    cache.get(1, load)
+    assert calls == [1, 1]
+
+
+def test_load_during_insert_is_not_cached():
+    # A load that may or may not have seen the INSERT must not be cached, or
+    # record_moves() would count the new moves a second time
+    cache = UserStatsCache()
+    stored = {'total_moves': 1, 'total_move_time': 5}
+
+    def load(user_id):
+        return dict(stored)
+
+    with cache.writing_moves([1]):
+        stored = {'total_moves': 2, 'total_move_time': 9}
+        assert cache.get(1, load)['total_moves'] == 2
+        cache.record_moves(1, 1, 4)
+
+    assert cache.get(1, load)['total_moves'] == 2
+    cache.record_moves(1, 1, 4)
+    assert cache.get(1, lambda user_id: {'total_moves': 0, 'total_move_time': 0})['total_moves'] == 3
+
+
+def test_load_overlapping_a_change_is_not_cached():
+    cache = UserStatsCache()
+
+    def load(user_id):
+        # Another request changes the user's games while this one loads
+        cache.invalidate(user_id)
+        return {'total_moves': 0, 'total_move_time': 0}
+
+    cache.get(1, load)
+    fresh, calls = loader({'total_moves': 7, 'total_move_time': 1})
+    assert cache.get(1, fresh)['total_moves'] == 7
+    assert calls == [1]
@@ -0,0 +1,69 @@
+import uuid
+from conftest import login, make_user
+from src.models.user import db, Game
+from src.models.move_history import MoveHistory
+
+SETTINGS = {'main_time': 300, 'byoyomi_time': 30, 'byoyomi_periods': 3}
+
+
+def move(number, time_taken=4):
+    return {'move_number': number, 'player_color': ('white', 'black')[number % 2], 'time_taken': time_taken}
+
+
+def stored_moves(game_id):
+    return db.session.scalars(
+        db.select(MoveHistory.move_number).where(MoveHistory.game_id == game_id).order_by(MoveHistory.move_number)
+    ).all()
+
+
+def test_sync_is_idempotent(client):
+    game_id = str(uuid.uuid4())
+    body = {'since': 0, 'moves': [move(1), move(2)], 'game': SETTINGS}
+
+    first = client.post(f'/api/games/{game_id}/sync', json=body)
+    assert first.status_code == 200
+    assert first.get_json()['accepted'] == [1, 2]
+
+    # A retry after a lost response stores nothing twice
+    retry = client.post(f'/api/games/{game_id}/sync', json=body)
+    assert retry.status_code == 200
+    assert retry.get_json()['accepted'] == []
+    assert retry.get_json()['conflicts'] == [1, 2]
+    assert retry.get_json()['last_move_number'] == 2
+    assert stored_moves(game_id) == [1, 2]
+
+
+def test_sync_returns_moves_the_client_is_missing(client):
+    game_id = str(uuid.uuid4())
+    client.post(f'/api/games/{game_id}/sync', json={'moves': [move(1), move(2)], 'game': SETTINGS})
+
+    result = client.post(f'/api/games/{game_id}/sync', json={'since': 1, 'moves': [move(2, 9), move(3)]}).get_json()
+
+    assert result['accepted'] == [3]
+    assert result['conflicts'] == [2]
+    assert [m['move_number'] for m in result['moves']] == [2]
+    assert result['moves'][0]['time_taken'] == 4
+    assert stored_moves(game_id) == [1, 2, 3]
+
+
+def test_offline_game_is_not_timed_by_the_server(client):
+    game_id = str(uuid.uuid4())
+    client.post(f'/api/games/{game_id}/sync', json={'moves': [move(1)], 'game': SETTINGS})
+
+    assert db.session.get(Game, game_id).flag_fall is False
+
+
+def test_sync_into_a_finished_game_is_refused(client, game_id):
+    client.post(f'/api/games/{game_id}/complete', json={'winner': 'black'})
+
+    response = client.post(f'/api/games/{game_id}/sync', json={'moves': [move(1)]})
+    assert response.status_code == 409
+    assert stored_moves(game_id) == []
+
+
+def test_sync_into_another_users_game_is_refused(app, client, game_id):
+    other = login(app.test_client(), make_user())
+
+    response = other.post(f'/api/games/{game_id}/sync', json={'moves': [move(1)], 'game': SETTINGS})
+    assert response.status_code == 404
+    assert stored_moves(game_id) == []